@@ -0,0 +1,242 @@
+"""
+准入控制
+文件转录和实时会话各有一个并发上限（全局 + 每个客户端），超出上限的请求进入有界等待队列（FIFO），
+等待超时或队列已满时立即返回 503（全局饱和）/ 429（该客户端超出自己的并发上限），并带 Retry-After。
+过载时排队长度有上限、超出的请求快速失败，已接纳请求的延迟不随负载一起变差。
+多 worker 时全局上限和队列长度按 worker 数平分到各进程；每客户端上限按进程计（长连接固定落在同一个 worker）
+"""
+
+import asyncio
+import math
+import os
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import Deque, Dict, Optional
+
+from fastapi import HTTPException
+from fastapi.responses import JSONResponse
+from loguru import logger
+
+import metrics
+import shared_state
+from keypool import mask_key
+
+# 文件转录（/transcribe、/jobs、/transcribe/batch 的每个文件）：全局 / 每客户端并发上限，等待队列长度，排队超时（秒）
+TRANSCRIBE_MAX_ACTIVE = int(os.getenv("SONIOX_TRANSCRIBE_MAX_ACTIVE", "32"))
+TRANSCRIBE_MAX_PER_CLIENT = int(os.getenv("SONIOX_TRANSCRIBE_MAX_PER_CLIENT", "8"))
+TRANSCRIBE_MAX_QUEUE = int(os.getenv("SONIOX_TRANSCRIBE_MAX_QUEUE", "64"))
+TRANSCRIBE_QUEUE_TIMEOUT = float(os.getenv("SONIOX_TRANSCRIBE_QUEUE_TIMEOUT", "30"))
+# 实时会话（/ws/transcribe）
+SESSION_MAX_ACTIVE = int(os.getenv("SONIOX_SESSION_MAX_ACTIVE", "200"))
+SESSION_MAX_PER_CLIENT = int(os.getenv("SONIOX_SESSION_MAX_PER_CLIENT", "20"))
+SESSION_MAX_QUEUE = int(os.getenv("SONIOX_SESSION_MAX_QUEUE", "50"))
+SESSION_QUEUE_TIMEOUT = float(os.getenv("SONIOX_SESSION_QUEUE_TIMEOUT", "10"))
+
+
+def _per_worker(limit: int) -> int:
+    return max(1, math.ceil(limit / shared_state.WORKERS))
+
+
+# Retry-After 估计值的上下限（秒）
+_RETRY_AFTER_MIN = 1
+_RETRY_AFTER_MAX = 60
+
+
+class _Waiter:
+    def __init__(self, client: str, bounded: bool):
+        self.client = client
+        self.bounded = bounded
+        self.future: asyncio.Future = asyncio.get_running_loop().create_future()
+        self.enqueued = time.monotonic()
+
+
+class AdmissionController:
+    """
+    全局 + 每客户端并发上限，加 FIFO 等待队列
+
+    client 为客户端标识（请求携带的 API Key）。队首等待者所属客户端已到上限时，
+    跳过它唤醒后面的等待者，一个客户端占满自己的配额不会挡住其它客户端
+    """
+
+    def __init__(self, kind: str, max_active: int, max_per_client: int, max_queue: int, queue_timeout: float):
+        self.kind = kind
+        self.max_active = max_active
+        self.max_per_client = max_per_client
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.active = 0
+        self.rejected = 0
+        self._per_client: Dict[str, int] = {}
+        self._waiters: Deque[_Waiter] = deque()
+        self._bounded_waiting = 0
+        # 单次占用时长的指数滑动平均，用于估算 Retry-After
+        self._hold_ewma = 5.0
+
+    @property
+    def waiting(self) -> int:
+        return len(self._waiters)
+
+    def _has_room(self, client: str) -> bool:
+        return self.active < self.max_active and self._per_client.get(client, 0) < self.max_per_client
+
+    def _take(self, client: str):
+        self.active += 1
+        self._per_client[client] = self._per_client.get(client, 0) + 1
+        metrics.ADMISSION_ACTIVE.set(self.active, kind=self.kind)
+
+    def retry_after(self) -> int:
+        """按平均占用时长和排队长度估算多久后可能有空位"""
+        estimate = self._hold_ewma * (self.waiting + 1) / max(1, self.max_active)
+        return max(_RETRY_AFTER_MIN, min(_RETRY_AFTER_MAX, math.ceil(estimate)))
+
+    def _reject(self, status_code: int, reason: str, detail: str):
+        self.rejected += 1
+        metrics.ADMISSION_REJECTED.inc(kind=self.kind, reason=reason)
+        retry_after = self.retry_after()
+        logger.warning(f"准入拒绝 ({self.kind}/{reason}) | 进行中 {self.active} | 排队 {self.waiting} | Retry-After {retry_after}s")
+        raise HTTPException(status_code=status_code, detail=detail, headers={"Retry-After": str(retry_after)})
+
+    def check(self, client: Optional[str] = None):
+        """
+        不排队的准入预检：新请求按当前状态会被立即拒绝时抛出 429 / 503
+
+        client 为 None 时只看全局名额和队列（读取请求体之前还不知道客户端）
+        """
+        if self._has_room(client) if client is not None else self.active < self.max_active:
+            return
+        if client is not None and self._per_client.get(client, 0) >= self.max_per_client and self.active < self.max_active:
+            # 全局还有空位，是该客户端自己的并发已满
+            self._reject(429, "client_limit", f"该 API Key 的并发请求已达上限 ({self.max_per_client})，请稍后重试")
+        if self._bounded_waiting >= self.max_queue:
+            self._reject(503, "queue_full", "服务繁忙，排队已满，请稍后重试")
+
+    async def acquire(self, client: str, bounded: bool = True) -> float:
+        """
+        占用一个名额，返回获得名额的时间（传给 release）
+
+        bounded=False 用于已被其它队列限流的后台任务（异步任务、批量中的文件）：不受队列长度和超时限制，
+        一直等到有空位；bounded=True 时队列满或等待超时抛出 429 / 503
+        """
+        # 每次释放后都会唤醒所有能运行的等待者，所以队列里的等待者都没有空位，有空位的新请求可以直接进入
+        if self._has_room(client):
+            self._take(client)
+            metrics.ADMISSION_WAIT_SECONDS.observe(0, kind=self.kind)
+            return time.monotonic()
+
+        if bounded:
+            self.check(client)
+
+        waiter = _Waiter(client, bounded)
+        self._waiters.append(waiter)
+        self._bounded_waiting += bounded
+        metrics.ADMISSION_QUEUE.set(self.waiting, kind=self.kind)
+        try:
+            if bounded:
+                await asyncio.wait_for(asyncio.shield(waiter.future), timeout=self.queue_timeout)
+            else:
+                await waiter.future
+        except asyncio.TimeoutError:
+            self._abandon(waiter)
+            self._reject(503, "timeout", f"服务繁忙，排队超过 {self.queue_timeout:.0f} 秒，请稍后重试")
+        except asyncio.CancelledError:
+            self._abandon(waiter)
+            raise
+        finally:
+            metrics.ADMISSION_WAIT_SECONDS.observe(time.monotonic() - waiter.enqueued, kind=self.kind)
+        return time.monotonic()
+
+    def _abandon(self, waiter: _Waiter):
+        """等待者放弃（超时 / 取消）：已分到名额的交还，否则移出队列"""
+        if waiter.future.done() and not waiter.future.cancelled():
+            self.release(waiter.client, None)
+            return
+        waiter.future.cancel()
+        self._dequeue(waiter)
+
+    def _dequeue(self, waiter: _Waiter):
+        try:
+            self._waiters.remove(waiter)
+        except ValueError:
+            return
+        self._bounded_waiting -= waiter.bounded
+        metrics.ADMISSION_QUEUE.set(self.waiting, kind=self.kind)
+
+    def release(self, client: str, acquired_at: Optional[float]):
+        self.active -= 1
+        remaining = self._per_client.get(client, 1) - 1
+        if remaining:
+            self._per_client[client] = remaining
+        else:
+            self._per_client.pop(client, None)
+        if acquired_at is not None:
+            self._hold_ewma = 0.9 * self._hold_ewma + 0.1 * (time.monotonic() - acquired_at)
+        metrics.ADMISSION_ACTIVE.set(self.active, kind=self.kind)
+        self._wake()
+
+    def _wake(self):
+        """按 FIFO 把空出的名额交给能运行的等待者"""
+        for waiter in list(self._waiters):
+            if self.active >= self.max_active:
+                break
+            if self._has_room(waiter.client):
+                self._dequeue(waiter)
+                self._take(waiter.client)
+                waiter.future.set_result(None)
+
+    @asynccontextmanager
+    async def slot(self, client: str, bounded: bool = True):
+        acquired_at = await self.acquire(client, bounded)
+        try:
+            yield
+        finally:
+            self.release(client, acquired_at)
+
+    def stats(self) -> dict:
+        return {
+            "active": self.active,
+            "waiting": self.waiting,
+            "rejected": self.rejected,
+            "max_active": self.max_active,
+            "max_per_client": self.max_per_client,
+            "max_queue": self.max_queue,
+            "queue_timeout": self.queue_timeout,
+            "clients": {mask_key(client): count for client, count in self._per_client.items()},
+        }
+
+
+class AdmissionGate:
+    """
+    ASGI 中间件：上传接口在读取请求体之前先做全局预检（AdmissionController.check），
+    饱和时直接返回 503 + Retry-After，不接收、不落盘、不计算哈希；未饱和的请求照常进入，解析表单后再按客户端占用名额
+    """
+
+    def __init__(self, app, controller: AdmissionController, paths):
+        self.app = app
+        self.controller = controller
+        self.paths = frozenset(paths)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "http" and scope["method"] == "POST" and scope["path"] in self.paths:
+            try:
+                self.controller.check()
+            except HTTPException as e:
+                response = JSONResponse({"detail": e.detail}, status_code=e.status_code, headers=e.headers)
+                await response(scope, receive, send)
+                return
+        await self.app(scope, receive, send)
+
+
+def client_id(keys) -> str:
+    """客户端标识：请求携带的 API Key（多个时按排序拼接）"""
+    return ",".join(sorted(set(keys)))
+
+
+transcribe = AdmissionController(
+    "transcribe", _per_worker(TRANSCRIBE_MAX_ACTIVE), TRANSCRIBE_MAX_PER_CLIENT,
+    _per_worker(TRANSCRIBE_MAX_QUEUE), TRANSCRIBE_QUEUE_TIMEOUT
+)
+sessions = AdmissionController(
+    "session", _per_worker(SESSION_MAX_ACTIVE), SESSION_MAX_PER_CLIENT,
+    _per_worker(SESSION_MAX_QUEUE), SESSION_QUEUE_TIMEOUT
+)
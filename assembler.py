@@ -0,0 +1,115 @@
+"""
+实时转录服务端拼接
+按 Soniox 实时响应维护转录：最终 token 只追加（文本、时间戳、说话人分列存储），
+非最终尾部每条消息整体替换；向客户端只发送增量（新增最终文本 + 当前非最终文本），
+会话结束时发送与文件转录相同结构的完整转录（text + words），可选附带字幕/文本导出
+"""
+
+from array import array
+from typing import Dict, List, Optional
+
+import transcript
+
+# 端点检测标记，不计入文本
+_CONTROL_TOKENS = {"<end>", "<fin>"}
+
+
+class TranscriptAssembler:
+    def __init__(self, enable_diarization: bool = False, export_format: Optional[str] = None):
+        self.enable_diarization = enable_diarization
+        self.export_format = export_format
+        self._texts: List[str] = []
+        self._starts = array("q")
+        self._ends = array("q")
+        self._speakers: List[Optional[str]] = []
+        self._translation: List[str] = []
+        self._speaker: Optional[str] = None
+        self.partial = ""
+        self.partial_translation = ""
+
+    def __len__(self) -> int:
+        return len(self._texts)
+
+    def feed(self, response: dict) -> Optional[dict]:
+        """合并一条 Soniox 响应，返回要发给客户端的增量；没有变化时返回 None"""
+        final: List[str] = []
+        final_translation: List[str] = []
+        partial: List[str] = []
+        partial_translation: List[str] = []
+        for token in response.get("tokens") or ():
+            text = token.get("text", "")
+            if text.strip() in _CONTROL_TOKENS:
+                continue
+            translated = token.get("translation_status") == "translation"
+            if not token.get("is_final"):
+                (partial_translation if translated else partial).append(text)
+            elif translated:
+                final_translation.append(text)
+            else:
+                final.append(self._append(token, text))
+
+        delta: Dict[str, object] = {}
+        if final:
+            delta["final"] = "".join(final)
+        if final_translation:
+            self._translation.extend(final_translation)
+            delta["final_translation"] = "".join(final_translation)
+        partial_text = "".join(partial)
+        if final or partial_text != self.partial:
+            self.partial = partial_text
+            delta["partial"] = partial_text
+        partial_translation_text = "".join(partial_translation)
+        if final_translation or partial_translation_text != self.partial_translation:
+            self.partial_translation = partial_translation_text
+            delta["partial_translation"] = partial_translation_text
+        if not delta:
+            return None
+        for key in ("final_audio_proc_ms", "total_audio_proc_ms"):
+            if key in response:
+                delta[key] = response[key]
+        return delta
+
+    def _append(self, token: dict, text: str) -> str:
+        """追加一个最终 token，返回其在拼接文本中的形式（说话人变化时带前缀）"""
+        speaker = token.get("speaker")
+        self._texts.append(text)
+        self._starts.append(int(token.get("start_ms", -1)))
+        self._ends.append(int(token.get("end_ms", -1)))
+        self._speakers.append(speaker)
+        if self.enable_diarization and speaker is not None and speaker != self._speaker:
+            self._speaker = speaker
+            return f"\n\n说话人 {speaker}: {text}"
+        return text
+
+    def text(self) -> str:
+        """与文件转录相同格式的完整文本（可选说话人标记）"""
+        return transcript.build(self.tokens(), self.enable_diarization)[0]
+
+    def translation(self) -> str:
+        return "".join(self._translation).strip()
+
+    def tokens(self) -> List[dict]:
+        """最终 token 列表（与 Soniox transcript 接口的 token 字段一致），用于导出"""
+        result = []
+        for i, text in enumerate(self._texts):
+            token = {"text": text}
+            if self._starts[i] >= 0:
+                token["start_ms"] = self._starts[i]
+                token["end_ms"] = self._ends[i]
+            if self._speakers[i] is not None:
+                token["speaker"] = self._speakers[i]
+            result.append(token)
+        return result
+
+    def summary(self) -> dict:
+        """
+        会话结束时发给客户端的完整转录：text / words 与文件转录的 TranscribeResponse 相同，
+        设置了 export_format 时 export 为该格式的导出内容（见 transcript.export）
+        """
+        text, words = transcript.build(self.tokens(), self.enable_diarization)
+        data = {"finished": True, "text": text, "words": words}
+        if self._translation:
+            data["translation"] = self.translation()
+        if self.export_format:
+            data["export"] = "".join(transcript.export(text, words, self.export_format))
+        return data
@@ -0,0 +1,157 @@
+"""
+上传前音频处理
+按文件头识别真实容器格式（决定上传的 MIME 类型）；PCM WAV 下混为单声道、降采样到 16 kHz、16 位，
+上传字节数通常减少到原来的 1/3 ~ 1/6（浏览器 audioBufferToWav 生成的 48 kHz 立体声约 1/6）。
+逐块处理，内存占用与文件时长无关
+"""
+
+import os
+import tempfile
+import wave
+from typing import BinaryIO, NamedTuple, Optional
+
+import numpy as np
+
+from audio_split import pcm_to_mono, read_wav_info
+
+
+def _env_bool(name: str, default: bool) -> bool:
+    value = os.getenv(name)
+    if value is None:
+        return default
+    return value.strip().lower() not in ("0", "false", "no", "off", "")
+
+
+# /transcribe、/jobs 的 normalize_audio 参数默认值；归一化会改变上传给 Soniox 的音频，默认关闭，需显式开启
+NORMALIZE_AUDIO = _env_bool("SONIOX_NORMALIZE_AUDIO", False)
+# 目标采样率；原始采样率不高于该值时不重采样（不做升采样）
+NORMALIZE_SAMPLE_RATE = int(os.getenv("SONIOX_NORMALIZE_SAMPLE_RATE", "16000"))
+# 抗混叠低通滤波器阶数
+_FILTER_TAPS = 64
+# 每次读取的帧数
+_BLOCK_FRAMES = 65536
+
+SNIFF_BYTES = 16
+
+
+class AudioFormat(NamedTuple):
+    name: str
+    mime_type: str
+
+
+UNKNOWN_FORMAT = AudioFormat("unknown", "application/octet-stream")
+
+
+def sniff_format(header: bytes) -> AudioFormat:
+    """按文件头魔数识别容器格式（header 至少 12 字节）"""
+    if header[:4] == b"RIFF" and header[8:12] == b"WAVE":
+        return AudioFormat("wav", "audio/wav")
+    if header[:4] == b"fLaC":
+        return AudioFormat("flac", "audio/flac")
+    if header[:4] == b"OggS":
+        return AudioFormat("ogg", "audio/ogg")
+    if header[:4] == b"\x1a\x45\xdf\xa3":
+        return AudioFormat("webm", "audio/webm")
+    if header[4:8] == b"ftyp":
+        brand = header[8:12]
+        if brand == b"qt  ":
+            return AudioFormat("mov", "video/quicktime")
+        if brand in (b"M4A ", b"M4B ", b"M4P "):
+            return AudioFormat("m4a", "audio/mp4")
+        return AudioFormat("mp4", "video/mp4")
+    if header[:4] == b"FORM" and header[8:12] in (b"AIFF", b"AIFC"):
+        return AudioFormat("aiff", "audio/aiff")
+    if header[:5] == b"#!AMR":
+        return AudioFormat("amr", "audio/amr")
+    if header[:4] == b"\x30\x26\xb2\x75":
+        return AudioFormat("asf", "audio/x-ms-asf")
+    if header[:3] == b"ID3":
+        return AudioFormat("mp3", "audio/mpeg")
+    if len(header) >= 2 and header[0] == 0xFF and header[1] & 0xE0 == 0xE0:
+        # 帧同步字：layer 位为 00 的是 AAC ADTS，其余按 MPEG 音频
+        if header[1] & 0x06 == 0:
+            return AudioFormat("aac", "audio/aac")
+        return AudioFormat("mp3", "audio/mpeg")
+    return UNKNOWN_FORMAT
+
+
+class _Resampler:
+    """流式降采样：窗函数 sinc 低通抗混叠后线性插值；分块处理时保留滤波历史和插值位置"""
+
+    def __init__(self, src_rate: int, dst_rate: int, taps: int = _FILTER_TAPS):
+        self.step = src_rate / dst_rate
+        cutoff = 0.5 / self.step * 0.95
+        n = np.arange(taps) - (taps - 1) / 2
+        kernel = 2 * cutoff * np.sinc(2 * cutoff * n) * np.hamming(taps)
+        self._kernel = (kernel / kernel.sum()).astype(np.float32)
+        self._history = np.zeros(taps - 1, dtype=np.float32)
+        self._prev: Optional[np.ndarray] = None
+        # 当前块第一个滤波样本在整条音频中的位置，以及下一个输出样本的位置（均以输入样本为单位）
+        self._base = 0
+        self._next = 0.0
+
+    def process(self, samples: np.ndarray) -> np.ndarray:
+        padded = np.concatenate([self._history, samples])
+        filtered = np.convolve(padded, self._kernel, mode="valid")
+        self._history = padded[len(padded) - len(self._history):]
+
+        start = self._base
+        if self._prev is not None:
+            filtered = np.concatenate([self._prev, filtered])
+            start -= 1
+        self._base += len(samples)
+        if len(filtered) < 2:
+            self._prev = filtered[-1:] if len(filtered) else self._prev
+            return np.zeros(0, dtype=np.float32)
+
+        # 只输出落在 [start, last) 内的位置，最后一个样本留给下一块做插值左端
+        last = start + len(filtered) - 1
+        count = max(0, int(np.ceil((last - self._next) / self.step)))
+        positions = self._next + self.step * np.arange(count) - start
+        index = positions.astype(np.int64)
+        frac = (positions - index).astype(np.float32)
+        out = filtered[index] * (1 - frac) + filtered[index + 1] * frac
+        self._next += self.step * count
+        self._prev = filtered[-1:]
+        return out
+
+
+def _to_int16(samples: np.ndarray) -> bytes:
+    return np.clip(np.round(samples * 32768.0), -32768, 32767).astype("<i2").tobytes()
+
+
+def normalize_wav(fileobj: BinaryIO, target_rate: int = NORMALIZE_SAMPLE_RATE, directory: Optional[str] = None) -> Optional[str]:
+    """
+    PCM WAV 转为单声道、16 位、不高于 target_rate 的 WAV 临时文件，返回路径（由调用方删除）；
+    不是 PCM WAV 或已经满足条件时返回 None
+    """
+    info = read_wav_info(fileobj)
+    if info is None:
+        return None
+    out_rate = min(info.sample_rate, target_rate)
+    if info.channels == 1 and info.sample_width <= 2 and out_rate == info.sample_rate:
+        return None
+
+    resampler = _Resampler(info.sample_rate, out_rate) if out_rate != info.sample_rate else None
+    fd, path = tempfile.mkstemp(prefix="soniox-norm-", suffix=".wav", dir=directory)
+    os.close(fd)
+    try:
+        with wave.open(fileobj, "rb") as src, wave.open(path, "wb") as dst:
+            dst.setnchannels(1)
+            dst.setsampwidth(2)
+            dst.setframerate(out_rate)
+            while True:
+                raw = src.readframes(_BLOCK_FRAMES)
+                if not raw:
+                    break
+                samples = pcm_to_mono(raw, info.sample_width, info.channels)
+                if resampler is not None:
+                    samples = resampler.process(samples)
+                dst.writeframesraw(_to_int16(samples))
+    except Exception:
+        os.unlink(path)
+        raise
+    finally:
+        fileobj.seek(0)
+    return path
+
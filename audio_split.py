@@ -0,0 +1,155 @@
+"""
+服务端音频分段
+按目标时长把 PCM WAV 切成若干段，切点在目标位置附近的最安静处（静音边界）；
+只读取切点附近的窗口，分段直接从源文件逐块复制，内存占用与文件时长无关
+"""
+
+import os
+import tempfile
+import wave
+from typing import BinaryIO, List, NamedTuple, Optional
+
+import numpy as np
+
+# 在目标切点前后多少秒内寻找静音
+SPLIT_SEARCH_WINDOW = float(os.getenv("SONIOX_SPLIT_SEARCH_WINDOW", "5"))
+# 计算能量的帧长（毫秒）
+SPLIT_FRAME_MS = 20
+# 复制分段时每次读取的帧数
+_COPY_FRAMES = 65536
+
+
+class WavInfo(NamedTuple):
+    channels: int
+    sample_width: int
+    sample_rate: int
+    n_frames: int
+
+    @property
+    def duration(self) -> float:
+        return self.n_frames / self.sample_rate
+
+
+class Segment(NamedTuple):
+    index: int
+    start_frame: int
+    end_frame: int
+    sample_rate: int
+
+    @property
+    def start_ms(self) -> int:
+        return int(self.start_frame * 1000 / self.sample_rate)
+
+    @property
+    def duration(self) -> float:
+        return (self.end_frame - self.start_frame) / self.sample_rate
+
+
+def is_wav(fileobj: BinaryIO) -> bool:
+    fileobj.seek(0)
+    header = fileobj.read(12)
+    fileobj.seek(0)
+    return len(header) == 12 and header[:4] == b"RIFF" and header[8:12] == b"WAVE"
+
+
+def read_wav_info(fileobj: BinaryIO) -> Optional[WavInfo]:
+    """读取 PCM WAV 参数；不是 wave 模块能解析的 PCM WAV 时返回 None"""
+    if not is_wav(fileobj):
+        return None
+    try:
+        with wave.open(fileobj, "rb") as wav:
+            return WavInfo(wav.getnchannels(), wav.getsampwidth(), wav.getframerate(), wav.getnframes())
+    except (wave.Error, EOFError):
+        return None
+    finally:
+        fileobj.seek(0)
+
+
+def pcm_to_mono(raw: bytes, sample_width: int, channels: int) -> np.ndarray:
+    """PCM 字节转为 [-1, 1] 的单声道 float32 数组"""
+    if sample_width == 1:
+        samples = (np.frombuffer(raw, dtype=np.uint8).astype(np.float32) - 128.0) / 128.0
+    elif sample_width == 2:
+        samples = np.frombuffer(raw, dtype="<i2").astype(np.float32) / 32768.0
+    elif sample_width == 3:
+        b = np.frombuffer(raw, dtype=np.uint8).reshape(-1, 3).astype(np.int32)
+        ints = b[:, 0] | (b[:, 1] << 8) | (b[:, 2] << 16)
+        ints = np.where(ints & 0x800000, ints - 0x1000000, ints)
+        samples = ints.astype(np.float32) / 8388608.0
+    elif sample_width == 4:
+        samples = np.frombuffer(raw, dtype="<i4").astype(np.float32) / 2147483648.0
+    else:
+        raise ValueError(f"不支持的采样位宽: {sample_width}")
+    if channels > 1:
+        samples = samples[: len(samples) - len(samples) % channels].reshape(-1, channels).mean(axis=1)
+    return samples
+
+
+def _quietest_frame(wav: wave.Wave_read, info: WavInfo, target: int, window: int) -> int:
+    """在 [target - window, target + window] 内找能量最低的短帧，返回其中心位置（帧号）"""
+    start = max(0, target - window)
+    end = min(info.n_frames, target + window)
+    wav.setpos(start)
+    samples = pcm_to_mono(wav.readframes(end - start), info.sample_width, info.channels)
+
+    hop = max(1, info.sample_rate * SPLIT_FRAME_MS // 1000)
+    n = len(samples) // hop
+    if n == 0:
+        return target
+    energy = np.square(samples[: n * hop].reshape(n, hop)).mean(axis=1)
+    return start + int(np.argmin(energy)) * hop + hop // 2
+
+
+def plan_segments(fileobj: BinaryIO, segment_seconds: float) -> Optional[List[Segment]]:
+    """
+    规划分段；不是 PCM WAV 或时长不足两段时返回 None（调用方按整文件处理）
+    """
+    info = read_wav_info(fileobj)
+    if info is None or segment_seconds <= 0 or info.duration <= segment_seconds * 1.5:
+        return None
+
+    window = int(min(SPLIT_SEARCH_WINDOW, segment_seconds / 4) * info.sample_rate)
+    step = int(segment_seconds * info.sample_rate)
+    cuts = [0]
+    try:
+        with wave.open(fileobj, "rb") as wav:
+            target = step
+            while info.n_frames - target > step // 2:
+                cut = _quietest_frame(wav, info, target, window)
+                if cut > cuts[-1]:
+                    cuts.append(cut)
+                target = cut + step
+    finally:
+        fileobj.seek(0)
+    cuts.append(info.n_frames)
+
+    return [Segment(i, cuts[i], cuts[i + 1], info.sample_rate) for i in range(len(cuts) - 1)]
+
+
+def write_segments(fileobj: BinaryIO, segments: List[Segment], directory: Optional[str] = None) -> List[str]:
+    """把各分段写成独立的 WAV 临时文件，返回路径列表（由调用方删除）"""
+    paths: List[str] = []
+    try:
+        with wave.open(fileobj, "rb") as src:
+            params = src.getparams()
+            for segment in segments:
+                fd, path = tempfile.mkstemp(prefix=f"soniox-seg{segment.index}-", suffix=".wav", dir=directory)
+                os.close(fd)
+                paths.append(path)
+                src.setpos(segment.start_frame)
+                with wave.open(path, "wb") as dst:
+                    dst.setparams(params)
+                    remaining = segment.end_frame - segment.start_frame
+                    while remaining > 0:
+                        frames = src.readframes(min(_COPY_FRAMES, remaining))
+                        if not frames:
+                            break
+                        dst.writeframesraw(frames)
+                        remaining -= len(frames) // (params.sampwidth * params.nchannels)
+    except Exception:
+        for path in paths:
+            os.unlink(path)
+        raise
+    finally:
+        fileobj.seek(0)
+    return paths
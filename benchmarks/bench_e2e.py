@@ -0,0 +1,300 @@
+"""
+端到端发布验收基准：桩服务和后端都以子进程运行（后端的 REST 和 WebSocket 上游都指向桩服务），依次压测
+- transcribe：并发 POST /transcribe（不走结果缓存）
+- proxy：并发调用 /api/models、/api/files、/api/files/{id}、/api/files/{id}/url、/api/transcriptions/{id}
+- ws：大量并发 /ws/transcribe 会话，每个会话推送固定数量的音频块
+每个场景输出 req/s（ws 为会话/s）、p50/p99 延迟、失败数和后端 RSS 峰值（含全部 worker 进程，仅 Linux）。
+
+--json 保存结果；--baseline 与之前保存的结果比较，吞吐下降或 p99 上升超过 --tolerance 时以退出码 1 结束，
+可用于发布前对比上一个版本
+
+用法: python benchmarks/bench_e2e.py [--workers 1] [--concurrency 32] [--duration 10] [--sessions 100]
+                                     [--json result.json] [--baseline previous.json]
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Awaitable, Callable, Dict, List, Tuple
+
+import httpx
+import websockets
+
+import stub_upstream
+from bench_upload_memory import wait_ready
+from bench_ws_relay import CHUNK
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+HERE = os.path.dirname(os.path.abspath(__file__))
+API_KEY = "bench"
+
+
+def process_tree_rss_mb(pid: int) -> float:
+    """进程及其子进程（多 worker）的 RSS 之和"""
+    total = 0.0
+    pending = [pid]
+    while pending:
+        current = pending.pop()
+        try:
+            with open(f"/proc/{current}/status") as f:
+                for line in f:
+                    if line.startswith("VmRSS:"):
+                        total += int(line.split()[1]) / 1024
+            with open(f"/proc/{current}/task/{current}/children") as f:
+                pending.extend(int(child) for child in f.read().split())
+        except OSError:
+            continue
+    return total
+
+
+class RssSampler:
+    """场景运行期间每 0.2 秒采样一次后端 RSS，记录峰值"""
+
+    def __init__(self, pid: int):
+        self.pid = pid
+        self.peak = 0.0
+        self._task = None
+
+    async def _run(self):
+        while True:
+            self.peak = max(self.peak, process_tree_rss_mb(self.pid))
+            await asyncio.sleep(0.2)
+
+    def __enter__(self):
+        self.peak = process_tree_rss_mb(self.pid)
+        self._task = asyncio.get_running_loop().create_task(self._run())
+        return self
+
+    def __exit__(self, *exc):
+        self._task.cancel()
+
+
+async def drive(request: Callable[[int], Awaitable[bool]], concurrency: int, duration: float) -> List[Tuple[bool, float]]:
+    """concurrency 个并发循环持续调用 request(序号) duration 秒，返回 (是否成功, 延迟) 列表"""
+    results: List[Tuple[bool, float]] = []
+    deadline = time.monotonic() + duration
+    counter = iter(range(1 << 62))
+
+    async def loop():
+        while time.monotonic() < deadline:
+            start = time.perf_counter()
+            try:
+                ok = await request(next(counter))
+            except (httpx.HTTPError, websockets.WebSocketException, OSError, RuntimeError):
+                ok = False
+            results.append((ok, time.perf_counter() - start))
+
+    await asyncio.gather(*(loop() for _ in range(concurrency)))
+    return results
+
+
+def summarize(results: List[Tuple[bool, float]], elapsed: float, rss_peak: float) -> Dict[str, float]:
+    latencies = sorted(latency for ok, latency in results if ok)
+    p99 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))] if latencies else 0.0
+    return {
+        "throughput": round(len(latencies) / elapsed, 1),
+        "p50_ms": round(statistics.median(latencies) * 1000, 1) if latencies else 0.0,
+        "p99_ms": round(p99 * 1000, 1),
+        "ok": len(latencies),
+        "failed": len(results) - len(latencies),
+        "rss_peak_mb": round(rss_peak, 1),
+    }
+
+
+async def scenario_transcribe(base_url: str, args) -> List[Tuple[bool, float]]:
+    payload = os.urandom(args.payload_kb * 1024)
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+    async with httpx.AsyncClient(timeout=120.0, limits=limits) as client:
+        async def request(_: int) -> bool:
+            resp = await client.post(
+                f"{base_url}/transcribe",
+                files={"file": ("bench.wav", payload, "audio/wav")},
+                data={"api_keys": API_KEY, "use_cache": "false"},
+            )
+            return resp.status_code == 200
+
+        return await drive(request, args.concurrency, args.duration)
+
+
+async def scenario_proxy(base_url: str, stub_url: str, args) -> List[Tuple[bool, float]]:
+    # 在桩服务中预置文件和转录（注入的 503 重试）
+    async with httpx.AsyncClient() as stub:
+        async def create(path: str, **kwargs) -> str:
+            while True:
+                resp = await stub.post(f"{stub_url}/v1{path}", **kwargs)
+                if resp.status_code == 201:
+                    return resp.json()["id"]
+
+        file_ids = [await create("/files", content=b"x" * 1024) for _ in range(20)]
+        transcription_ids = [await create("/transcriptions", json={"file_id": file_id}) for file_id in file_ids]
+    paths = [
+        lambda i: "/api/models",
+        lambda i: "/api/files",
+        lambda i: f"/api/files/{file_ids[i % len(file_ids)]}",
+        lambda i: f"/api/files/{file_ids[i % len(file_ids)]}/url",
+        lambda i: f"/api/transcriptions/{transcription_ids[i % len(transcription_ids)]}",
+    ]
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+    async with httpx.AsyncClient(timeout=30.0, limits=limits) as client:
+        async def request(i: int) -> bool:
+            resp = await client.get(f"{base_url}{paths[i % len(paths)](i // len(paths))}", params={"api_key": API_KEY})
+            return resp.status_code == 200
+
+        return await drive(request, args.concurrency, args.duration)
+
+
+async def scenario_ws(ws_url: str, args) -> List[Tuple[bool, float]]:
+    """每个并发槽位连续建立会话；延迟为单个会话从连接到收到 finished 的时间"""
+    async def request(_: int) -> bool:
+        async with websockets.connect(ws_url, max_size=None) as ws:
+            await ws.send(json.dumps({"api_key": API_KEY, "model": "stt-rt-v4", "audio_format": "pcm_s16le"}))
+
+            async def send_audio():
+                for _ in range(args.chunks):
+                    await ws.send(CHUNK)
+                await ws.send(b"")
+
+            sender = asyncio.create_task(send_audio())
+            try:
+                async for message in ws:
+                    data = json.loads(message)
+                    if data.get("error") or data.get("error_code"):
+                        return False
+                    if data.get("finished"):
+                        return True
+            finally:
+                sender.cancel()
+        return False
+
+    return await drive(request, args.sessions, args.duration)
+
+
+def _failure_rate(result: dict) -> float:
+    total = result["ok"] + result["failed"]
+    return result["failed"] / total if total else 0.0
+
+
+def compare(results: Dict[str, dict], baseline: Dict[str, dict], tolerance: float) -> List[str]:
+    """吞吐下降或 p99 上升超过 tolerance、失败率上升超过 1 个百分点的场景"""
+    regressions = []
+    for name, current in results.items():
+        previous = baseline.get(name)
+        if not previous:
+            continue
+        if previous["throughput"] and current["throughput"] < previous["throughput"] * (1 - tolerance):
+            regressions.append(f"{name}: 吞吐 {previous['throughput']} → {current['throughput']}")
+        if previous["p99_ms"] and current["p99_ms"] > previous["p99_ms"] * (1 + tolerance):
+            regressions.append(f"{name}: p99 {previous['p99_ms']} ms → {current['p99_ms']} ms")
+        if _failure_rate(current) > _failure_rate(previous) + 0.01:
+            regressions.append(f"{name}: 失败率 {_failure_rate(previous):.1%} → {_failure_rate(current):.1%}")
+    return regressions
+
+
+async def run(args, backend_pid: int, base_url: str, stub_url: str) -> Dict[str, dict]:
+    await wait_ready(base_url)
+    ws_url = base_url.replace("http://", "ws://") + "/ws/transcribe"
+    scenarios = {
+        "transcribe": lambda: scenario_transcribe(base_url, args),
+        "proxy": lambda: scenario_proxy(base_url, stub_url, args),
+        "ws": lambda: scenario_ws(ws_url, args),
+    }
+    results = {}
+    for name in args.scenarios:
+        with RssSampler(backend_pid) as sampler:
+            started = time.monotonic()
+            samples = await scenarios[name]()
+            elapsed = time.monotonic() - started
+        results[name] = summarize(samples, elapsed, sampler.peak)
+        r = results[name]
+        unit = "会话/s" if name == "ws" else "req/s"
+        print(
+            f"{name:<11} {r['throughput']:8.1f} {unit:<6}  p50 {r['p50_ms']:8.1f} ms  p99 {r['p99_ms']:8.1f} ms  "
+            f"成功 {r['ok']:>6}  失败 {r['failed']:>4}  RSS 峰值 {r['rss_peak_mb']:7.1f} MB"
+        )
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="端到端发布验收基准（本地桩服务，不访问 Soniox）")
+    parser.add_argument("--scenarios", nargs="+", default=["transcribe", "proxy", "ws"], choices=["transcribe", "proxy", "ws"])
+    parser.add_argument("--workers", type=int, default=1, help="后端 worker 进程数")
+    parser.add_argument("--concurrency", type=int, default=32, help="transcribe / proxy 并发数")
+    parser.add_argument("--duration", type=float, default=10.0, help="每个场景的时长（秒）")
+    parser.add_argument("--sessions", type=int, default=100, help="ws 并发会话数")
+    parser.add_argument("--chunks", type=int, default=50, help="每个 ws 会话的音频块数（每块 100ms）")
+    parser.add_argument("--payload-kb", type=int, default=256, help="transcribe 上传的文件大小")
+    parser.add_argument("--processing-delay", type=float, default=0.2, help="桩服务转录处理耗时（秒）")
+    parser.add_argument("--tokens", type=int, default=500, help="桩服务返回的转录 token 数")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="桩服务转录以 error 结束的概率")
+    parser.add_argument("--http-error-rate", type=float, default=0.0, help="桩服务 REST 请求返回 503 的概率")
+    parser.add_argument("--ws-error-rate", type=float, default=0.0, help="桩服务实时会话返回错误的概率")
+    parser.add_argument("--json", help="结果保存路径")
+    parser.add_argument("--baseline", help="与之前保存的结果比较")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="允许的吞吐下降 / p99 上升比例")
+    args = parser.parse_args()
+
+    stub_port = stub_upstream.free_port()
+    stub_url = f"http://127.0.0.1:{stub_port}"
+    stub = subprocess.Popen(
+        [
+            sys.executable, os.path.join(HERE, "stub_upstream.py"), "--port", str(stub_port),
+            "--processing-delay", str(args.processing_delay), "--transcript-tokens", str(args.tokens),
+            "--error-rate", str(args.error_rate), "--http-error-rate", str(args.http_error_rate),
+            "--ws-error-rate", str(args.ws_error_rate),
+        ],
+        cwd=HERE, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    server_port = stub_upstream.free_port()
+    with tempfile.TemporaryDirectory() as data_dir:
+        env = dict(
+            os.environ,
+            SONIOX_API_BASE=f"{stub_url}/v1",
+            SONIOX_WS_URL=f"ws://127.0.0.1:{stub_port}/transcribe-websocket",
+            SONIOX_WORKERS=str(args.workers),
+            SONIOX_STATE_PATH=os.path.join(data_dir, "state.db"),
+            SONIOX_JOURNAL_PATH=os.path.join(data_dir, "journal.db"),
+            SONIOX_POLL_INITIAL="0.05",
+            # 准入上限放开，测的是处理能力而不是限流
+            SONIOX_TRANSCRIBE_MAX_ACTIVE="100000",
+            SONIOX_TRANSCRIBE_MAX_PER_CLIENT="100000",
+            SONIOX_SESSION_MAX_ACTIVE="100000",
+            SONIOX_SESSION_MAX_PER_CLIENT="100000",
+        )
+        backend = subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", "server:app", "--port", str(server_port),
+             "--workers", str(args.workers), "--log-level", "warning"],
+            cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+        )
+        print(
+            f"CPU 核数 {os.cpu_count()} | worker {args.workers} | 并发 {args.concurrency} | ws 会话 {args.sessions} | "
+            f"每场景 {args.duration:.0f}s | 桩服务处理耗时 {args.processing_delay}s"
+        )
+        try:
+            results = asyncio.run(run(args, backend.pid, f"http://127.0.0.1:{server_port}", stub_url))
+        finally:
+            backend.terminate()
+            backend.wait()
+            stub.terminate()
+            stub.wait()
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        for line in regressions:
+            print(f"回退: {line}")
+        if regressions:
+            sys.exit(1)
+        print("与基线相比无回退")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+"""
+全量列表基准：后端以子进程运行，上游为本地桩服务（每页带固定延迟），对比
+客户端经 /api/transcriptions 逐页翻游标、/api/transcriptions/all 流式全量、以及只取汇总三种方式的耗时
+
+用法: python benchmarks/bench_listing.py [转录数] [每页延迟秒]
+"""
+
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import time
+import uuid
+
+import httpx
+
+import stub_upstream
+from bench_upload_memory import peak_rss_mb, wait_ready
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+
+
+def populate(count: int):
+    statuses = ("completed", "completed", "completed", "error")
+    for i in range(count):
+        transcription_id = str(uuid.uuid4())
+        stub_upstream.TRANSCRIPTIONS[transcription_id] = {
+            "id": transcription_id,
+            "status": statuses[i % len(statuses)],
+            "file_id": str(uuid.uuid4()),
+            "model": "stt-async-v4",
+            "created_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime(1700000000 + i * 60)),
+            "audio_duration_ms": 60000 + i,
+            # 桩服务到期会把非 completed 状态改为 completed，error 保持不变
+            "_ready_at": float("inf"),
+        }
+
+
+async def walk_cursors(client: httpx.AsyncClient, base_url: str) -> int:
+    """改动前客户端的做法：经代理逐页请求，自己累计"""
+    total = 0
+    cursor = None
+    while True:
+        params = {"api_key": "bench", "limit": 1000}
+        if cursor:
+            params["cursor"] = cursor
+        page = (await client.get(f"{base_url}/api/transcriptions", params=params)).json()
+        total += sum(t.get("audio_duration_ms") or 0 for t in page["transcriptions"])
+        cursor = page.get("next_page_cursor")
+        if not cursor:
+            return total
+
+
+async def stream_all(client: httpx.AsyncClient, base_url: str, aggregate_only: bool) -> int:
+    params = {"api_key": "bench", "aggregate_only": str(aggregate_only).lower()}
+    async with client.stream("GET", f"{base_url}/api/transcriptions/all", params=params) as resp:
+        async for line in resp.aiter_lines():
+            data = json.loads(line)
+            if data.get("done"):
+                return data["total_audio_duration_ms"]
+    raise RuntimeError("未收到汇总行")
+
+
+async def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 50000
+    stub_upstream.LIST_DELAY = float(sys.argv[2]) if len(sys.argv) > 2 else 0.2
+    populate(count)
+    stub_port = stub_upstream.free_port()
+    server_port = stub_upstream.free_port()
+    stub_upstream.start_in_thread(stub_port)
+
+    env = dict(os.environ, SONIOX_API_BASE=f"http://127.0.0.1:{stub_port}/v1")
+    proc = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "server:app", "--port", str(server_port), "--log-level", "warning"],
+        cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    base_url = f"http://127.0.0.1:{server_port}"
+    print(f"{count} 个转录，每页 1000 条，上游每页延迟 {stub_upstream.LIST_DELAY}s\n")
+    try:
+        await wait_ready(base_url)
+        async with httpx.AsyncClient(timeout=None) as client:
+            for name, run in (
+                ("客户端逐页翻游标", lambda: walk_cursors(client, base_url)),
+                ("/all 流式全量", lambda: stream_all(client, base_url, False)),
+                ("/all 只取汇总", lambda: stream_all(client, base_url, True)),
+            ):
+                start = time.perf_counter()
+                total = await run()
+                print(f"{name:<16} {time.perf_counter() - start:>7.2f}s | 音频总时长 {total / 3600000:.1f} 小时")
+        print(f"\n后端峰值 RSS: {peak_rss_mb(proc.pid):.1f} MB")
+    finally:
+        proc.terminate()
+        proc.wait()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,96 @@
+"""
+实时转录响应检查微基准：对比每条 Soniox 响应做完整 JSON 解析与 ws_relay.inspect_response
+（子串扫描，仅解析候选消息）的单核吞吐（消息/秒）
+
+响应流默认按 Soniox 实时接口格式生成（非最终 token 尾部 + 逐步确认的最终 token，末尾 finished）；
+也可传入录制的响应文件，每行一条原始消息
+
+用法: python benchmarks/bench_response_scan.py [录制文件.jsonl] [--sessions N] [--repeat N]
+"""
+
+import argparse
+import json
+import os
+import random
+import sys
+import time
+from typing import Callable, List
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import ws_relay  # noqa: E402
+
+WORDS = "the quick brown fox jumps over the lazy dog while soniox streams tokens to the relay".split()
+
+
+def generate_stream(seed: int, messages: int = 2000) -> List[str]:
+    """模拟一个会话的响应流：每条消息带新确认的最终 token 和当前非最终尾部"""
+    rng = random.Random(seed)
+    stream = []
+    ms = 0
+    for _ in range(messages):
+        final = []
+        for _ in range(rng.randint(0, 3)):
+            final.append({"text": " " + rng.choice(WORDS), "start_ms": ms, "end_ms": ms + 240, "confidence": 0.97, "is_final": True, "speaker": "1", "language": "en"})
+            ms += 300
+        partial = [
+            {"text": " " + rng.choice(WORDS), "start_ms": ms + i * 300, "end_ms": ms + i * 300 + 240, "confidence": 0.6, "is_final": False, "speaker": "1", "language": "en"}
+            for i in range(rng.randint(1, 8))
+        ]
+        stream.append(json.dumps({"tokens": final + partial, "final_audio_proc_ms": ms, "total_audio_proc_ms": ms + 600}))
+    stream.append(json.dumps({"tokens": [], "final_audio_proc_ms": ms, "total_audio_proc_ms": ms, "finished": True}))
+    return stream
+
+
+def full_parse(loads: Callable) -> Callable[[str], bool]:
+    """改动前的做法：每条消息完整解析后读取 error_code / finished"""
+    def check(message: str) -> bool:
+        response = loads(message)
+        response.get("error_code")
+        return bool(response.get("finished"))
+    return check
+
+
+def fast_path(message: str) -> bool:
+    return ws_relay.inspect_response(message)[0]
+
+
+def measure(name: str, check: Callable[[str], bool], messages: List[str], repeat: int):
+    finished = 0
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for message in messages:
+            finished += check(message)
+    elapsed = time.perf_counter() - start
+    rate = len(messages) * repeat / elapsed
+    print(f"{name:<28} {rate:>12,.0f} 消息/秒 | 检测到 finished {finished // repeat} 次")
+    return rate
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("recording", nargs="?", help="录制的响应流，每行一条消息")
+    parser.add_argument("--sessions", type=int, default=20)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    if args.recording:
+        with open(args.recording, encoding="utf-8") as f:
+            messages = [line.rstrip("\n") for line in f if line.strip()]
+    else:
+        messages = [m for seed in range(args.sessions) for m in generate_stream(seed)]
+    avg = sum(len(m) for m in messages) / len(messages)
+    print(f"{len(messages)} 条消息，平均 {avg:.0f} 字节\n")
+
+    baseline = measure("json.loads 每条解析", full_parse(json.loads), messages, args.repeat)
+    try:
+        import orjson
+        measure("orjson.loads 每条解析", full_parse(orjson.loads), messages, args.repeat)
+    except ImportError:
+        print("orjson 未安装，跳过")
+    fast = measure("inspect_response 快速路径", fast_path, messages, args.repeat)
+    print(f"\n快速路径 / json.loads: {fast / baseline:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+"""
+/transcribe 上传内存基准：后端以子进程运行，上游为本地桩服务，
+依次上传不同大小的文件并读取后端进程峰值 RSS（/proc/<pid>/status 的 VmHWM，仅 Linux）
+
+用法: python benchmarks/bench_upload_memory.py [文件大小MB ...]
+"""
+
+import asyncio
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+import httpx
+
+import stub_upstream
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+
+
+def peak_rss_mb(pid: int) -> float:
+    with open(f"/proc/{pid}/status") as f:
+        for line in f:
+            if line.startswith("VmHWM:"):
+                return int(line.split()[1]) / 1024
+    return 0.0
+
+
+def make_file(size_mb: int) -> str:
+    fd, path = tempfile.mkstemp(suffix=".wav")
+    block = os.urandom(1024 * 1024)
+    with os.fdopen(fd, "wb") as f:
+        for _ in range(size_mb):
+            f.write(block)
+    return path
+
+
+async def wait_ready(base_url: str):
+    async with httpx.AsyncClient() as client:
+        for _ in range(100):
+            try:
+                if (await client.get(f"{base_url}/health")).status_code == 200:
+                    return
+            except httpx.TransportError:
+                pass
+            await asyncio.sleep(0.1)
+    raise RuntimeError("后端启动超时")
+
+
+async def main():
+    sizes = [int(x) for x in sys.argv[1:]] or [16, 64, 256]
+    stub_port = stub_upstream.free_port()
+    server_port = stub_upstream.free_port()
+    stub = stub_upstream.start_in_thread(stub_port)
+
+    env = dict(os.environ, SONIOX_API_BASE=f"http://127.0.0.1:{stub_port}/v1")
+    proc = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "server:app", "--port", str(server_port), "--log-level", "warning"],
+        cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    base_url = f"http://127.0.0.1:{server_port}"
+    try:
+        await wait_ready(base_url)
+        print(f"启动后峰值 RSS: {peak_rss_mb(proc.pid):.1f} MB")
+        async with httpx.AsyncClient(timeout=600.0) as client:
+            for size_mb in sorted(sizes):
+                path = make_file(size_mb)
+                try:
+                    start = time.perf_counter()
+                    with open(path, "rb") as f:
+                        resp = await client.post(
+                            f"{base_url}/transcribe",
+                            files={"file": ("bench.wav", f, "audio/wav")},
+                            data={"api_keys": "bench"},
+                        )
+                    resp.raise_for_status()
+                    elapsed = time.perf_counter() - start
+                finally:
+                    os.unlink(path)
+                print(
+                    f"{size_mb:>5} MB 上传  耗时 {elapsed:6.2f}s  后端峰值 RSS {peak_rss_mb(proc.pid):7.1f} MB  "
+                    f"上游收到 {stub_upstream.STATS['upload_bytes'] / 1024 / 1024:.1f} MB"
+                )
+                stub_upstream.reset_stats()
+    finally:
+        proc.terminate()
+        proc.wait()
+        stub.should_exit = True
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,75 @@
+"""
+上游连接池基准：每请求新建 httpx.AsyncClient（旧实现） vs 共享连接池
+
+用法: python benchmarks/bench_upstream_pool.py [请求数] [并发数]
+"""
+
+import asyncio
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+import httpx
+
+import stub_upstream
+
+PORT = stub_upstream.free_port()
+os.environ["SONIOX_API_BASE"] = f"http://127.0.0.1:{PORT}/v1"
+
+import upstream  # noqa: E402
+
+
+async def per_request_client():
+    async with httpx.AsyncClient(timeout=30.0) as client:
+        resp = await client.get(f"{upstream.SONIOX_API_BASE}/models", headers=upstream.auth_headers("bench"))
+        resp.raise_for_status()
+
+
+async def shared_client():
+    resp = await upstream.get_client().get("/models", headers=upstream.auth_headers("bench"))
+    resp.raise_for_status()
+
+
+async def run(name: str, call, total: int, concurrency: int):
+    stub_upstream.reset_stats()
+    latencies = []
+    sem = asyncio.Semaphore(concurrency)
+
+    async def one():
+        async with sem:
+            start = time.perf_counter()
+            await call()
+            latencies.append((time.perf_counter() - start) * 1000)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one() for _ in range(total)))
+    elapsed = time.perf_counter() - start
+
+    latencies.sort()
+    p99 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))]
+    print(
+        f"{name:<20} req/s={total / elapsed:8.1f}  p50={statistics.median(latencies):6.2f}ms  "
+        f"p99={p99:6.2f}ms  connections={len(stub_upstream.STATS['connections'])}"
+    )
+
+
+async def main():
+    total = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+    concurrency = int(sys.argv[2]) if len(sys.argv) > 2 else 10
+
+    server = stub_upstream.start_in_thread(PORT)
+    try:
+        print(f"{total} 个请求，并发 {concurrency}，桩服务 127.0.0.1:{PORT}（明文 HTTP，真实环境还有 TLS 握手）")
+        await run("per-request client", per_request_client, total, concurrency)
+        await upstream.start()
+        await run("shared pool", shared_client, total, concurrency)
+        await upstream.stop()
+    finally:
+        server.should_exit = True
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,169 @@
+"""
+多 worker 吞吐基准：桩服务和后端都以子进程运行，后端依次以 1..N 个 worker 启动，
+多个压测进程并发 POST /transcribe（不走结果缓存），统计每秒完成的请求数和延迟分位
+
+桩服务返回较大的转录结果（--tokens），后端的 multipart 解析、结果解析和拼接占主要 CPU；
+worker 数超过 CPU 核数（含压测进程和桩服务占用的核）后不会再提升
+
+用法: python benchmarks/bench_workers.py [--workers 1 2 4] [--concurrency 64] [--duration 15]
+"""
+
+import argparse
+import asyncio
+import multiprocessing
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+import httpx
+
+import stub_upstream
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+
+async def wait_ready(base_url: str):
+    async with httpx.AsyncClient() as client:
+        for _ in range(300):
+            try:
+                if (await client.get(f"{base_url}/health")).status_code == 200:
+                    return
+            except httpx.TransportError:
+                pass
+            await asyncio.sleep(0.1)
+    raise RuntimeError(f"服务启动超时: {base_url}")
+
+
+async def wait_ready_stub(port: int):
+    async with httpx.AsyncClient() as client:
+        for _ in range(100):
+            try:
+                await client.get(f"http://127.0.0.1:{port}/v1/models")
+                return
+            except httpx.TransportError:
+                await asyncio.sleep(0.1)
+    raise RuntimeError("桩服务启动超时")
+
+
+async def _load(base_url: str, concurrency: int, duration: float, payload: bytes) -> list:
+    """持续发送请求 duration 秒，返回 (是否成功, 延迟) 列表"""
+    results = []
+    deadline = time.monotonic() + duration
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+
+    async with httpx.AsyncClient(timeout=120.0, limits=limits) as client:
+        async def worker():
+            while time.monotonic() < deadline:
+                start = time.perf_counter()
+                try:
+                    resp = await client.post(
+                        f"{base_url}/transcribe",
+                        files={"file": ("bench.wav", payload, "audio/wav")},
+                        data={"api_keys": "bench", "use_cache": "false"},
+                    )
+                    ok = resp.status_code == 200
+                except httpx.HTTPError:
+                    ok = False
+                results.append((ok, time.perf_counter() - start))
+
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return results
+
+
+def _load_process(base_url: str, concurrency: int, duration: float, payload_kb: int, queue):
+    payload = os.urandom(payload_kb * 1024)
+    queue.put(asyncio.run(_load(base_url, concurrency, duration, payload)))
+
+
+def run_load(base_url: str, processes: int, concurrency: int, duration: float, payload_kb: int) -> list:
+    """压测客户端分到多个进程，避免压测端自身成为单核瓶颈"""
+    queue = multiprocessing.Queue()
+    per_process = max(1, concurrency // processes)
+    procs = [
+        multiprocessing.Process(target=_load_process, args=(base_url, per_process, duration, payload_kb, queue))
+        for _ in range(processes)
+    ]
+    for proc in procs:
+        proc.start()
+    results = []
+    for _ in procs:
+        results.extend(queue.get())
+    for proc in procs:
+        proc.join()
+    return results
+
+
+def bench_once(workers: int, stub_port: int, data_dir: str, args) -> tuple:
+    server_port = stub_upstream.free_port()
+    env = dict(
+        os.environ,
+        SONIOX_API_BASE=f"http://127.0.0.1:{stub_port}/v1",
+        SONIOX_WORKERS=str(workers),
+        SONIOX_STATE_PATH=os.path.join(data_dir, "state.db"),
+        SONIOX_JOURNAL_PATH=os.path.join(data_dir, "journal.db"),
+        SONIOX_POLL_INITIAL="0.05",
+        # 准入上限放开，测的是处理能力而不是限流
+        SONIOX_TRANSCRIBE_MAX_ACTIVE="100000",
+        SONIOX_TRANSCRIBE_MAX_PER_CLIENT="100000",
+    )
+    proc = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "server:app", "--port", str(server_port),
+         "--workers", str(workers), "--log-level", "warning"],
+        cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    base_url = f"http://127.0.0.1:{server_port}"
+    try:
+        asyncio.run(wait_ready(base_url))
+        # 预热：每个 worker 建立上游连接池
+        run_load(base_url, 1, min(args.concurrency, 8), 2.0, args.payload_kb)
+        results = run_load(base_url, args.clients, args.concurrency, args.duration, args.payload_kb)
+    finally:
+        proc.terminate()
+        proc.wait()
+    latencies = sorted(latency for ok, latency in results if ok)
+    failed = sum(1 for ok, _ in results if not ok)
+    if not latencies:
+        return 0.0, 0.0, 0.0, failed
+    p99 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))]
+    return len(latencies) / args.duration, statistics.median(latencies), p99, failed
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    cpus = os.cpu_count() or 1
+    parser.add_argument("--workers", type=int, nargs="+", default=sorted({1, 2, max(1, cpus // 2)}))
+    parser.add_argument("--concurrency", type=int, default=64)
+    parser.add_argument("--duration", type=float, default=15.0)
+    parser.add_argument("--clients", type=int, default=max(1, min(4, cpus // 4)), help="压测进程数")
+    parser.add_argument("--tokens", type=int, default=5000, help="桩服务返回的转录 token 数")
+    parser.add_argument("--payload-kb", type=int, default=256, help="每次上传的文件大小")
+    args = parser.parse_args()
+    print(f"CPU 核数 {cpus} | 并发 {args.concurrency} | 每轮 {args.duration:.0f}s | 压测进程 {args.clients}")
+
+    stub_port = stub_upstream.free_port()
+    stub = subprocess.Popen(
+        [sys.executable, os.path.join(HERE, "stub_upstream.py"), "--port", str(stub_port), "--transcript-tokens", str(args.tokens)],
+        cwd=HERE, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    try:
+        asyncio.run(wait_ready_stub(stub_port))
+        baseline = None
+        for workers in args.workers:
+            with tempfile.TemporaryDirectory() as data_dir:
+                rps, p50, p99, failed = bench_once(workers, stub_port, data_dir, args)
+            baseline = baseline or rps
+            print(
+                f"{workers:>3} worker  {rps:8.1f} req/s  ×{rps / baseline:4.2f}  "
+                f"p50 {p50 * 1000:7.0f} ms  p99 {p99 * 1000:7.0f} ms  失败 {failed}"
+            )
+    finally:
+        stub.terminate()
+        stub.wait()
+
+
+if __name__ == "__main__":
+    main()
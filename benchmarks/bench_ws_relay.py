@@ -0,0 +1,120 @@
+"""
+/ws/transcribe 转发负载测试：后端以子进程运行，上游为本地桩 WebSocket（每块处理较慢），
+多个模拟会话以远快于实时的速度推送音频，检查全部会话正常结束、背压生效，
+并在运行中每秒采样后端进程 RSS（/proc/<pid>/status 的 VmRSS，仅 Linux）：
+会话越长，前后两半的 RSS 应保持持平
+
+用法: python benchmarks/bench_ws_relay.py [会话数] [每会话音频块数 ...]
+"""
+
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import time
+
+import httpx
+import websockets
+
+import stub_upstream
+from bench_upload_memory import peak_rss_mb, wait_ready
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+
+# 100ms 的 16kHz 16bit 单声道 PCM；用随机数据，避免 permessage-deflate 把重复样本压缩成极小的帧
+# （解压后在后端放大上千倍，测到的是压缩比而不是转发缓冲）
+CHUNK = os.urandom(3200)
+
+
+async def session(url: str, chunks: int) -> int:
+    """推送 chunks 个音频块后发送结束信号，返回收到的响应数；未收到 finished 时抛出异常"""
+    async with websockets.connect(url, max_size=None) as ws:
+        await ws.send(json.dumps({"api_key": "bench", "model": "stt-rt-v4", "audio_format": "pcm_s16le"}))
+
+        async def send_audio():
+            for _ in range(chunks):
+                await ws.send(CHUNK)
+            await ws.send(b"")
+
+        sender = asyncio.create_task(send_audio())
+        responses = 0
+        try:
+            async for message in ws:
+                responses += 1
+                data = json.loads(message)
+                if data.get("error"):
+                    raise RuntimeError(data["error"])
+                if data.get("finished"):
+                    return responses
+        finally:
+            sender.cancel()
+    raise RuntimeError("会话未收到 finished")
+
+
+def current_rss_mb(pid: int) -> float:
+    with open(f"/proc/{pid}/status") as f:
+        for line in f:
+            if line.startswith("VmRSS:"):
+                return int(line.split()[1]) / 1024
+    return 0.0
+
+
+async def backpressure_count(base_url: str) -> int:
+    async with httpx.AsyncClient() as client:
+        text = (await client.get(f"{base_url}/metrics")).text
+    return sum(int(float(line.split()[-1])) for line in text.splitlines() if line.startswith("soniox_ws_backpressure_total{"))
+
+
+async def main():
+    sessions = int(sys.argv[1]) if len(sys.argv) > 1 else 50
+    chunk_counts = [int(x) for x in sys.argv[2:]] or [500, 3000]
+    stub_upstream.WS_CHUNK_DELAY = 0.002
+    stub_port = stub_upstream.free_port()
+    server_port = stub_upstream.free_port()
+    stub_upstream.start_in_thread(stub_port)
+
+    env = dict(
+        os.environ,
+        SONIOX_API_BASE=f"http://127.0.0.1:{stub_port}/v1",
+        SONIOX_WS_URL=f"ws://127.0.0.1:{stub_port}/transcribe-websocket",
+        SONIOX_WS_AUDIO_HIGH_WATERMARK=str(64 * 1024),
+        SONIOX_WS_AUDIO_LOW_WATERMARK=str(16 * 1024),
+    )
+    proc = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "server:app", "--port", str(server_port), "--log-level", "warning"],
+        cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    base_url = f"http://127.0.0.1:{server_port}"
+    url = f"ws://127.0.0.1:{server_port}/ws/transcribe"
+    try:
+        await wait_ready(base_url)
+        print(f"启动后峰值 RSS: {peak_rss_mb(proc.pid):.1f} MB")
+        for chunks in chunk_counts:
+            start = time.perf_counter()
+            run = asyncio.ensure_future(
+                asyncio.gather(*(session(url, chunks) for _ in range(sessions)), return_exceptions=True)
+            )
+            samples = []
+            while not run.done():
+                await asyncio.wait([run], timeout=1.0)
+                samples.append(current_rss_mb(proc.pid))
+            results = run.result()
+            elapsed = time.perf_counter() - start
+            half = max(1, len(samples) // 2)
+            failed = [r for r in results if isinstance(r, Exception)]
+            audio_mb = sessions * chunks * len(CHUNK) / 1024 / 1024
+            print(
+                f"{sessions} 会话 × {chunks} 块 ({audio_mb:.0f} MB 音频): {elapsed:.2f}s | "
+                f"失败 {len(failed)} | 背压累计 {await backpressure_count(base_url)} 次 | "
+                f"RSS 前半 {max(samples[:half]):.1f} MB / 后半 {max(samples[half:] or samples):.1f} MB"
+            )
+            for error in failed[:3]:
+                print(f"  {type(error).__name__}: {error}")
+    finally:
+        proc.terminate()
+        proc.wait()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
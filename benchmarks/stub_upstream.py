@@ -0,0 +1,274 @@
+"""
+本地 Soniox 桩服务（仅用于基准测试，不访问真实 api.soniox.com / stt-rt.soniox.com）
+
+实现 /v1/files、/v1/transcriptions（含 /transcript）、/v1/models 和实时转录 WebSocket 协议；
+处理延迟和故障注入（HTTP 503、转录 error 状态、WebSocket 错误消息）可由基准脚本或命令行参数调整。
+记录每个请求的客户端地址，用于统计上游实际建立的 TCP 连接数
+
+独立运行: python benchmarks/stub_upstream.py --port 9001 --processing-delay 1 --error-rate 0.01
+后端指向桩服务: SONIOX_API_BASE=http://127.0.0.1:9001/v1 SONIOX_WS_URL=ws://127.0.0.1:9001/transcribe-websocket
+"""
+
+import argparse
+import asyncio
+import json
+import random
+import socket
+import threading
+import time
+import uuid
+from typing import Optional
+
+import uvicorn
+from fastapi import FastAPI, Request, Response, WebSocket, WebSocketDisconnect
+
+app = FastAPI(title="Soniox Stub")
+
+# 转录处理耗时（秒），可由基准脚本调整
+PROCESSING_DELAY = 0.0
+# 列表接口每页的响应延迟（秒），模拟真实上游的分页查询耗时
+LIST_DELAY = 0.0
+# 实时转录：每处理一个音频块的耗时（秒，模拟慢上游），每收到多少个音频块返回一次响应
+WS_CHUNK_DELAY = 0.0
+WS_RESPONSE_EVERY = 10
+# 转录结果的 token 数；较大时后端解析和拼接结果的开销占主导
+TRANSCRIPT_TOKENS = 8
+# 故障注入概率：任意 REST 请求返回 503 / 转录以 error 状态结束 / 实时会话中途返回错误消息
+HTTP_ERROR_RATE = 0.0
+TRANSCRIPTION_ERROR_RATE = 0.0
+WS_ERROR_RATE = 0.0
+
+STATS = {
+    "connections": set(), "requests": 0, "upload_bytes": 0, "ws_sessions": 0, "ws_audio_bytes": 0, "injected_errors": 0,
+}
+FILES = {}
+TRANSCRIPTIONS = {}
+
+
+@app.middleware("http")
+async def record_connection(request: Request, call_next):
+    STATS["requests"] += 1
+    if request.client:
+        STATS["connections"].add((request.client.host, request.client.port))
+    # 按 Key 前缀模拟故障：bad* → 401，limited* → 429
+    key = request.headers.get("authorization", "").replace("Bearer ", "")
+    if key.startswith("bad"):
+        return Response(status_code=401, content='{"message": "invalid api key"}')
+    if key.startswith("limited"):
+        return Response(status_code=429, headers={"Retry-After": "5"}, content='{"message": "rate limited"}')
+    if HTTP_ERROR_RATE and random.random() < HTTP_ERROR_RATE:
+        STATS["injected_errors"] += 1
+        return Response(status_code=503, content='{"message": "injected failure"}')
+    return await call_next(request)
+
+
+@app.get("/v1/models")
+async def models():
+    return {"models": [{"id": "stt-async-v4", "name": "stt-async-v4"}, {"id": "stt-rt-v4", "name": "stt-rt-v4"}]}
+
+
+@app.post("/v1/files", status_code=201)
+async def upload_file(request: Request):
+    size = 0
+    async for chunk in request.stream():
+        size += len(chunk)
+    STATS["upload_bytes"] += size
+    file_id = str(uuid.uuid4())
+    FILES[file_id] = {
+        "id": file_id,
+        "filename": "upload",
+        "size": size,
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+    }
+    return FILES[file_id]
+
+
+def _page(items: list, limit: int, cursor: Optional[str]) -> tuple:
+    """游标为下一页起始下标"""
+    start = int(cursor or 0)
+    end = start + limit
+    return items[start:end], (str(end) if end < len(items) else None)
+
+
+@app.get("/v1/files")
+async def list_files(limit: int = 100, cursor: Optional[str] = None):
+    await asyncio.sleep(LIST_DELAY)
+    page, next_cursor = _page(list(FILES.values()), limit, cursor)
+    return {"files": page, "next_page_cursor": next_cursor}
+
+
+@app.get("/v1/files/{file_id}")
+async def get_file(file_id: str):
+    if file_id not in FILES:
+        return Response(status_code=404)
+    return FILES[file_id]
+
+
+@app.get("/v1/files/{file_id}/url")
+async def get_file_url(file_id: str):
+    if file_id not in FILES:
+        return Response(status_code=404)
+    expires_at = time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime(time.time() + 3600))
+    return {"url": f"https://stub.invalid/files/{file_id}", "expires_at": expires_at}
+
+
+@app.delete("/v1/files/{file_id}")
+async def delete_file(file_id: str):
+    FILES.pop(file_id, None)
+    return Response(status_code=204)
+
+
+@app.post("/v1/transcriptions", status_code=201)
+async def create_transcription(request: Request):
+    config = await request.json()
+    transcription_id = str(uuid.uuid4())
+    TRANSCRIPTIONS[transcription_id] = {
+        "id": transcription_id,
+        "status": "queued",
+        "file_id": config.get("file_id", ""),
+        "model": config.get("model", "stt-async-v4"),
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        "audio_duration_ms": 60000,
+        "_ready_at": time.monotonic() + PROCESSING_DELAY,
+        "_fail": bool(TRANSCRIPTION_ERROR_RATE) and random.random() < TRANSCRIPTION_ERROR_RATE,
+    }
+    return _public(TRANSCRIPTIONS[transcription_id])
+
+
+@app.get("/v1/transcriptions")
+async def list_transcriptions(limit: int = 100, cursor: Optional[str] = None):
+    await asyncio.sleep(LIST_DELAY)
+    page, next_cursor = _page(list(TRANSCRIPTIONS.values()), limit, cursor)
+    return {"transcriptions": [_public(t) for t in page], "next_page_cursor": next_cursor}
+
+
+@app.get("/v1/transcriptions/{transcription_id}")
+async def get_transcription(transcription_id: str):
+    if transcription_id not in TRANSCRIPTIONS:
+        return Response(status_code=404)
+    return _public(TRANSCRIPTIONS[transcription_id])
+
+
+_WORDS = ["Hello", " world", ",", " this", " is", " a", " stub", "."]
+_transcript_body = {}
+
+
+def _transcript(count: int) -> bytes:
+    """按 token 数缓存序列化结果，桩服务本身不成为瓶颈"""
+    if count not in _transcript_body:
+        tokens = [
+            {"text": _WORDS[i % len(_WORDS)], "start_ms": i * 300, "end_ms": i * 300 + 250, "speaker": "1"}
+            for i in range(count)
+        ]
+        _transcript_body[count] = json.dumps({"text": "".join(t["text"] for t in tokens), "tokens": tokens}).encode()
+    return _transcript_body[count]
+
+
+@app.get("/v1/transcriptions/{transcription_id}/transcript")
+async def get_transcript(transcription_id: str):
+    transcription = TRANSCRIPTIONS.get(transcription_id)
+    if transcription is None:
+        return Response(status_code=404)
+    if _public(transcription)["status"] != "completed":
+        return Response(status_code=409, content='{"message": "transcription is not completed"}')
+    return Response(content=_transcript(TRANSCRIPT_TOKENS), media_type="application/json")
+
+
+@app.delete("/v1/transcriptions/{transcription_id}")
+async def delete_transcription(transcription_id: str):
+    TRANSCRIPTIONS.pop(transcription_id, None)
+    return Response(status_code=204)
+
+
+@app.websocket("/transcribe-websocket")
+async def transcribe_websocket(websocket: WebSocket):
+    await websocket.accept()
+    STATS["ws_sessions"] += 1
+    config = json.loads(await websocket.receive_text())
+    if str(config.get("api_key", "")).startswith("bad"):
+        await websocket.send_json({"error_code": 401, "error_message": "Invalid API key."})
+        await websocket.close()
+        return
+    # 注入故障的会话在收到这么多个音频块后返回错误
+    fail_after = random.randint(1, 50) if WS_ERROR_RATE and random.random() < WS_ERROR_RATE else None
+    chunks = 0
+    try:
+        while True:
+            data = await websocket.receive_bytes()
+            if not data:
+                break
+            STATS["ws_audio_bytes"] += len(data)
+            chunks += 1
+            if WS_CHUNK_DELAY:
+                await asyncio.sleep(WS_CHUNK_DELAY)
+            if chunks == fail_after:
+                STATS["injected_errors"] += 1
+                await websocket.send_json({"error_code": 503, "error_message": "Injected failure."})
+                await websocket.close()
+                return
+            if chunks % WS_RESPONSE_EVERY == 0:
+                token = {"text": f" w{chunks}", "start_ms": chunks * 100, "end_ms": chunks * 100 + 80, "is_final": True}
+                await websocket.send_json({"tokens": [token], "final_audio_proc_ms": chunks * 100, "total_audio_proc_ms": chunks * 100})
+        await websocket.send_json({"tokens": [], "finished": True})
+        await websocket.close()
+    except WebSocketDisconnect:
+        pass
+
+
+def _public(transcription: dict) -> dict:
+    if transcription["status"] in ("queued", "processing") and time.monotonic() >= transcription["_ready_at"]:
+        if transcription.get("_fail"):
+            STATS["injected_errors"] += 1
+            transcription["status"] = "error"
+            transcription["error_message"] = "Injected failure."
+        else:
+            transcription["status"] = "completed"
+    return {k: v for k, v in transcription.items() if not k.startswith("_")}
+
+
+def reset_stats():
+    STATS["connections"] = set()
+    STATS["requests"] = 0
+    STATS["upload_bytes"] = 0
+    STATS["ws_sessions"] = 0
+    STATS["ws_audio_bytes"] = 0
+    STATS["injected_errors"] = 0
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def start_in_thread(port: int) -> uvicorn.Server:
+    """在后台线程启动桩服务，返回 uvicorn.Server 以便停止"""
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning"))
+    thread = threading.Thread(target=server.run, daemon=True)
+    thread.start()
+    while not server.started:
+        time.sleep(0.01)
+    return server
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="本地 Soniox 桩服务")
+    parser.add_argument("--port", type=int, default=9001)
+    parser.add_argument("--transcript-tokens", type=int, default=TRANSCRIPT_TOKENS)
+    parser.add_argument("--processing-delay", type=float, default=PROCESSING_DELAY, help="转录处理耗时（秒）")
+    parser.add_argument("--list-delay", type=float, default=LIST_DELAY, help="列表接口每页延迟（秒）")
+    parser.add_argument("--ws-chunk-delay", type=float, default=WS_CHUNK_DELAY, help="实时转录每个音频块的处理耗时（秒）")
+    parser.add_argument("--ws-response-every", type=int, default=WS_RESPONSE_EVERY, help="实时转录每多少个音频块返回一次响应")
+    parser.add_argument("--http-error-rate", type=float, default=HTTP_ERROR_RATE, help="REST 请求返回 503 的概率")
+    parser.add_argument("--error-rate", type=float, default=TRANSCRIPTION_ERROR_RATE, help="转录以 error 状态结束的概率")
+    parser.add_argument("--ws-error-rate", type=float, default=WS_ERROR_RATE, help="实时会话中途返回错误的概率")
+    args = parser.parse_args()
+    TRANSCRIPT_TOKENS = args.transcript_tokens
+    PROCESSING_DELAY = args.processing_delay
+    LIST_DELAY = args.list_delay
+    WS_CHUNK_DELAY = args.ws_chunk_delay
+    WS_RESPONSE_EVERY = args.ws_response_every
+    HTTP_ERROR_RATE = args.http_error_rate
+    TRANSCRIPTION_ERROR_RATE = args.error_rate
+    WS_ERROR_RATE = args.ws_error_rate
+    uvicorn.run(app, host="127.0.0.1", port=args.port, log_level="warning")
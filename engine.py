@@ -0,0 +1,631 @@
+"""
+转录引擎
+文件转录的完整流程（上传 → 创建任务 → 等待完成 → 获取 tokens → 清理上游，可选归一化、分段和结果缓存）
+与 HTTP 层无关，FastAPI 服务和 MCP 服务器（进程内模式）直接调用；
+共用 upstream 的连接池、keypool 的 Key 调度、watcher 的轮询和转录日志。
+独立使用时先 await start()，退出前 await stop()
+"""
+
+import asyncio
+import os
+import time
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Awaitable, Callable, Dict, List, Optional, Set, Tuple
+
+import httpx
+from fastapi import HTTPException
+from loguru import logger
+
+import audio_normalize
+import audio_split
+import journal
+import keypool
+import meta_cache
+import metrics
+import result_cache
+import shared_state
+import token_stream
+import transcript
+import upstream
+import watcher
+
+# 服务端分段转录的并发上限
+CHUNK_CONCURRENCY = int(os.getenv("SONIOX_CHUNK_CONCURRENCY", "4"))
+# 批量转录（/transcribe/batch 与 MCP transcribe_batch）同时运行的文件数默认值/上限
+BATCH_CONCURRENCY = int(os.getenv("SONIOX_BATCH_CONCURRENCY", "8"))
+BATCH_MAX_CONCURRENCY = int(os.getenv("SONIOX_BATCH_MAX_CONCURRENCY", "32"))
+
+def parse_api_keys(api_keys: str) -> List[str]:
+    keys_list = [k.strip() for k in api_keys.split(",") if k.strip()]
+    if not keys_list:
+        raise HTTPException(status_code=400, detail="请提供至少一个 API Key")
+    return keys_list
+
+def _record_stage(stages: Dict[str, float], name: str, step_started: float):
+    """记录阶段耗时到响应的 processing_time.stages 和 /metrics 直方图"""
+    elapsed = time.monotonic() - step_started
+    stages[name] = round(elapsed, 3)
+    metrics.PIPELINE_STAGE_SECONDS.observe(elapsed, stage=name)
+
+async def _submit_transcription(
+    reader,
+    filename: str,
+    size: Optional[int],
+    api_key: str,
+    enable_diarization: bool,
+    stage: Callable[..., None],
+    stages: Dict[str, float],
+    entry: dict
+) -> Tuple[str, dict]:
+    """步骤 1-2：上传文件并创建转录任务，返回 (file_id, 创建响应)；各步耗时写入 stages，上游 ID 写入转录日志"""
+    headers = upstream.auth_headers(api_key)
+    client = upstream.get_client()
+    
+    logger.info("步骤 1/4: 上传文件...")
+    stage("uploading", size=size)
+    step_started = time.monotonic()
+    # 按文件头识别真实格式作为上传的 Content-Type
+    await reader.seek(0)
+    audio_format = audio_normalize.sniff_format(await reader.read(audio_normalize.SNIFF_BYTES))
+    # 从临时文件分块流式上传，内存占用与文件大小无关；上传超时设长（大文件上传可能很慢）
+    await reader.seek(0)
+    body_headers, body = upstream.multipart_file_body(reader, filename, audio_format.mime_type, size=size)
+    upload_resp = await client.post(
+        "/files", content=body, headers={**headers, **body_headers}, timeout=upstream.UPLOAD_TIMEOUT
+    )
+    keypool.pool.record(api_key, upload_resp.status_code, upload_resp.headers.get("Retry-After"))
+    
+    if upload_resp.status_code != 201:
+        logger.error(f"上传失败: {upload_resp.status_code} - {upload_resp.text}")
+        raise HTTPException(status_code=upload_resp.status_code, detail=f"上传失败: {upload_resp.text}")
+    
+    file_id = upload_resp.json()["id"]
+    await journal.store.update(entry, stage="uploaded", api_key=api_key, file_id=file_id)
+    _record_stage(stages, "upload", step_started)
+    metrics.UPLOAD_BYTES.inc(size or 0)
+    logger.info(f"步骤 1/4: 文件 ID: {file_id}")
+    stage("uploaded", file_id=file_id)
+    
+    logger.info("步骤 2/4: 创建转录任务...")
+    config = {
+        "file_id": file_id,
+        "model": "stt-async-v4",
+        "enable_speaker_diarization": enable_diarization,
+        "enable_language_identification": True
+    }
+    
+    step_started = time.monotonic()
+    transcribe_resp = await client.post("/transcriptions", json=config, headers=headers)
+    _record_stage(stages, "create", step_started)
+    keypool.pool.record(api_key, transcribe_resp.status_code, transcribe_resp.headers.get("Retry-After"))
+    
+    if transcribe_resp.status_code != 201:
+        logger.error(f"创建转录失败: {transcribe_resp.status_code} - {transcribe_resp.text}")
+        try:
+            await client.delete(f"/files/{file_id}", headers=headers)
+        except httpx.HTTPError:
+            pass
+        raise HTTPException(status_code=transcribe_resp.status_code, detail=f"创建转录失败: {transcribe_resp.text}")
+    
+    created = transcribe_resp.json()
+    await journal.store.update(
+        entry, stage="created", transcription_id=created["id"], audio_duration_ms=created.get("audio_duration_ms")
+    )
+    return file_id, created
+
+async def fetch_tokens(api_key: str, transcription_id: str) -> List[dict]:
+    """步骤 4：获取转录 tokens"""
+    text_resp = await upstream.get_client().get(
+        f"/transcriptions/{transcription_id}/transcript", headers=upstream.auth_headers(api_key)
+    )
+    keypool.pool.record(api_key, text_resp.status_code, text_resp.headers.get("Retry-After"))
+    
+    if text_resp.status_code != 200:
+        logger.error(f"获取文本失败: {text_resp.status_code}")
+        raise HTTPException(status_code=text_resp.status_code, detail="获取文本失败")
+    
+    return text_resp.json().get("tokens", [])
+
+async def open_tokens(api_key: str, transcription_id: str) -> AsyncIterator[dict]:
+    """
+    步骤 4（流式）：请求 transcript 并检查状态码，返回边接收边解析、逐个输出 token 的异步迭代器
+    
+    不在内存中保留完整响应和 token 列表（见 token_stream）；读完或关闭迭代器时释放连接
+    """
+    client = upstream.get_client()
+    request = client.build_request(
+        "GET", f"/transcriptions/{transcription_id}/transcript", headers=upstream.auth_headers(api_key)
+    )
+    response = await client.send(request, stream=True)
+    keypool.pool.record(api_key, response.status_code, response.headers.get("Retry-After"))
+    
+    if response.status_code != 200:
+        await response.aclose()
+        logger.error(f"获取文本失败: {response.status_code}")
+        raise HTTPException(status_code=response.status_code, detail="获取文本失败")
+    
+    async def tokens() -> AsyncIterator[dict]:
+        try:
+            async for token in token_stream.iter_tokens(response.aiter_bytes()):
+                yield token
+        finally:
+            await response.aclose()
+    
+    return tokens()
+
+async def cleanup_upstream(entry: dict) -> bool:
+    """删除 Soniox 上的转录和文件（不存在视为已删除），全部成功后从转录日志移除；返回是否清理完成"""
+    headers = upstream.auth_headers(entry["api_key"]) if entry["api_key"] else {}
+    client = upstream.get_client()
+    targets = []
+    if entry["transcription_id"]:
+        targets.append(f"/transcriptions/{entry['transcription_id']}")
+    if entry["file_id"]:
+        targets.append(f"/files/{entry['file_id']}")
+    for path in targets:
+        try:
+            resp = await client.delete(path, headers=headers)
+        except httpx.HTTPError as e:
+            logger.warning(f"清理失败: {path} | {type(e).__name__}: {e}")
+            return False
+        if resp.status_code >= 400 and resp.status_code != 404:
+            logger.warning(f"清理失败: {path} | {resp.status_code}")
+            return False
+    if targets:
+        logger.debug("已清理转录和文件")
+    if entry["transcription_id"]:
+        await meta_cache.cache.invalidate_transcription(entry["api_key"], entry["transcription_id"])
+    if entry["file_id"]:
+        await meta_cache.cache.invalidate_file(entry["api_key"], entry["file_id"])
+    await journal.store.finish(entry)
+    return True
+
+@asynccontextmanager
+async def _transcription(
+    reader,
+    filename: str,
+    size: Optional[int],
+    keys_list: List[str],
+    enable_diarization: bool,
+    on_stage: Optional[Callable[..., None]] = None,
+    recovery: Optional[dict] = None
+) -> AsyncIterator[Tuple[str, str, dict, Callable[..., None], Dict[str, float]]]:
+    """
+    上传 → 创建任务 → 等待完成，yield (api_key, transcription_id, 转录状态, stage 回调, 各阶段耗时)，由调用方获取结果
+    
+    reader 为支持 async read/seek 的文件对象；on_stage(stage, **info) 在每个阶段开始/完成时回调。
+    Key 由 keypool 按负载和健康状况选择，上传/创建失败（401/429/5xx/网络错误）时换 Key 重试。
+    上游 ID 记录在转录日志中，recovery（cache_key / job_id）决定重启恢复后结果的去向；
+    退出时无论成功失败都会删除上游文件和转录，服务关闭时保留，重启后继续
+    """
+    def stage(name: str, **info):
+        if on_stage:
+            on_stage(name, **info)
+    
+    started = time.monotonic()
+    stages: Dict[str, float] = {}
+    logger.debug(f"文件大小: {size} 字节")
+    entry = await journal.store.begin(filename, enable_diarization, **(recovery or {}))
+    
+    tried: List[str] = []
+    try:
+        while True:
+            api_key = keypool.pool.acquire(keys_list, exclude=tried)
+            logger.debug(f"使用 Key: {api_key[:10]}... (共 {len(keys_list)} 个)")
+            try:
+                file_id, created = await _submit_transcription(
+                    reader, filename, size, api_key, enable_diarization, stage, stages, entry
+                )
+                break
+            except (HTTPException, httpx.TransportError) as e:
+                keypool.pool.release(api_key)
+                status_code = e.status_code if isinstance(e, HTTPException) else None
+                if status_code is None:
+                    keypool.pool.record(api_key, None)
+                tried.append(api_key)
+                if not keypool.is_retryable(status_code) or len(tried) >= len(set(keys_list)):
+                    raise
+                logger.warning(f"Key {api_key[:10]}... 失败 ({status_code or type(e).__name__})，换 Key 重试")
+    except asyncio.CancelledError:
+        _abandon(entry)
+        raise
+    except Exception:
+        # 上传失败或创建失败（已删除文件），上游没有需要清理的内容
+        await journal.store.finish(entry)
+        raise
+    
+    try:
+        transcription_id = created["id"]
+        logger.info(f"步骤 2/4: 转录 ID: {transcription_id}")
+        stage("created", transcription_id=transcription_id)
+        
+        logger.info("步骤 3/4: 等待转录完成...")
+        stage("polling")
+        step_started = time.monotonic()
+        # 由该 Key 的监视器统一轮询（先快后慢，多任务时批量查询）
+        data = await watcher.wait_for_completion(api_key, transcription_id, created.get("audio_duration_ms"))
+        _record_stage(stages, "poll", step_started)
+        logger.success(f"步骤 3/4: 转录完成！(共等待 {time.monotonic() - started:.1f}秒)")
+        
+        yield api_key, transcription_id, data, stage, stages
+    except (asyncio.CancelledError, GeneratorExit):
+        # GeneratorExit：流式输出的调用方未读完就关闭（客户端断开）
+        _abandon(entry)
+        raise
+    except Exception:
+        # 失败路径同样清理；清理失败时保留日志，重启后重试
+        await cleanup_upstream(entry)
+        raise
+    finally:
+        keypool.pool.release(api_key)
+    
+    await cleanup_upstream(entry)
+
+async def transcribe_tokens(
+    reader,
+    filename: str,
+    size: Optional[int],
+    keys_list: List[str],
+    enable_diarization: bool,
+    on_stage: Optional[Callable[..., None]] = None,
+    recovery: Optional[dict] = None
+) -> Tuple[List[dict], dict, Dict[str, float]]:
+    """上传 → 创建任务 → 等待完成 → 获取 tokens，返回 (tokens, 转录状态, 各阶段耗时)，见 _transcription"""
+    async with _transcription(
+        reader, filename, size, keys_list, enable_diarization, on_stage, recovery
+    ) as (api_key, transcription_id, data, stage, stages):
+        logger.info("步骤 4/4: 获取转录文本...")
+        step_started = time.monotonic()
+        tokens = await fetch_tokens(api_key, transcription_id)
+        _record_stage(stages, "fetch", step_started)
+        stage("fetched")
+    return tokens, data, stages
+
+def build_transcript(tokens: List[dict], enable_diarization: bool) -> Tuple[str, List[dict]]:
+    """tokens 拼接为文本（可选说话人标记）和词级时间戳（子词 token 合并为词），见 transcript.build"""
+    text, words = transcript.build(tokens, enable_diarization)
+    logger.success(f"完成 | 转录文本长度: {len(text)} 字符 | {len(words)} 个词")
+    return text, words
+
+def single_file_result(tokens: List[dict], data: dict, enable_diarization: bool, started: float, stages: Dict[str, float]) -> dict:
+    """整文件转录的 TranscribeResponse 结构"""
+    text, words = build_transcript(tokens, enable_diarization)
+    total_time = round(time.monotonic() - started, 3)
+    return {
+        "success": True,
+        "text": text,
+        "words": words,
+        "audio_duration": (data.get("audio_duration_ms") or 0) / 1000.0,
+        "total_chunks": 1,
+        "processing_time": {
+            "total": total_time,
+            "chunks": [{"chunk": 1, "duration": total_time, "stages": stages}],
+            "stages": stages
+        }
+    }
+
+async def run_transcription(
+    reader,
+    filename: str,
+    size: Optional[int],
+    keys_list: List[str],
+    enable_diarization: bool,
+    on_stage: Optional[Callable[..., None]] = None,
+    recovery: Optional[dict] = None
+) -> dict:
+    """转录单个文件，返回 TranscribeResponse 结构"""
+    started = time.monotonic()
+    tokens, data, stages = await transcribe_tokens(
+        reader, filename, size, keys_list, enable_diarization, on_stage, recovery
+    )
+    return single_file_result(tokens, data, enable_diarization, started, stages)
+
+# ==================== 崩溃恢复 ====================
+
+_resume_tasks: Set[asyncio.Task] = set()
+
+async def resume_entry(entry: dict) -> Optional[dict]:
+    """
+    继续处理转录日志中的条目：等待上游转录完成，需要结果时取回
+    （写入 cache_key 对应的结果缓存，并作为返回值供恢复的异步任务使用），然后清理上游
+    """
+    try:
+        if not entry["transcription_id"]:
+            if entry["job_id"]:
+                raise HTTPException(status_code=503, detail="服务重启时文件尚未提交转录，请重新提交")
+            return None
+        started = time.monotonic()
+        data = await watcher.wait_for_completion(entry["api_key"], entry["transcription_id"], entry["audio_duration_ms"])
+        if not (entry["cache_key"] or entry["job_id"]):
+            return None
+        tokens = await fetch_tokens(entry["api_key"], entry["transcription_id"])
+        result = single_file_result(tokens, data, entry["enable_diarization"], started, {})
+        if entry["cache_key"]:
+            await result_cache.cache.put(entry["cache_key"], result)
+        logger.success(f"已恢复转录: {entry['transcription_id']} | {entry['filename']}")
+        return result
+    finally:
+        # 再次因服务关闭被取消时保留日志
+        if not journal.store.closing:
+            await cleanup_upstream(entry)
+
+def _abandon(entry: dict):
+    """
+    转录被取消：服务关闭时保留日志，重启后恢复；
+    其它情况（如客户端断开）在后台等待上游完成后清理，结果照常写入缓存
+    """
+    if not journal.store.closing and entry["stage"] != "finished":
+        spawn_resume({**entry, "job_id": None})
+
+def spawn_resume(entry: dict):
+    """后台运行 resume_entry，服务关闭时统一取消"""
+    def done(task: asyncio.Task):
+        _resume_tasks.discard(task)
+        if not task.cancelled() and task.exception() is not None:
+            e = task.exception()
+            logger.error(f"恢复转录失败: {entry['transcription_id']} | {type(e).__name__}: {e}")
+    
+    task = asyncio.create_task(resume_entry(entry))
+    _resume_tasks.add(task)
+    task.add_done_callback(done)
+
+async def shutdown():
+    """取消后台恢复任务（服务关闭时调用，先设置 journal.store.closing 以保留日志）"""
+    for task in list(_resume_tasks):
+        task.cancel()
+    await asyncio.gather(*_resume_tasks, return_exceptions=True)
+
+async def run_chunked_transcription(
+    fileobj,
+    filename: str,
+    segments: List[audio_split.Segment],
+    keys_list: List[str],
+    enable_diarization: bool
+) -> dict:
+    """
+    分段并发转录：各段由 keypool 分配到负载最低的 Key 并发提交，tokens 按分段起点平移后合并
+    
+    注意：说话人编号由 Soniox 按段独立分配，跨段不保证一致
+    """
+    started = time.monotonic()
+    base, _ = os.path.splitext(filename or "audio")
+    paths = await asyncio.to_thread(audio_split.write_segments, fileobj, segments)
+    semaphore = asyncio.Semaphore(CHUNK_CONCURRENCY)
+    # 任一分段失败后置位；失败分段释放的名额可能在取消生效前被等待中的分段拿到，拿到后先检查
+    aborted = asyncio.Event()
+    
+    async def transcribe_segment(segment: audio_split.Segment, path: str):
+        async with semaphore:
+            if aborted.is_set():
+                return None
+            seg_started = time.monotonic()
+            logger.info(f"分段 {segment.index + 1}/{len(segments)} | 起点 {segment.start_ms / 1000:.1f}s | 时长 {segment.duration:.1f}s")
+            reader = upstream.AsyncFileReader(path)
+            try:
+                tokens, data, stages = await transcribe_tokens(
+                    reader, f"{base}.part{segment.index + 1}.wav", reader.size, keys_list, enable_diarization
+                )
+            except BaseException:
+                aborted.set()
+                raise
+            finally:
+                await reader.close()
+            for token in tokens:
+                if "start_ms" in token:
+                    token["start_ms"] += segment.start_ms
+                if "end_ms" in token:
+                    token["end_ms"] += segment.start_ms
+            return tokens, data, {"duration": round(time.monotonic() - seg_started, 3), "stages": stages}
+    
+    tasks = [asyncio.create_task(transcribe_segment(seg, path)) for seg, path in zip(segments, paths)]
+    try:
+        results = await asyncio.gather(*tasks)
+    finally:
+        # 任一分段失败（或请求被取消）时先取消其余分段并等待结束，之后才删除临时文件
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        for path in paths:
+            os.unlink(path)
+    
+    tokens = [token for seg_tokens, _, _ in results for token in seg_tokens]
+    text, words = build_transcript(tokens, enable_diarization)
+    audio_duration_ms = sum((data.get("audio_duration_ms") or 0) for _, data, _ in results)
+    
+    return {
+        "success": True,
+        "text": text,
+        "words": words,
+        "audio_duration": audio_duration_ms / 1000.0,
+        "total_chunks": len(segments),
+        "processing_time": {
+            "total": round(time.monotonic() - started, 3),
+            "chunks": [{"chunk": i + 1, **timing} for i, (_, _, timing) in enumerate(results)]
+        }
+    }
+
+def cache_options(enable_diarization: bool, chunk_duration: float = 0, normalize_audio: bool = False) -> dict:
+    """影响转录结果的参数，与内容哈希一起组成缓存键"""
+    return {
+        "model": "stt-async-v4",
+        "enable_speaker_diarization": enable_diarization,
+        "enable_language_identification": True,
+        "chunk_duration": float(chunk_duration),
+        "normalize_sample_rate": audio_normalize.NORMALIZE_SAMPLE_RATE if normalize_audio else None
+    }
+
+@asynccontextmanager
+async def _normalized(
+    reader, filename: str, size: Optional[int], normalize_audio: bool, on_stage: Optional[Callable[..., None]]
+) -> AsyncIterator[Tuple[object, str, Optional[int], Optional[float]]]:
+    """可选音频归一化，yield (reader, filename, size, 归一化耗时)；未归一化时原样返回、耗时为 None，退出时删除临时文件"""
+    normalized_path = None
+    normalize_time = None
+    if normalize_audio:
+        step_started = time.monotonic()
+        normalized_path = await asyncio.to_thread(audio_normalize.normalize_wav, reader.file)
+        if normalized_path:
+            normalize_time = time.monotonic() - step_started
+            metrics.PIPELINE_STAGE_SECONDS.observe(normalize_time, stage="normalize")
+            reader = upstream.AsyncFileReader(normalized_path)
+            logger.info(f"音频归一化: {size or 0} → {reader.size} 字节 ({normalize_time:.2f}秒)")
+            if on_stage:
+                on_stage("normalized", original_size=size, size=reader.size)
+            size = reader.size
+            filename = f"{os.path.splitext(filename or 'audio')[0]}.wav"
+    
+    try:
+        yield reader, filename, size, normalize_time
+    finally:
+        if normalized_path:
+            await reader.close()
+            os.unlink(normalized_path)
+
+def _with_normalize_stage(stages: Dict[str, float], normalize_time: Optional[float]) -> Dict[str, float]:
+    if normalize_time is None:
+        return stages
+    return {"normalize": round(normalize_time, 3), **(stages or {})}
+
+async def run_file_pipeline(
+    reader,
+    filename: str,
+    size: Optional[int],
+    keys_list: List[str],
+    enable_diarization: bool,
+    chunk_duration: float = 0,
+    normalize_audio: bool = False,
+    on_stage: Optional[Callable[..., None]] = None,
+    recovery: Optional[dict] = None
+) -> dict:
+    """
+    文件转录完整流程：可选音频归一化 → 可选服务端分段 → 转录
+    
+    reader 为 UploadFile 或 upstream.AsyncFileReader（均提供 .file 同步文件对象）；
+    recovery 见 _transcription，分段转录重启后只清理上游、不恢复结果
+    """
+    async with _normalized(reader, filename, size, normalize_audio, on_stage) as (reader, filename, size, normalize_time):
+        segments = None
+        if chunk_duration > 0:
+            segments = await asyncio.to_thread(audio_split.plan_segments, reader.file, chunk_duration)
+            if segments:
+                logger.info(f"服务端分段: {len(segments)} 段 (目标 {chunk_duration:.0f}s/段)")
+            else:
+                logger.debug("不满足分段条件（非 PCM WAV 或时长较短），整文件转录")
+        if segments:
+            result = await run_chunked_transcription(reader.file, filename, segments, keys_list, enable_diarization)
+        else:
+            result = await run_transcription(reader, filename, size, keys_list, enable_diarization, on_stage, recovery)
+    
+    if normalize_time is not None:
+        processing_time = result["processing_time"]
+        processing_time["stages"] = _with_normalize_stage(processing_time.get("stages"), normalize_time)
+    return result
+
+async def stream_transcription(
+    reader,
+    filename: str,
+    size: Optional[int],
+    keys_list: List[str],
+    enable_diarization: bool,
+    normalize_audio: bool = False,
+    on_stage: Optional[Callable[..., None]] = None
+) -> AsyncIterator[dict]:
+    """
+    流式转录：可选音频归一化 → 上传 → 创建任务 → 等待完成 → 边下载边解析 tokens
+    
+    第一个元素为摘要 {"audio_duration", "total_chunks"}（上传、转录或请求 transcript 失败时在此之前抛出），
+    之后逐个输出 token；读完后摘要补充 processing_time 并清理上游，中途关闭时在后台等待后清理。
+    不分段、结果不写入缓存
+    """
+    started = time.monotonic()
+    async with _normalized(reader, filename, size, normalize_audio, on_stage) as (reader, filename, size, normalize_time):
+        async with _transcription(
+            reader, filename, size, keys_list, enable_diarization, on_stage
+        ) as (api_key, transcription_id, data, stage, stages):
+            logger.info("步骤 4/4: 流式获取转录文本...")
+            step_started = time.monotonic()
+            tokens = await open_tokens(api_key, transcription_id)
+            summary = {"audio_duration": (data.get("audio_duration_ms") or 0) / 1000.0, "total_chunks": 1}
+            count = 0
+            try:
+                yield summary
+                async for token in tokens:
+                    count += 1
+                    yield token
+            finally:
+                await tokens.aclose()
+            _record_stage(stages, "fetch", step_started)
+            stage("fetched")
+    
+    stages = _with_normalize_stage(stages, normalize_time)
+    total_time = round(time.monotonic() - started, 3)
+    summary["processing_time"] = {
+        "total": total_time,
+        "chunks": [{"chunk": 1, "duration": total_time, "stages": stages}],
+        "stages": stages
+    }
+    logger.success(f"流式转录完成 | {count} 个 token ({total_time}秒)")
+
+async def with_result_cache(
+    fileobj, keys_list: List[str], options: dict, use_cache: bool, compute: Callable[[Optional[str]], Awaitable[dict]]
+) -> dict:
+    """
+    命中缓存直接返回，否则执行 compute(缓存键) 并写入缓存；不使用缓存时缓存键为 None
+    缓存按 keys_list 隔离：只有携带相同 Key 的请求才能命中
+    """
+    if not (use_cache and result_cache.CACHE_ENABLED):
+        return await compute(None)
+    
+    started = time.monotonic()
+    key = result_cache.make_key(await result_cache.hash_file(fileobj), keys_list, **options)
+    cached = await result_cache.cache.get(key)
+    if cached is not None:
+        elapsed = round(time.monotonic() - started, 3)
+        logger.success(f"命中结果缓存 ({elapsed}秒)")
+        return {**cached, "processing_time": {"total": elapsed, "chunks": []}}
+    
+    result = await compute(key)
+    await result_cache.cache.put(key, result)
+    return result
+
+async def transcribe_path(
+    path: str,
+    keys_list: List[str],
+    enable_diarization: bool = False,
+    chunk_duration: float = 0,
+    normalize_audio: bool = False,
+    use_cache: bool = True,
+    on_stage: Optional[Callable[..., None]] = None
+) -> dict:
+    """转录本地文件：从磁盘流式上传，不经过本机 HTTP 服务，返回 TranscribeResponse 结构"""
+    reader = upstream.AsyncFileReader(path)
+    filename = os.path.basename(path)
+    try:
+        return await with_result_cache(
+            reader.file, keys_list, cache_options(enable_diarization, chunk_duration, normalize_audio), use_cache,
+            lambda cache_key: run_file_pipeline(
+                reader, filename, reader.size, keys_list, enable_diarization, chunk_duration, normalize_audio,
+                on_stage, recovery={"cache_key": cache_key}
+            )
+        )
+    finally:
+        await reader.close()
+
+async def start():
+    """
+    独立使用时启动共享上游连接池、打开共享状态和转录日志（FastAPI 服务由 lifespan 负责）
+
+    不恢复转录日志中遗留的条目，由后端服务启动时接管
+    """
+    await upstream.start()
+    shared_state.backend.open()
+    journal.store.open()
+
+async def stop():
+    """独立使用时退出：取消后台恢复任务（保留日志），停止轮询和连接池"""
+    journal.store.closing = True
+    await shutdown()
+    await watcher.shutdown()
+    await upstream.stop()
+    journal.store.close()
+    shared_state.backend.close()
@@ -0,0 +1,172 @@
+"""
+上游孤立对象清理
+按 next_page_cursor 分页列出 Soniox 上的转录和文件，找出创建时间早于 TTL、且没有进行中的转录
+（转录日志中的条目）引用的对象，限速并发删除，释放上游存储配额。
+只处理已结束（completed / error）的转录；仍在排队或处理中的转录及其文件一律保留
+"""
+
+import asyncio
+import os
+import time
+from typing import Dict, List, Optional, Set
+
+import httpx
+from loguru import logger
+
+import journal
+import meta_cache
+import metrics
+import upstream
+from keypool import mask_key
+
+# 定时清理的 API Key（逗号分隔），为空时只能通过 POST /api/cleanup 手动触发
+JANITOR_API_KEYS = [k.strip() for k in os.getenv("SONIOX_JANITOR_API_KEYS", "").split(",") if k.strip()]
+# 定时清理间隔（秒），0 表示关闭
+JANITOR_INTERVAL = float(os.getenv("SONIOX_JANITOR_INTERVAL", "3600"))
+# 创建超过该秒数的对象才会被清理
+JANITOR_TTL = float(os.getenv("SONIOX_JANITOR_TTL", str(24 * 3600)))
+# 同时进行的删除请求数 / 每秒最多删除请求数
+JANITOR_CONCURRENCY = int(os.getenv("SONIOX_JANITOR_CONCURRENCY", "4"))
+JANITOR_RATE = float(os.getenv("SONIOX_JANITOR_RATE", "10"))
+
+_FINISHED_STATUSES = ("completed", "error")
+
+
+class _RateLimiter:
+    """按固定间隔放行，每秒最多 rate 次（rate <= 0 不限速）"""
+
+    def __init__(self, rate: float):
+        self.interval = 1 / rate if rate > 0 else 0.0
+        self._next = 0.0
+        self._lock = asyncio.Lock()
+
+    async def wait(self):
+        async with self._lock:
+            now = time.monotonic()
+            delay = self._next - now
+            self._next = max(now, self._next) + self.interval
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+
+def _age(item: dict, now: float) -> Optional[float]:
+    """对象创建至今的秒数；created_at 无法解析时返回 None（不清理）"""
+    created_at = upstream.parse_time(item.get("created_at"))
+    return None if created_at is None else now - created_at.timestamp()
+
+
+async def _list_all(api_key: str, path: str, field: str) -> List[dict]:
+    items = []
+    async for page in upstream.iter_pages(api_key, path, field):
+        items.extend(page)
+    return items
+
+
+async def _delete_all(api_key: str, paths: List[str], concurrency: int, rate: float) -> Set[str]:
+    """并发限速删除，返回删除成功（或已不存在）的路径"""
+    client = upstream.get_client()
+    headers = upstream.auth_headers(api_key)
+    semaphore = asyncio.Semaphore(concurrency)
+    limiter = _RateLimiter(rate)
+    deleted: Set[str] = set()
+
+    async def delete(path: str):
+        async with semaphore:
+            await limiter.wait()
+            try:
+                resp = await client.delete(path, headers=headers)
+            except httpx.HTTPError as e:
+                logger.warning(f"清理失败: {path} | {type(e).__name__}: {e}")
+                return
+            if resp.status_code < 400 or resp.status_code == 404:
+                deleted.add(path)
+                await meta_cache.cache.invalidate(api_key, path, f"{path}/url")
+            else:
+                logger.warning(f"清理失败: {path} | {resp.status_code}")
+
+    await asyncio.gather(*(delete(path) for path in paths))
+    return deleted
+
+
+async def sweep(
+    api_key: str,
+    ttl: float = JANITOR_TTL,
+    dry_run: bool = False,
+    concurrency: int = JANITOR_CONCURRENCY,
+    rate: float = JANITOR_RATE
+) -> dict:
+    """
+    清理一个 Key 下的过期转录和文件，返回报告
+
+    先处理转录：过期、已结束、未被引用的删除，其余转录所用的文件一并保留；
+    再处理文件：过期、未被引用、不属于保留转录的删除。dry_run 时只统计不删除
+    """
+    started = time.monotonic()
+    now = time.time()
+    referenced = await journal.store.referenced()
+
+    transcriptions = await _list_all(api_key, "/transcriptions", "transcriptions")
+    expired_transcriptions: List[dict] = []
+    kept_files: Set[str] = set()
+    for item in transcriptions:
+        age = _age(item, now)
+        if (
+            age is not None and age > ttl
+            and item.get("status") in _FINISHED_STATUSES
+            and item["id"] not in referenced
+        ):
+            expired_transcriptions.append(item)
+        elif item.get("file_id"):
+            kept_files.add(item["file_id"])
+
+    files = await _list_all(api_key, "/files", "files")
+    expired_files: List[dict] = []
+    for item in files:
+        age = _age(item, now)
+        if age is not None and age > ttl and item["id"] not in referenced and item["id"] not in kept_files:
+            expired_files.append(item)
+
+    report: Dict[str, object] = {
+        "key": mask_key(api_key),
+        "dry_run": dry_run,
+        "ttl": ttl,
+        "transcriptions": {"scanned": len(transcriptions), "expired": len(expired_transcriptions), "deleted": 0, "failed": 0},
+        "files": {"scanned": len(files), "expired": len(expired_files), "deleted": 0, "failed": 0, "bytes": 0},
+    }
+    if not dry_run:
+        # 先删转录再删文件：转录仍在时 Soniox 可能拒绝删除其文件
+        for kind, items, prefix in (
+            ("transcriptions", expired_transcriptions, "/transcriptions/"),
+            ("files", expired_files, "/files/"),
+        ):
+            deleted = await _delete_all(api_key, [prefix + item["id"] for item in items], concurrency, rate)
+            counts = report[kind]
+            counts["deleted"] = len(deleted)
+            counts["failed"] = len(items) - len(deleted)
+            metrics.JANITOR_DELETED.inc(len(deleted), kind=kind)
+            if kind == "files":
+                freed = sum(item.get("size") or 0 for item in items if prefix + item["id"] in deleted)
+                counts["bytes"] = freed
+                metrics.JANITOR_FREED_BYTES.inc(freed)
+
+    report["elapsed"] = round(time.monotonic() - started, 3)
+    t, f = report["transcriptions"], report["files"]
+    logger.info(
+        f"孤立对象清理{'（试运行）' if dry_run else ''} | Key {mask_key(api_key)} | "
+        f"转录 {t['deleted']}/{t['expired']}/{t['scanned']} | 文件 {f['deleted']}/{f['expired']}/{f['scanned']} "
+        f"| 释放 {f['bytes'] / 1024 / 1024:.1f} MB | {report['elapsed']}秒"
+    )
+    return report
+
+
+async def run_forever(keys: List[str] = JANITOR_API_KEYS, interval: float = JANITOR_INTERVAL):
+    """后台任务：启动后立即清理一次，之后每 interval 秒清理一次"""
+    while True:
+        for api_key in keys:
+            try:
+                await sweep(api_key)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning(f"孤立对象清理失败: Key {mask_key(api_key)} | {type(e).__name__}: {e}")
+        await asyncio.sleep(interval)
@@ -0,0 +1,256 @@
+"""
+异步转录任务
+POST /jobs 立即返回任务 ID，流水线在后台运行；任务状态与结果保存在有容量上限、按 TTL 淘汰的进程内存储中。
+多 worker 时任务快照同步写入共享状态，查询请求落到其它 worker 也能取到状态、结果和进度事件
+"""
+
+import asyncio
+import os
+import time
+import uuid
+from collections import OrderedDict
+from typing import AsyncIterator, Awaitable, Callable, Dict, List, Optional
+
+from fastapi import HTTPException
+from loguru import logger
+
+import shared_state
+
+JOB_MAX = int(os.getenv("SONIOX_JOB_MAX", "1000"))
+# 任务结束后结果保留的秒数
+JOB_TTL = float(os.getenv("SONIOX_JOB_TTL", "3600"))
+# 共享状态中运行中任务快照的保留秒数（运行任务的 worker 异常退出后过期）
+JOB_RUNNING_TTL = float(os.getenv("SONIOX_JOB_RUNNING_TTL", str(24 * 3600)))
+# 查询其它 worker 的任务进度时轮询共享状态的间隔（秒）
+JOB_REMOTE_POLL = float(os.getenv("SONIOX_JOB_REMOTE_POLL", "0.5"))
+
+
+class Job:
+    """单个异步转录任务"""
+
+    def __init__(self, job_id: str, filename: str):
+        self.id = job_id
+        self.filename = filename
+        self.status = "queued"
+        self.stage = "queued"
+        self.result: Optional[dict] = None
+        self.error: Optional[str] = None
+        self.status_code: Optional[int] = None
+        self.created_at = time.time()
+        self.updated_at = self.created_at
+        self.finished_at: Optional[float] = None
+        self.events: List[dict] = [{"stage": "queued", "time": self.created_at}]
+        self._changed = asyncio.Event()
+        # 状态变化时调用（JobStore 写入共享状态）
+        self.on_change: Optional[Callable[["Job"], None]] = None
+
+    @property
+    def finished(self) -> bool:
+        return self.status in ("completed", "failed")
+
+    def record(self, stage: str, **info):
+        """记录阶段事件并唤醒订阅者"""
+        self.stage = stage
+        self.updated_at = time.time()
+        self.events.append({"stage": stage, "time": self.updated_at, **info})
+        changed, self._changed = self._changed, asyncio.Event()
+        changed.set()
+        if self.on_change is not None:
+            self.on_change(self)
+
+    def complete(self, result: dict):
+        self.status = "completed"
+        self.result = result
+        self.finished_at = time.time()
+        self.record("completed")
+
+    def fail(self, status_code: int, detail: str):
+        self.status = "failed"
+        self.status_code = status_code
+        self.error = detail
+        self.finished_at = time.time()
+        self.record("failed", status_code=status_code, error=detail)
+
+    async def follow(self, heartbeat: float = 15.0) -> AsyncIterator[Optional[dict]]:
+        """依次产出全部事件（含历史），任务结束后停止；空闲超过 heartbeat 秒产出 None 作为心跳"""
+        index = 0
+        while True:
+            while index < len(self.events):
+                yield self.events[index]
+                index += 1
+            if self.finished:
+                return
+            if not await self._wait_change(heartbeat):
+                yield None
+
+    async def _wait_change(self, timeout: float) -> bool:
+        """等待下一次状态变化，超时返回 False"""
+        try:
+            await asyncio.wait_for(self._changed.wait(), timeout=timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
+
+    def to_dict(self, include_result: bool = True) -> dict:
+        data = {
+            "id": self.id,
+            "status": self.status,
+            "stage": self.stage,
+            "filename": self.filename,
+            "created_at": self.created_at,
+            "updated_at": self.updated_at,
+            "events": self.events,
+            "error": self.error,
+        }
+        if include_result:
+            data["result"] = self.result
+        return data
+
+
+class RemoteJob(Job):
+    """其它 worker 运行的任务：由共享状态中的快照构造，follow 时轮询快照"""
+
+    def __init__(self, data: dict):
+        super().__init__(data["id"], data["filename"])
+        self._load(data)
+
+    def _load(self, data: dict):
+        self.status = data["status"]
+        self.stage = data["stage"]
+        self.created_at = data["created_at"]
+        self.updated_at = data["updated_at"]
+        self.events = data["events"]
+        self.error = data["error"]
+        self.result = data.get("result")
+
+    async def _wait_change(self, timeout: float) -> bool:
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            await asyncio.sleep(min(JOB_REMOTE_POLL, max(0.0, deadline - time.monotonic())))
+            data = await shared_state.backend.get("jobs", self.id)
+            if data is None:
+                # 快照已过期：按失败结束，避免订阅者一直等待
+                self.status = "failed"
+                self.events = self.events + [{"stage": "failed", "time": time.time(), "error": "任务记录已过期"}]
+                return True
+            if data["updated_at"] != self.updated_at:
+                self._load(data)
+                return True
+        return False
+
+
+class JobStore:
+    """进程内任务存储：最多保留 max_jobs 个任务，已结束任务 ttl 秒后淘汰"""
+
+    def __init__(self, max_jobs: int = JOB_MAX, ttl: float = JOB_TTL):
+        self.max_jobs = max_jobs
+        self.ttl = ttl
+        self._jobs: "OrderedDict[str, Job]" = OrderedDict()
+        self._tasks: Dict[str, asyncio.Task] = {}
+        # 正在写入共享状态的任务 ID -> 写入期间是否又有变化
+        self._publishing: Dict[str, bool] = {}
+        self._publish_tasks: Dict[str, asyncio.Task] = {}
+
+    def __len__(self) -> int:
+        return len(self._jobs)
+
+    def _evict(self):
+        now = time.time()
+        for job_id, job in list(self._jobs.items()):
+            if job.finished and job.finished_at + self.ttl < now:
+                del self._jobs[job_id]
+        # 超出容量时先淘汰最早结束的任务
+        if len(self._jobs) > self.max_jobs:
+            for job_id, job in list(self._jobs.items()):
+                if len(self._jobs) <= self.max_jobs:
+                    break
+                if job.finished:
+                    del self._jobs[job_id]
+
+    def ensure_capacity(self):
+        """容量已满（且都在运行中）时拒绝新任务"""
+        self._evict()
+        if len(self._jobs) >= self.max_jobs and all(not job.finished for job in self._jobs.values()):
+            raise HTTPException(status_code=503, detail="任务队列已满，请稍后重试")
+
+    def submit(self, filename: str, runner: Callable[[Job], Awaitable[dict]], job_id: Optional[str] = None) -> Job:
+        """创建任务并在后台运行 runner(job)；job_id 用于重启后以原 ID 恢复任务"""
+        self.ensure_capacity()
+        job = Job(job_id or uuid.uuid4().hex, filename)
+        self._jobs[job.id] = job
+        if shared_state.backend.shared:
+            job.on_change = self._publish
+            self._publish(job)
+        self._tasks[job.id] = asyncio.create_task(self._run(job, runner))
+        self._evict()
+        return job
+
+    def _publish(self, job: Job):
+        """把任务快照写入共享状态；写入期间的多次变化合并为一次后续写入"""
+        if job.id in self._publishing:
+            self._publishing[job.id] = True
+            return
+        self._publishing[job.id] = False
+        self._publish_tasks[job.id] = asyncio.ensure_future(self._flush(job))
+
+    async def _flush(self, job: Job):
+        try:
+            while True:
+                ttl = self.ttl if job.finished else JOB_RUNNING_TTL
+                await shared_state.backend.set("jobs", job.id, job.to_dict(), ttl=ttl)
+                if not self._publishing[job.id]:
+                    break
+                self._publishing[job.id] = False
+        except Exception as e:
+            logger.warning(f"任务快照写入共享状态失败: {job.id} | {type(e).__name__}: {e}")
+        finally:
+            del self._publishing[job.id]
+            self._publish_tasks.pop(job.id, None)
+
+    async def _run(self, job: Job, runner: Callable[[Job], Awaitable[dict]]):
+        job.status = "running"
+        try:
+            job.complete(await runner(job))
+            logger.success(f"任务完成: {job.id}")
+        except HTTPException as e:
+            job.fail(e.status_code, str(e.detail))
+            logger.error(f"任务失败: {job.id} | {e.status_code} {e.detail}")
+        except asyncio.CancelledError:
+            job.fail(503, "服务关闭，任务已取消")
+            raise
+        except Exception as e:
+            logger.exception(f"任务异常: {job.id} | {type(e).__name__}: {e}")
+            job.fail(500, str(e))
+        finally:
+            self._tasks.pop(job.id, None)
+
+    def counts(self) -> Dict[str, int]:
+        """按状态统计任务数"""
+        result = {status: 0 for status in ("queued", "running", "completed", "failed")}
+        for job in self._jobs.values():
+            result[job.status] += 1
+        return result
+
+    def get(self, job_id: str) -> Optional[Job]:
+        self._evict()
+        return self._jobs.get(job_id)
+
+    async def lookup(self, job_id: str) -> Optional[Job]:
+        """本进程的任务；多 worker 时再查共享状态中其它 worker 的任务"""
+        job = self.get(job_id)
+        if job is None and shared_state.backend.shared:
+            data = await shared_state.backend.get("jobs", job_id)
+            if data is not None:
+                job = RemoteJob(data)
+        return job
+
+    async def shutdown(self):
+        """应用关闭时取消运行中的任务，等待最后的快照写入共享状态"""
+        tasks = list(self._tasks.values())
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        await asyncio.gather(*self._publish_tasks.values(), return_exceptions=True)
+
+
+store = JobStore()
@@ -0,0 +1,246 @@
+"""
+上游转录日志
+每个上游转录（上传 → 创建 → 等待完成 → 获取结果 → 删除文件和转录）在本地 SQLite（WAL 模式）中
+记录一行：file_id、transcription_id、所用 Key 和当前阶段。上游清理完成后删除该行；
+进程重启（如容器 restart: always）后，启动时由服务继续等待未完成的转录、取回结果并清理上游，
+避免重新提交时重复付费，也不会在 Soniox 上留下孤立的文件和转录。
+多 worker 共用同一个日志文件：每行记录所属进程，进程存活期间持有自己的文件锁，
+启动时只接管锁已释放（进程已退出）的条目，不会重复恢复其它 worker 正在处理的转录
+"""
+
+import asyncio
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from typing import Dict, List, Optional, Set
+
+from loguru import logger
+
+try:
+    import fcntl
+except ImportError:
+    # 非 POSIX 平台没有 flock，无法判断其它进程是否存活，启动时接管全部条目（只支持单 worker）
+    fcntl = None
+
+# SQLite 文件路径，为空时不启用（只在内存中跟踪，重启后无法恢复）
+JOURNAL_PATH = os.getenv("SONIOX_JOURNAL_PATH", "")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS entries (
+    id TEXT PRIMARY KEY,
+    filename TEXT,
+    enable_diarization INTEGER NOT NULL,
+    cache_key TEXT,
+    job_id TEXT,
+    stage TEXT NOT NULL,
+    api_key TEXT,
+    file_id TEXT,
+    transcription_id TEXT,
+    audio_duration_ms INTEGER,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL,
+    owner TEXT
+)
+"""
+_COLUMNS = (
+    "id", "filename", "enable_diarization", "cache_key", "job_id", "stage", "api_key",
+    "file_id", "transcription_id", "audio_duration_ms", "created_at", "updated_at", "owner",
+)
+# update() 允许修改的字段
+_MUTABLE = {"stage", "api_key", "file_id", "transcription_id", "audio_duration_ms"}
+
+
+class Journal:
+    """
+    条目为普通 dict（字段同表结构），调用方持有并随进度 update；
+    未启用时只更新内存中的 dict，接口行为不变
+    """
+
+    def __init__(self, path: str = JOURNAL_PATH):
+        self.path = path
+        # 服务关闭中：被取消的转录保留日志，留待重启后恢复
+        self.closing = False
+        # 本进程写入的条目归属；进程存活期间持有 <path>.owners/<owner>.lock 的文件锁
+        self.owner = f"{os.getpid()}-{uuid.uuid4().hex[:8]}"
+        self._owner_fd: Optional[int] = None
+        self._conn: Optional[sqlite3.Connection] = None
+        # 尚未清理的条目（含未启用 SQLite 时），供孤立对象清理判断哪些上游 ID 仍在使用
+        self._live: Dict[str, dict] = {}
+        # 写入在线程池中执行，连接跨线程共享需要加锁
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return self._conn is not None
+
+    def open(self):
+        if not self.path or self._conn is not None:
+            return
+        directory = os.path.dirname(os.path.abspath(self.path))
+        os.makedirs(directory, exist_ok=True)
+        conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        # WAL：写入只追加日志，不阻塞读；NORMAL 在 WAL 下只在检查点 fsync，进程崩溃不丢数据
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute("PRAGMA busy_timeout=5000")
+        conn.execute(_SCHEMA)
+        columns = {row["name"] for row in conn.execute("PRAGMA table_info(entries)")}
+        if "owner" not in columns:
+            # 旧版本的日志文件
+            conn.execute("ALTER TABLE entries ADD COLUMN owner TEXT")
+        # 记录里有 API Key，只允许服务进程读写
+        os.chmod(self.path, 0o600)
+        self._conn = conn
+        self.closing = False
+        self._hold_owner_lock()
+        logger.info(f"转录日志已打开: {self.path}")
+
+    def close(self):
+        if self._conn is not None:
+            with self._lock:
+                self._conn.close()
+            self._conn = None
+        if self._owner_fd is not None:
+            os.close(self._owner_fd)
+            self._owner_fd = None
+
+    def _owner_lock_path(self, owner: str) -> str:
+        return os.path.join(f"{self.path}.owners", f"{owner}.lock")
+
+    def _hold_owner_lock(self):
+        if fcntl is None:
+            return
+        path = self._owner_lock_path(self.owner)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._owner_fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o600)
+        fcntl.flock(self._owner_fd, fcntl.LOCK_EX)
+
+    def _owner_alive(self, owner: Optional[str]) -> bool:
+        """owner 进程是否仍在运行：能拿到它的文件锁说明进程已退出"""
+        if not owner or fcntl is None:
+            return False
+        path = self._owner_lock_path(owner)
+        try:
+            fd = os.open(path, os.O_RDWR)
+        except FileNotFoundError:
+            return False
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            return True
+        finally:
+            os.close(fd)
+        try:
+            os.unlink(path)
+        except OSError:
+            pass
+        return False
+
+    def _claim(self) -> List[sqlite3.Row]:
+        """把已退出进程的条目改为归本进程所有，返回本进程的全部条目"""
+        owners = [row[0] for row in self._execute("SELECT DISTINCT owner FROM entries WHERE owner IS NOT ?", (self.owner,))]
+        for owner in owners:
+            if not self._owner_alive(owner):
+                # 按原 owner 条件更新：多个 worker 同时启动时只有一个能接管
+                self._execute("UPDATE entries SET owner = ? WHERE owner IS ?", (self.owner, owner))
+        return self._execute("SELECT * FROM entries WHERE owner = ? ORDER BY created_at", (self.owner,))
+
+    def _execute(self, sql: str, params: tuple = ()) -> List[sqlite3.Row]:
+        with self._lock:
+            return self._conn.execute(sql, params).fetchall()
+
+    async def _write(self, sql: str, params: tuple):
+        if self._conn is None:
+            return
+        try:
+            await asyncio.to_thread(self._execute, sql, params)
+        except sqlite3.Error as e:
+            # 日志只用于崩溃恢复，写入失败不影响当前转录
+            logger.warning(f"转录日志写入失败: {type(e).__name__}: {e}")
+
+    async def begin(
+        self,
+        filename: Optional[str],
+        enable_diarization: bool,
+        cache_key: Optional[str] = None,
+        job_id: Optional[str] = None
+    ) -> dict:
+        """
+        登记一个上游转录，返回条目
+
+        cache_key / job_id：重启后取回的结果写入该缓存键 / 以该 ID 恢复异步任务；都为空时只做清理
+        """
+        now = time.time()
+        entry = {
+            "id": uuid.uuid4().hex,
+            "filename": filename,
+            "enable_diarization": enable_diarization,
+            "cache_key": cache_key,
+            "job_id": job_id,
+            "stage": "uploading",
+            "api_key": None,
+            "file_id": None,
+            "transcription_id": None,
+            "audio_duration_ms": None,
+            "created_at": now,
+            "updated_at": now,
+            "owner": self.owner,
+        }
+        self._live[entry["id"]] = entry
+        await self._write(
+            f"INSERT INTO entries ({', '.join(_COLUMNS)}) VALUES ({', '.join('?' * len(_COLUMNS))})",
+            tuple(entry[column] for column in _COLUMNS)
+        )
+        return entry
+
+    async def update(self, entry: dict, **fields):
+        """更新阶段 / Key / 上游 ID"""
+        unknown = set(fields) - _MUTABLE
+        if unknown:
+            raise ValueError(f"不能修改的字段: {', '.join(sorted(unknown))}")
+        entry.update(fields, updated_at=time.time())
+        assignments = ", ".join(f"{name} = ?" for name in (*fields, "updated_at"))
+        await self._write(
+            f"UPDATE entries SET {assignments} WHERE id = ?",
+            (*fields.values(), entry["updated_at"], entry["id"])
+        )
+
+    async def finish(self, entry: dict):
+        """上游已清理，删除条目"""
+        entry["stage"] = "finished"
+        self._live.pop(entry["id"], None)
+        await self._write("DELETE FROM entries WHERE id = ?", (entry["id"],))
+
+    async def unfinished(self) -> List[dict]:
+        """已退出进程（上次运行或异常退出的 worker）遗留的条目，接管后按创建时间排序返回"""
+        if self._conn is None:
+            return []
+        rows = await asyncio.to_thread(self._claim)
+        entries = [dict(row) for row in rows]
+        for entry in entries:
+            entry["enable_diarization"] = bool(entry["enable_diarization"])
+            self._live[entry["id"]] = entry
+        return entries
+
+    async def referenced(self) -> Set[str]:
+        """进行中或待恢复的转录所用的上游文件 ID 和转录 ID（启用 SQLite 时包含其它 worker 的条目）"""
+        entries = list(self._live.values())
+        if self._conn is not None:
+            entries += await asyncio.to_thread(self._execute, "SELECT file_id, transcription_id FROM entries")
+        ids = set()
+        for entry in entries:
+            ids.update(i for i in (entry["file_id"], entry["transcription_id"]) if i)
+        return ids
+
+    async def count(self) -> int:
+        """日志条数（WAL 下可能等待其它 worker 的文件锁，在线程中查询）"""
+        if self._conn is None:
+            return 0
+        rows = await asyncio.to_thread(self._execute, "SELECT COUNT(*) FROM entries")
+        return rows[0][0]
+
+
+store = Journal()
@@ -0,0 +1,210 @@
+"""
+API Key 调度
+按进行中请求数选择负载最低的 Key；401/403/429/5xx 触发熔断冷却，冷却期内不再分配该 Key。
+多 worker 时熔断写入共享状态，各 worker 定期同步，一个 worker 发现 Key 失效后其它 worker 也不再分配
+"""
+
+import asyncio
+import hashlib
+import os
+import time
+from typing import Dict, Iterable, List, Optional, Set
+
+from loguru import logger
+
+import metrics
+import shared_state
+
+# 401/403：Key 无效或无权限，长时间冷却
+KEY_AUTH_COOLDOWN = float(os.getenv("SONIOX_KEY_AUTH_COOLDOWN", "300"))
+# 429：优先使用上游 Retry-After，否则按该值冷却
+KEY_RATE_LIMIT_COOLDOWN = float(os.getenv("SONIOX_KEY_RATE_LIMIT_COOLDOWN", "30"))
+# 5xx / 网络错误：连续失败达到阈值后冷却，之后每次再失败冷却时间翻倍
+KEY_FAILURE_THRESHOLD = int(os.getenv("SONIOX_KEY_FAILURE_THRESHOLD", "3"))
+KEY_ERROR_COOLDOWN = float(os.getenv("SONIOX_KEY_ERROR_COOLDOWN", "15"))
+KEY_MAX_COOLDOWN = float(os.getenv("SONIOX_KEY_MAX_COOLDOWN", "600"))
+
+# 换 Key 重试有意义的状态码（None 表示网络错误）
+RETRYABLE_STATUS = {None, 401, 402, 403, 408, 429, 500, 502, 503, 504}
+
+_MAX_TRACKED_KEYS = 1000
+_IDLE_EXPIRY = 3600.0
+
+
+def is_retryable(status_code: Optional[int]) -> bool:
+    return status_code in RETRYABLE_STATUS
+
+
+def mask_key(key: str) -> str:
+    """日志和报告中只显示 Key 前缀"""
+    return f"{key[:10]}..."
+
+
+class KeyState:
+    def __init__(self, key: str):
+        self.key = key
+        # 共享状态中只保存 Key 的摘要，指标标签用摘要前 12 位
+        self.digest = hashlib.sha256(key.encode()).hexdigest()
+        self.label = self.digest[:12]
+        self.in_flight = 0
+        self.successes = 0
+        self.failures = 0
+        self.consecutive_failures = 0
+        self.open_until = 0.0
+        # 其它 worker 记录的熔断截止时间（本进程 monotonic 时钟），每次同步时覆盖
+        self.shared_until = 0.0
+        self.last_status: Optional[int] = None
+        self.last_used = 0.0
+
+    @property
+    def cooldown_until(self) -> float:
+        return max(self.open_until, self.shared_until)
+
+    @property
+    def available(self) -> bool:
+        return time.monotonic() >= self.cooldown_until
+
+    def to_dict(self) -> dict:
+        return {
+            "key": mask_key(self.key),
+            "label": self.label,
+            "in_flight": self.in_flight,
+            "successes": self.successes,
+            "failures": self.failures,
+            "available": self.available,
+            "cooldown": max(0.0, round(self.cooldown_until - time.monotonic(), 1)),
+            "last_status": self.last_status,
+        }
+
+
+class KeyPool:
+    """所有请求共享的 Key 健康状态（Key 由每个请求自带，状态按 Key 字符串记录）"""
+
+    def __init__(self):
+        self._states: Dict[str, KeyState] = {}
+        # 写入共享状态的后台任务（保持引用，避免被回收）
+        self._publishing: Set[asyncio.Task] = set()
+
+    def _state(self, key: str) -> KeyState:
+        state = self._states.get(key)
+        if state is None:
+            if len(self._states) >= _MAX_TRACKED_KEYS:
+                self._prune()
+            state = self._states[key] = KeyState(key)
+        return state
+
+    def _prune(self):
+        now = time.monotonic()
+        for key, state in list(self._states.items()):
+            if state.in_flight == 0 and state.available and now - state.last_used > _IDLE_EXPIRY:
+                del self._states[key]
+
+    def acquire(self, keys: Iterable[str], exclude: Iterable[str] = ()) -> str:
+        """
+        从候选 Key 中选择一个并计入进行中请求数
+
+        优先未熔断的 Key，按 (进行中请求数, 连续失败数, 上次使用时间) 取最小；
+        全部熔断时选最早恢复的 Key 试探
+        """
+        excluded = set(exclude)
+        candidates = [self._state(k) for k in dict.fromkeys(keys) if k not in excluded]
+        if not candidates:
+            raise ValueError("没有可用的 API Key")
+
+        healthy = [s for s in candidates if s.available]
+        if healthy:
+            state = min(healthy, key=lambda s: (s.in_flight, s.consecutive_failures, s.last_used))
+        else:
+            state = min(candidates, key=lambda s: s.cooldown_until)
+            logger.warning(f"所有 Key 均在冷却中，试探 {mask_key(state.key)}")
+
+        state.in_flight += 1
+        state.last_used = time.monotonic()
+        return state.key
+
+    def release(self, key: str):
+        state = self._states.get(key)
+        if state is not None and state.in_flight > 0:
+            state.in_flight -= 1
+
+    def record(self, key: str, status_code: Optional[int], retry_after: Optional[str] = None):
+        """记录一次上游调用结果；status_code 为 None 表示网络错误"""
+        state = self._state(key)
+        state.last_status = status_code
+        if status_code is not None and status_code < 400:
+            state.successes += 1
+            metrics.KEY_RESULTS.inc(key=state.label, outcome="success")
+            state.consecutive_failures = 0
+            if state.cooldown_until:
+                self._publish(state.digest, None)
+            state.open_until = 0.0
+            state.shared_until = 0.0
+            return
+
+        state.failures += 1
+        state.consecutive_failures += 1
+        # 计数在记录时累加，不随抓取重建：Key 被清理后计数保留，other 也不会回落
+        metrics.KEY_RESULTS.inc(key=state.label if state.successes else "other", outcome="failure")
+        cooldown = 0.0
+        if status_code in (401, 403):
+            cooldown = KEY_AUTH_COOLDOWN
+        elif status_code == 429:
+            cooldown = KEY_RATE_LIMIT_COOLDOWN
+            if retry_after:
+                try:
+                    cooldown = float(retry_after)
+                except ValueError:
+                    pass
+        elif status_code is None or status_code >= 500:
+            over = state.consecutive_failures - KEY_FAILURE_THRESHOLD
+            if over >= 0:
+                cooldown = min(KEY_ERROR_COOLDOWN * (2 ** over), KEY_MAX_COOLDOWN)
+
+        if cooldown > 0:
+            state.open_until = time.monotonic() + cooldown
+            self._publish(state.digest, cooldown)
+            logger.warning(f"Key {mask_key(key)} 熔断 {cooldown:.0f}秒 (状态: {status_code})")
+
+    def _publish(self, digest: str, cooldown: Optional[float]):
+        """把熔断（cooldown 秒）或恢复（None）写入共享状态，供其它 worker 同步"""
+        if not shared_state.backend.shared:
+            return
+
+        async def write():
+            try:
+                if cooldown is None:
+                    await shared_state.backend.delete("keys", digest)
+                else:
+                    await shared_state.backend.set("keys", digest, {"open_until": time.time() + cooldown}, ttl=cooldown)
+            except Exception as e:
+                logger.warning(f"Key 状态写入共享状态失败: {type(e).__name__}: {e}")
+
+        task = asyncio.ensure_future(write())
+        self._publishing.add(task)
+        task.add_done_callback(self._publishing.discard)
+
+    async def sync(self):
+        """从共享状态读取其它 worker 记录的熔断"""
+        remote = await shared_state.backend.scan("keys")
+        offset = time.monotonic() - time.time()
+        for state in list(self._states.values()):
+            item = remote.get(state.digest)
+            state.shared_until = item["open_until"] + offset if item else 0.0
+
+    async def sync_forever(self, interval: float = shared_state.STATE_SYNC_INTERVAL):
+        """后台任务：多 worker 时定期同步熔断状态"""
+        while True:
+            try:
+                await self.sync()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning(f"Key 状态同步失败: {type(e).__name__}: {e}")
+            await asyncio.sleep(interval)
+
+    def snapshot(self, keys: Optional[Iterable[str]] = None) -> List[dict]:
+        states = self._states.values() if keys is None else [self._state(k) for k in keys]
+        return [s.to_dict() for s in states]
+
+
+pool = KeyPool()
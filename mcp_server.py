@@ -6,9 +6,31 @@ Soniox ASR MCP Server
 
 import asyncio
 import json
+import os
 import sys
-from typing import Any, Optional
+import time
+from typing import Any, Dict, List, Optional
 import httpx
+from fastapi import HTTPException
+from loguru import logger
+
+import engine
+import meta_cache
+import upstream
+
+# 调用方式：inprocess 在本进程内直接调用转录引擎（从磁盘流式上传到 Soniox，共用一个连接池）；
+# http 经由后端 API 服务（文件先上传到后端）
+MCP_ENGINE = os.getenv("SONIOX_MCP_ENGINE", "inprocess")
+# 后端 API 服务地址（http 模式；压测时可指向连接本地桩服务的后端）
+BACKEND_URL = os.getenv("SONIOX_BACKEND_URL", "http://localhost:8001").rstrip("/")
+# 同时处理的请求数，超出的请求排队
+MCP_MAX_CONCURRENCY = max(1, int(os.getenv("SONIOX_MCP_MAX_CONCURRENCY", "8")))
+# 单条 JSON-RPC 消息（一行）的最大字节数
+MCP_MAX_LINE_BYTES = 16 * 1024 * 1024
+
+# 进程内引擎的日志写到 stderr，stdout 只用于 MCP 协议消息
+logger.remove()
+logger.add(sys.stderr, format="[MCP] {time:HH:mm:ss} | {level: <8} | {message}", level=os.getenv("SONIOX_MCP_LOG_LEVEL", "INFO"))
 
 # MCP 协议消息
 def send_message(msg: dict):
@@ -35,6 +57,21 @@ TOOLS = [
             "required": ["file_path", "api_key"]
         }
     },
+    {
+        "name": "transcribe_batch",
+        "description": "批量转录多个音频/视频文件（服务端并发处理）",
+        "inputSchema": {
+            "type": "object",
+            "properties": {
+                "file_paths": {"type": "array", "items": {"type": "string"}, "description": "音频/视频文件路径列表"},
+                "api_key": {"type": "string", "description": "Soniox API Key，多个用逗号分隔"},
+                "enable_diarization": {"type": "boolean", "description": "是否启用说话人分离", "default": False},
+                "concurrency": {"type": "integer", "description": f"同时转录的文件数（上限 {engine.BATCH_MAX_CONCURRENCY}）", "default": engine.BATCH_CONCURRENCY},
+                "server_paths": {"type": "boolean", "description": "路径为后端服务器上的路径（相对 SONIOX_BATCH_PATH_ROOT），不上传文件", "default": False}
+            },
+            "required": ["file_paths", "api_key"]
+        }
+    },
     {
         "name": "list_files",
         "description": "列出已上传的文件",
@@ -128,8 +165,81 @@ async def handle_request(request: dict) -> dict:
 
 async def call_tool(name: str, args: dict) -> Any:
     """调用具体工具"""
+    if MCP_ENGINE == "inprocess":
+        return await _call_inprocess(name, args)
+    return await _call_backend(name, args)
+
+async def _upstream_request(method: str, path: str, api_key: str, params: Optional[dict] = None) -> httpx.Response:
+    response = await upstream.get_client().request(method, path, headers=upstream.auth_headers(api_key), params=params)
+    if response.status_code >= 400:
+        raise RuntimeError(f"{response.status_code}: {response.text}")
+    return response
+
+async def _call_inprocess(name: str, args: dict) -> Any:
+    """进程内模式：文件直接从磁盘流式上传到 Soniox，管理类工具直接请求上游，不经过后端 HTTP 服务"""
+    api_key = args.get("api_key") or ""
+    keys_list = engine.parse_api_keys(api_key)
+    enable_diarization = args.get("enable_diarization", False)
+    
+    if name == "transcribe_file":
+        return await engine.transcribe_path(args["file_path"], keys_list, enable_diarization)
+    
+    elif name == "transcribe_batch":
+        # 进程内模式下文件都从本机读取，server_paths 不影响路径解析
+        file_paths: List[str] = args["file_paths"]
+        # 与后端 /transcribe/batch 相同的并发上限
+        concurrency = min(int(args.get("concurrency", engine.BATCH_CONCURRENCY)), engine.BATCH_MAX_CONCURRENCY)
+        semaphore = asyncio.Semaphore(max(1, concurrency))
+        started = time.monotonic()
+        
+        async def run_item(index: int, path: str) -> dict:
+            filename = os.path.basename(path)
+            try:
+                async with semaphore:
+                    result = await engine.transcribe_path(path, keys_list, enable_diarization)
+                item = {"index": index, "filename": filename, "success": True, "result": result}
+            except HTTPException as e:
+                item = {"index": index, "filename": filename, "success": False, "status_code": e.status_code, "error": str(e.detail)}
+            except OSError:
+                item = {"index": index, "filename": filename, "success": False, "status_code": 404, "error": f"无法读取文件: {path}"}
+            except Exception as e:
+                log(f"批量转录异常: {filename} | {type(e).__name__}: {e}")
+                item = {"index": index, "filename": filename, "success": False, "status_code": 500, "error": str(e)}
+            log(f"批量转录: {filename} {'完成' if item['success'] else '失败'}")
+            return item
+        
+        results = await asyncio.gather(*(run_item(i, path) for i, path in enumerate(file_paths)))
+        succeeded = sum(item["success"] for item in results)
+        return {
+            "done": True, "total": len(results), "succeeded": succeeded, "failed": len(results) - succeeded,
+            "elapsed": round(time.monotonic() - started, 3), "results": list(results)
+        }
+    
+    elif name == "list_files":
+        return (await _upstream_request("GET", "/files", api_key, {"limit": args.get("limit", 10)})).json()
+    
+    elif name == "list_transcriptions":
+        return (await _upstream_request("GET", "/transcriptions", api_key, {"limit": args.get("limit", 10)})).json()
+    
+    elif name == "list_models":
+        return await meta_cache.cache.get_json(api_key, "/models", "models", meta_cache.models_ttl)
+    
+    elif name == "delete_file":
+        await _upstream_request("DELETE", f"/files/{args['file_id']}", api_key)
+        await meta_cache.cache.invalidate_file(api_key, args["file_id"])
+        return {"success": True, "message": "文件已删除"}
+    
+    elif name == "delete_transcription":
+        await _upstream_request("DELETE", f"/transcriptions/{args['transcription_id']}", api_key)
+        await meta_cache.cache.invalidate_transcription(api_key, args["transcription_id"])
+        return {"success": True, "message": "转录已删除"}
+    
+    raise ValueError(f"未知工具: {name}")
+
+async def _call_backend(name: str, args: dict) -> Any:
+    """http 模式：经由后端 API 服务"""
     api_key = args.get("api_key")
-    base_url = "http://localhost:8001"
+    base_url = BACKEND_URL
     
     if name == "transcribe_file":
         file_path = args["file_path"]
@@ -143,6 +253,42 @@ async def call_tool(name: str, args: dict) -> Any:
                 response = await client.post(f"{base_url}/transcribe", files=files, data=data)
                 return response.json()
     
+    elif name == "transcribe_batch":
+        file_paths = args["file_paths"]
+        data = {
+            "api_keys": api_key,
+            "enable_diarization": args.get("enable_diarization", False),
+            "concurrency": args.get("concurrency", 8)
+        }
+        handles = []
+        try:
+            if args.get("server_paths", False):
+                data["paths"] = file_paths
+                files = None
+            else:
+                handles = [open(path, "rb") for path in file_paths]
+                files = [("files", (os.path.basename(path), f)) for path, f in zip(file_paths, handles)]
+            results = []
+            summary = {}
+            async with httpx.AsyncClient(timeout=None) as client:
+                async with client.stream("POST", f"{base_url}/transcribe/batch", files=files, data=data) as response:
+                    if response.status_code != 200:
+                        raise RuntimeError(f"批量转录失败: {response.status_code} {(await response.aread()).decode()}")
+                    async for line in response.aiter_lines():
+                        if not line:
+                            continue
+                        item = json.loads(line)
+                        if item.get("done"):
+                            summary = item
+                        else:
+                            log(f"批量转录: {item['filename']} {'完成' if item['success'] else '失败'}")
+                            results.append(item)
+            results.sort(key=lambda item: item["index"])
+            return {**summary, "results": results}
+        finally:
+            for f in handles:
+                f.close()
+    
     elif name == "list_files":
         async with httpx.AsyncClient() as client:
             response = await client.get(f"{base_url}/api/files", params={"api_key": api_key, "limit": args.get("limit", 10)})
@@ -170,36 +316,119 @@ async def call_tool(name: str, args: dict) -> Any:
     
     raise ValueError(f"未知工具: {name}")
 
+async def _stdin_lines():
+    """异步逐行读取 stdin；管道用事件循环读取，不支持时（如 Windows、重定向自普通文件）改为线程中读取"""
+    loop = asyncio.get_running_loop()
+    reader = asyncio.StreamReader(limit=MCP_MAX_LINE_BYTES)
+    try:
+        await loop.connect_read_pipe(lambda: asyncio.StreamReaderProtocol(reader), sys.stdin)
+    except (NotImplementedError, ValueError, OSError):
+        while True:
+            line = await loop.run_in_executor(None, sys.stdin.readline)
+            if not line:
+                return
+            yield line
+    else:
+        async for line in _read_lines(reader):
+            yield line
+
+async def _read_lines(reader: asyncio.StreamReader):
+    """逐行读取；超过 reader 上限的行整行丢弃（读到下一个换行为止），不把剩余部分当作新消息"""
+    while True:
+        try:
+            line = await reader.readuntil(b"\n")
+        except asyncio.IncompleteReadError as e:
+            # 输入结束：最后一行可能没有换行
+            line = e.partial
+        except asyncio.LimitOverrunError:
+            log(f"消息超过 {MCP_MAX_LINE_BYTES} 字节，已丢弃")
+            await _discard_line(reader)
+            continue
+        if not line:
+            return
+        yield line.decode("utf-8")
+
+async def _discard_line(reader: asyncio.StreamReader):
+    while True:
+        try:
+            await reader.readuntil(b"\n")
+            return
+        except asyncio.LimitOverrunError as e:
+            await reader.readexactly(e.consumed)
+        except asyncio.IncompleteReadError:
+            return
+
+async def _dispatch(request: dict, semaphore: asyncio.Semaphore):
+    """处理单个请求并按完成顺序写回响应；被取消的请求不再响应"""
+    request_id = request.get("id")
+    try:
+        async with semaphore:
+            response = await handle_request(request)
+        send_message({"jsonrpc": "2.0", "id": request_id, "result": response})
+    except asyncio.CancelledError:
+        log(f"请求已取消: {request_id}")
+    except Exception as e:
+        log(f"处理错误: {e}")
+        send_message({"jsonrpc": "2.0", "id": request_id, "error": {"code": -32603, "message": str(e)}})
+
 async def main():
-    """MCP 服务器主循环"""
-    log("Soniox ASR MCP Server 启动")
+    """MCP 服务器入口：进程内模式在处理请求前启动转录引擎，退出时停止"""
+    if MCP_ENGINE == "inprocess":
+        log(f"Soniox ASR MCP Server 启动 | 进程内引擎 | 上游 {upstream.SONIOX_API_BASE} | 并发上限 {MCP_MAX_CONCURRENCY}")
+        await engine.start()
+    else:
+        log(f"Soniox ASR MCP Server 启动 | 后端 {BACKEND_URL} | 并发上限 {MCP_MAX_CONCURRENCY}")
+    try:
+        await _serve()
+    finally:
+        if MCP_ENGINE == "inprocess":
+            await engine.stop()
+
+async def _serve():
+    """
+    MCP 服务器主循环
+
+    每个请求作为独立任务并发处理（最多 MCP_MAX_CONCURRENCY 个同时运行，其余排队），
+    长时间的转录不会阻塞其它工具调用；响应按完成顺序写出，由 id 对应请求。
+    支持 notifications/cancelled 取消进行中或排队中的请求
+    """
+    semaphore = asyncio.Semaphore(MCP_MAX_CONCURRENCY)
+    inflight: Dict[Any, asyncio.Task] = {}
     
-    while True:
+    async for line in _stdin_lines():
+        if not line.strip():
+            continue
         try:
-            line = sys.stdin.readline()
-            if not line:
-                break
-            
             request = json.loads(line)
-            log(f"收到请求: {request.get('method')}")
-            
-            response = await handle_request(request)
-            
-            send_message({
-                "jsonrpc": "2.0",
-                "id": request.get("id"),
-                "result": response
-            })
-            
         except json.JSONDecodeError:
             log("JSON 解析错误")
-        except Exception as e:
-            log(f"处理错误: {e}")
-            send_message({
-                "jsonrpc": "2.0",
-                "id": request.get("id") if 'request' in locals() else None,
-                "error": {"code": -32603, "message": str(e)}
-            })
+            send_message({"jsonrpc": "2.0", "id": None, "error": {"code": -32700, "message": "Parse error"}})
+            continue
+        
+        method = request.get("method")
+        if "id" not in request:
+            # 通知：不需要响应
+            if method == "notifications/cancelled":
+                request_id = (request.get("params") or {}).get("requestId")
+                task = inflight.get(request_id)
+                if task is not None:
+                    task.cancel()
+            else:
+                log(f"收到通知: {method}")
+            continue
+        
+        request_id = request["id"]
+        log(f"收到请求: {method} ({request_id})")
+        if request_id in inflight:
+            send_message({"jsonrpc": "2.0", "id": request_id, "error": {"code": -32600, "message": f"请求 id 重复: {request_id}"}})
+            continue
+        task = asyncio.create_task(_dispatch(request, semaphore))
+        inflight[request_id] = task
+        task.add_done_callback(lambda _, request_id=request_id: inflight.pop(request_id, None))
+    
+    # stdin 关闭后等待进行中的请求写完响应
+    if inflight:
+        await asyncio.gather(*inflight.values(), return_exceptions=True)
 
 if __name__ == "__main__":
     asyncio.run(main())
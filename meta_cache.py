@@ -0,0 +1,157 @@
+"""
+元数据响应缓存
+/api/models、/api/files/{id}、/api/files/{id}/url、/api/transcriptions/{id} 的上游响应按 (API Key, 路径) 短时缓存：
+各接口 TTL 不同（签名下载链接按 expires_at 过期），同一键的并发未命中合并为一次上游请求，
+对应的 DELETE 接口（以及服务自身的清理）删除对象时失效。
+多 worker 时缓存项保存在共享状态中，任一 worker 删除对象后所有 worker 都不再返回旧数据
+"""
+
+import asyncio
+import hashlib
+import os
+import time
+from collections import OrderedDict
+from typing import Callable, Dict, Tuple
+
+from fastapi import HTTPException
+
+import metrics
+import shared_state
+import upstream
+
+
+def _env_bool(name: str, default: bool) -> bool:
+    value = os.getenv(name)
+    if value is None:
+        return default
+    return value.strip().lower() not in ("0", "false", "no", "off", "")
+
+
+META_CACHE_ENABLED = _env_bool("SONIOX_META_CACHE_ENABLED", True)
+META_CACHE_ITEMS = int(os.getenv("SONIOX_META_CACHE_ITEMS", "2048"))
+# 各接口 TTL（秒）
+MODELS_TTL = float(os.getenv("SONIOX_META_MODELS_TTL", "3600"))
+FILE_TTL = float(os.getenv("SONIOX_META_FILE_TTL", "60"))
+# 已结束（completed / error）的转录不再变化；排队/处理中的转录状态会变，只缓存很短时间
+TRANSCRIPTION_TTL = float(os.getenv("SONIOX_META_TRANSCRIPTION_TTL", "60"))
+TRANSCRIPTION_PENDING_TTL = float(os.getenv("SONIOX_META_TRANSCRIPTION_PENDING_TTL", "2"))
+# 下载链接在 expires_at 前这么多秒失效，保证返回给客户端的链接还有可用时间
+URL_EXPIRY_MARGIN = float(os.getenv("SONIOX_META_URL_EXPIRY_MARGIN", "60"))
+URL_MAX_TTL = float(os.getenv("SONIOX_META_URL_MAX_TTL", "3600"))
+
+
+def models_ttl(data: dict) -> float:
+    return MODELS_TTL
+
+
+def file_ttl(data: dict) -> float:
+    return FILE_TTL
+
+
+def transcription_ttl(data: dict) -> float:
+    return TRANSCRIPTION_TTL if data.get("status") in ("completed", "error") else TRANSCRIPTION_PENDING_TTL
+
+
+def url_ttl(data: dict) -> float:
+    """签名链接缓存到 expires_at 前 URL_EXPIRY_MARGIN 秒；没有 expires_at 时按文件详情 TTL"""
+    expires_at = upstream.parse_time(data.get("expires_at"))
+    if expires_at is None:
+        return FILE_TTL
+    return min(expires_at.timestamp() - time.time() - URL_EXPIRY_MARGIN, URL_MAX_TTL)
+
+
+def _key(api_key: str, path: str) -> Tuple[str, str]:
+    # 只保存 Key 的摘要
+    return hashlib.sha256(api_key.encode()).hexdigest(), path
+
+
+class MetaCache:
+    """
+    进程内 LRU：键为 (Key 摘要, 上游路径)，值为 (过期时间, JSON)；只缓存 200 响应
+
+    共享状态后端为多进程共享时不使用进程内 LRU，缓存项存到共享状态的 meta 命名空间
+    """
+
+    def __init__(self, max_items: int = META_CACHE_ITEMS, enabled: bool = META_CACHE_ENABLED):
+        self.max_items = max_items
+        self.enabled = enabled
+        self._items: "OrderedDict[Tuple[str, str], Tuple[float, dict]]" = OrderedDict()
+        self._inflight: Dict[Tuple[str, str], asyncio.Task] = {}
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+    async def get_json(self, api_key: str, path: str, endpoint: str, ttl: Callable[[dict], float]) -> dict:
+        """
+        GET 上游 path 的 JSON；命中缓存直接返回，同一键并发未命中只请求一次上游
+
+        ttl(data) 返回该响应的缓存秒数（<= 0 不缓存）；非 200 响应抛出 HTTPException，不缓存
+        """
+        if not self.enabled:
+            return await _fetch(api_key, path)
+        key = _key(api_key, path)
+        if shared_state.backend.shared:
+            data = await shared_state.backend.get("meta", ":".join(key))
+            if data is not None:
+                metrics.META_CACHE_EVENTS.inc(endpoint=endpoint, event="hit")
+                return data
+        cached = self._items.get(key)
+        if cached is not None:
+            if cached[0] > time.monotonic():
+                self._items.move_to_end(key)
+                metrics.META_CACHE_EVENTS.inc(endpoint=endpoint, event="hit")
+                return cached[1]
+            del self._items[key]
+
+        task = self._inflight.get(key)
+        if task is None:
+            metrics.META_CACHE_EVENTS.inc(endpoint=endpoint, event="miss")
+            task = self._inflight[key] = asyncio.ensure_future(self._load(key, api_key, path, ttl))
+            # 等待者都已断开时，异常由这里取回
+            task.add_done_callback(lambda t: t.cancelled() or t.exception())
+        else:
+            metrics.META_CACHE_EVENTS.inc(endpoint=endpoint, event="coalesced")
+        # 发起请求的客户端断开时不取消上游请求，其它等待者照常拿到结果
+        return await asyncio.shield(task)
+
+    async def _load(self, key: Tuple[str, str], api_key: str, path: str, ttl: Callable[[dict], float]) -> dict:
+        try:
+            data = await _fetch(api_key, path)
+            seconds = ttl(data)
+            # 请求期间被 invalidate 的键不写回
+            if seconds > 0 and self._inflight.get(key) is asyncio.current_task():
+                if shared_state.backend.shared:
+                    await shared_state.backend.set("meta", ":".join(key), data, ttl=seconds)
+                else:
+                    self._items[key] = (time.monotonic() + seconds, data)
+                    if len(self._items) > self.max_items:
+                        self._items.popitem(last=False)
+            return data
+        finally:
+            if self._inflight.get(key) is asyncio.current_task():
+                del self._inflight[key]
+
+    async def invalidate(self, api_key: str, *paths: str):
+        """删除对象后调用：移除这些路径的缓存，进行中的请求结果也不再写回"""
+        digest = _key(api_key, "")[0]
+        for path in paths:
+            self._items.pop((digest, path), None)
+            self._inflight.pop((digest, path), None)
+        if shared_state.backend.shared:
+            await shared_state.backend.delete("meta", *(f"{digest}:{path}" for path in paths))
+
+    async def invalidate_file(self, api_key: str, file_id: str):
+        await self.invalidate(api_key, f"/files/{file_id}", f"/files/{file_id}/url")
+
+    async def invalidate_transcription(self, api_key: str, transcription_id: str):
+        await self.invalidate(api_key, f"/transcriptions/{transcription_id}")
+
+
+async def _fetch(api_key: str, path: str) -> dict:
+    response = await upstream.get_client().get(path, headers=upstream.auth_headers(api_key))
+    if response.status_code != 200:
+        raise HTTPException(status_code=response.status_code, detail=response.text)
+    return response.json()
+
+
+cache = MetaCache()
@@ -0,0 +1,220 @@
+"""
+Prometheus 文本格式指标
+轻量实现 Counter / Gauge / Histogram，GET /metrics 输出；
+另可注册采集函数，在抓取时从 keypool、结果缓存等模块读取当前值
+"""
+
+import asyncio
+import math
+import re
+import time
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+LabelValues = Tuple[str, ...]
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600, 1800)
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: Optional[Tuple[str, str]] = None) -> str:
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        pairs.append(f'{extra[0]}="{extra[1]}"')
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class _Metric:
+    type = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        REGISTRY.append(self)
+
+    def _key(self, labels: Dict[str, str]) -> LabelValues:
+        return tuple(str(labels.get(n, "")) for n in self.labelnames)
+
+    def clear(self):
+        """删除全部标签组合（采集函数用：标签集合在每次抓取时重建，已不存在的对象不再输出）"""
+        self._values.clear()
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.type}"]
+        lines.extend(self._samples())
+        return lines
+
+    def _samples(self) -> Iterable[str]:
+        raise NotImplementedError
+
+
+class Counter(_Metric):
+    type = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        # 无标签时从 0 开始输出，便于告警规则直接引用
+        self._values: Dict[LabelValues, float] = {} if self.labelnames else {(): 0.0}
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        self._values[key] = self._values.get(key, 0.0) + amount
+
+    def set_total(self, value: float, **labels):
+        """采集函数用：同步其它模块维护的累计值"""
+        self._values[self._key(labels)] = value
+
+    def _samples(self) -> Iterable[str]:
+        for key, value in self._values.items():
+            yield f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}"
+
+
+class Gauge(_Metric):
+    type = "gauge"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        # 无标签时从 0 开始输出，便于告警规则直接引用
+        self._values: Dict[LabelValues, float] = {} if self.labelnames else {(): 0.0}
+
+    def set(self, value: float, **labels):
+        self._values[self._key(labels)] = value
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        self._values[key] = self._values.get(key, 0.0) + amount
+
+    def dec(self, amount: float = 1, **labels):
+        self.inc(-amount, **labels)
+
+    def _samples(self) -> Iterable[str]:
+        for key, value in self._values.items():
+            yield f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}"
+
+
+class Histogram(_Metric):
+    type = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets)) + (math.inf,)
+        # 每组标签：[各桶计数..., 总和, 总数]
+        self._values: Dict[LabelValues, List[float]] = {}
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        state = self._values.get(key)
+        if state is None:
+            state = self._values[key] = [0.0] * (len(self.buckets) + 2)
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                state[i] += 1
+                break
+        state[-2] += value
+        state[-1] += 1
+
+    def _samples(self) -> Iterable[str]:
+        for key, state in self._values.items():
+            cumulative = 0.0
+            for i, bound in enumerate(self.buckets):
+                cumulative += state[i]
+                labels = _format_labels(self.labelnames, key, ("le", _format_value(bound)))
+                yield f"{self.name}_bucket{labels} {_format_value(cumulative)}"
+            labels = _format_labels(self.labelnames, key)
+            yield f"{self.name}_sum{labels} {_format_value(state[-2])}"
+            yield f"{self.name}_count{labels} {_format_value(state[-1])}"
+
+
+REGISTRY: List[_Metric] = []
+# 抓取时调用，用于从其它模块同步当前值（如 Gauge.set）
+_collectors: List[Callable[[], None]] = []
+
+
+def register_collector(fn: Callable[[], None]):
+    _collectors.append(fn)
+
+
+def render() -> str:
+    for collect in _collectors:
+        collect()
+    lines: List[str] = []
+    for metric in REGISTRY:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+_ID_SEGMENT = re.compile(r"/[0-9a-fA-F-]{16,}(?=/|$)")
+
+
+def endpoint_label(path: str) -> str:
+    """上游路径中的 ID 替换为 {id}，避免标签基数爆炸"""
+    return _ID_SEGMENT.sub("/{id}", path)
+
+
+# ==================== 指标定义 ====================
+
+PIPELINE_STAGE_SECONDS = Histogram(
+    "soniox_pipeline_stage_seconds", "文件转录各阶段耗时（upload / create / poll / fetch）", ["stage"]
+)
+UPSTREAM_REQUEST_SECONDS = Histogram(
+    "soniox_upstream_request_seconds", "Soniox REST 请求耗时（到收到响应头）", ["method", "endpoint", "status"]
+)
+UPLOAD_BYTES = Counter("soniox_upload_bytes_total", "上传到 Soniox 的音频字节数")
+
+WS_ACTIVE_SESSIONS = Gauge("soniox_ws_active_sessions", "进行中的 WebSocket 实时转录会话数")
+WS_AUDIO_CHUNKS = Counter("soniox_ws_audio_chunks_total", "转发到 Soniox 的音频块总数")
+WS_RESPONSES = Counter("soniox_ws_responses_total", "转发到客户端的 Soniox 响应总数")
+WS_BACKPRESSURE = Counter(
+    "soniox_ws_backpressure_total", "转发缓冲到达高水位、暂停读取发送方的次数", ["direction"]
+)
+WS_SESSION_AUDIO_CHUNKS = Histogram(
+    "soniox_ws_session_audio_chunks", "每个会话转发的音频块数", buckets=(10, 100, 1000, 10000, 100000, 1000000)
+)
+WS_SESSION_RESPONSES = Histogram(
+    "soniox_ws_session_responses", "每个会话转发的响应数", buckets=(10, 100, 1000, 10000, 100000, 1000000)
+)
+WS_SESSION_SECONDS = Histogram("soniox_ws_session_seconds", "WebSocket 会话时长")
+
+KEY_IN_FLIGHT = Gauge("soniox_key_in_flight", "各 API Key 进行中的请求数", ["key"])
+KEY_AVAILABLE = Gauge("soniox_key_available", "各 API Key 是否可用（0 表示熔断冷却中）", ["key"])
+KEY_RESULTS = Counter("soniox_key_results_total", "各 API Key 累计成功/失败次数", ["key", "outcome"])
+
+CACHE_EVENTS = Counter("soniox_cache_events_total", "结果缓存事件数（memory_hits / disk_hits / shared_hits / misses / stores / evictions）", ["event"])
+CACHE_ITEMS = Gauge("soniox_cache_items", "结果缓存条目数", ["tier"])
+META_CACHE_EVENTS = Counter(
+    "soniox_meta_cache_events_total", "元数据响应缓存事件数（hit / miss / coalesced）", ["endpoint", "event"]
+)
+JOBS = Gauge("soniox_jobs", "异步任务数", ["status"])
+WATCHER_PENDING = Gauge("soniox_watcher_pending_transcriptions", "监视器中等待完成的转录数")
+ADMISSION_ACTIVE = Gauge("soniox_admission_active", "已接纳、正在运行的请求数（transcribe / session）", ["kind"])
+ADMISSION_QUEUE = Gauge("soniox_admission_queue_depth", "准入等待队列长度", ["kind"])
+ADMISSION_WAIT_SECONDS = Histogram(
+    "soniox_admission_wait_seconds", "准入排队等待时间", ["kind"], buckets=(0.001, 0.01, 0.1, 0.5, 1, 2.5, 5, 10, 30, 60, 300)
+)
+ADMISSION_REJECTED = Counter("soniox_admission_rejected_total", "准入拒绝次数（client_limit / queue_full / timeout）", ["kind", "reason"])
+JOURNAL_ENTRIES = Gauge("soniox_journal_entries", "转录日志中尚未清理的上游转录数")
+JANITOR_DELETED = Counter("soniox_janitor_deleted_total", "孤立对象清理删除的上游对象数", ["kind"])
+JANITOR_FREED_BYTES = Counter("soniox_janitor_freed_bytes_total", "孤立对象清理释放的上游文件字节数")
+
+EVENT_LOOP_LAG_SECONDS = Histogram(
+    "soniox_event_loop_lag_seconds", "事件循环调度延迟", buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5)
+)
+
+
+async def monitor_event_loop(interval: float = 0.5):
+    """后台任务：定时 sleep，实际唤醒时间与预期的差值即事件循环延迟"""
+    while True:
+        start = time.monotonic()
+        await asyncio.sleep(interval)
+        EVENT_LOOP_LAG_SECONDS.observe(max(0.0, time.monotonic() - start - interval))
@@ -0,0 +1,74 @@
+"""
+转录状态轮询调度
+开始时快速轮询，之后按指数退避（带随机抖动）放慢，间隔上限随音频时长自适应，并有总超时
+"""
+
+import os
+import random
+import time
+from typing import Optional
+
+POLL_INITIAL_INTERVAL = float(os.getenv("SONIOX_POLL_INITIAL", "0.5"))
+POLL_MAX_INTERVAL = float(os.getenv("SONIOX_POLL_MAX", "15"))
+POLL_BACKOFF_FACTOR = float(os.getenv("SONIOX_POLL_FACTOR", "1.5"))
+POLL_JITTER = float(os.getenv("SONIOX_POLL_JITTER", "0.2"))
+# 快速阶段：前几秒按初始间隔轮询，短音频能尽快拿到结果
+POLL_FAST_WINDOW = float(os.getenv("SONIOX_POLL_FAST_WINDOW", "3"))
+# 间隔上限 = 音频时长 × 该比例（再限制在 [初始间隔, 最大间隔] 内）
+POLL_DURATION_RATIO = float(os.getenv("SONIOX_POLL_DURATION_RATIO", "0.01"))
+POLL_DEADLINE = float(os.getenv("SONIOX_POLL_DEADLINE", "3600"))
+
+
+class PollSchedule:
+    """单个转录任务的轮询间隔计算"""
+
+    def __init__(
+        self,
+        audio_duration_ms: Optional[int] = None,
+        initial: float = POLL_INITIAL_INTERVAL,
+        max_interval: float = POLL_MAX_INTERVAL,
+        factor: float = POLL_BACKOFF_FACTOR,
+        jitter: float = POLL_JITTER,
+        fast_window: float = POLL_FAST_WINDOW,
+        deadline: float = POLL_DEADLINE,
+    ):
+        self.initial = initial
+        self.max_interval = max_interval
+        self.factor = factor
+        self.jitter = jitter
+        self.fast_window = fast_window
+        self.deadline = deadline
+        self.audio_duration_ms = audio_duration_ms
+        self.started = time.monotonic()
+        self.attempts = 0
+        self._backoff_steps = 0
+
+    @property
+    def elapsed(self) -> float:
+        return time.monotonic() - self.started
+
+    @property
+    def expired(self) -> bool:
+        return self.elapsed >= self.deadline
+
+    def update(self, audio_duration_ms: Optional[int]):
+        """状态响应中拿到音频时长后更新"""
+        if audio_duration_ms:
+            self.audio_duration_ms = audio_duration_ms
+
+    def _cap(self) -> float:
+        if not self.audio_duration_ms:
+            return self.max_interval
+        scaled = self.audio_duration_ms / 1000.0 * POLL_DURATION_RATIO
+        return min(self.max_interval, max(self.initial, scaled))
+
+    def next_delay(self) -> float:
+        """下一次轮询前的等待秒数（不超过剩余总时长）"""
+        self.attempts += 1
+        if self.elapsed < self.fast_window:
+            delay = self.initial
+        else:
+            delay = min(self.initial * (self.factor ** self._backoff_steps), self._cap())
+            self._backoff_steps += 1
+            delay *= 1 + random.uniform(-self.jitter, self.jitter)
+        return max(0.0, min(delay, self.deadline - self.elapsed))
@@ -0,0 +1,231 @@
+"""
+转录结果缓存
+以音频内容哈希 + API Key 摘要 + 转录参数为键（结果只对提交时使用的 Key 可见）：内存 LRU 一级缓存，可选磁盘二级缓存（按总大小淘汰、TTL 过期）。
+多 worker 时磁盘缓存目录由各 worker 共用；未配置磁盘缓存时二级缓存改用共享状态
+"""
+
+import asyncio
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from typing import BinaryIO, Dict, Iterable, Optional, Tuple
+
+from loguru import logger
+
+import shared_state
+
+
+def _env_bool(name: str, default: bool) -> bool:
+    value = os.getenv(name)
+    if value is None:
+        return default
+    return value.strip().lower() not in ("0", "false", "no", "off", "")
+
+
+CACHE_ENABLED = _env_bool("SONIOX_CACHE_ENABLED", True)
+CACHE_TTL = float(os.getenv("SONIOX_CACHE_TTL", str(7 * 24 * 3600)))
+CACHE_MEMORY_ITEMS = int(os.getenv("SONIOX_CACHE_MEMORY_ITEMS", "128"))
+# 为空时不启用磁盘缓存
+CACHE_DIR = os.getenv("SONIOX_CACHE_DIR", "")
+CACHE_DISK_MAX_BYTES = int(os.getenv("SONIOX_CACHE_DISK_MAX_MB", "1024")) * 1024 * 1024
+
+_HASH_CHUNK = 1024 * 1024
+
+
+def _hash_fileobj(fileobj: BinaryIO) -> str:
+    digest = hashlib.sha256()
+    fileobj.seek(0)
+    while True:
+        chunk = fileobj.read(_HASH_CHUNK)
+        if not chunk:
+            break
+        digest.update(chunk)
+    fileobj.seek(0)
+    return digest.hexdigest()
+
+
+async def hash_file(fileobj: BinaryIO) -> str:
+    """流式计算文件内容的 SHA-256（在线程池中读盘）"""
+    return await asyncio.to_thread(_hash_fileobj, fileobj)
+
+
+def key_digest(keys: Iterable[str]) -> str:
+    """请求携带的 API Key（多个时排序去重）的 SHA-256 前 16 位"""
+    return hashlib.sha256(",".join(sorted(set(keys))).encode()).hexdigest()[:16]
+
+
+def make_key(content_hash: str, keys: Iterable[str], **options) -> str:
+    """缓存键 = 内容哈希 + API Key 摘要 + 影响转录结果的参数；其它 Key 提交相同内容不会命中"""
+    payload = json.dumps(options, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(f"{content_hash}:{key_digest(keys)}:{payload}".encode()).hexdigest()
+
+
+class ResultCache:
+    def __init__(
+        self,
+        memory_items: int = CACHE_MEMORY_ITEMS,
+        ttl: float = CACHE_TTL,
+        directory: str = CACHE_DIR,
+        disk_max_bytes: int = CACHE_DISK_MAX_BYTES,
+    ):
+        self.memory_items = memory_items
+        self.ttl = ttl
+        self.directory = directory
+        self.disk_max_bytes = disk_max_bytes
+        self._memory: "OrderedDict[str, Tuple[float, dict]]" = OrderedDict()
+        # 磁盘索引：key -> (大小, 写入时间, 最近访问时间)
+        self._disk: Dict[str, Tuple[int, float, float]] = {}
+        self._disk_bytes = 0
+        # 磁盘读写在线程池中执行，索引修改需要加锁
+        self._lock = threading.Lock()
+        self.counters = {"memory_hits": 0, "disk_hits": 0, "shared_hits": 0, "misses": 0, "stores": 0, "evictions": 0}
+        if directory:
+            self._load_disk_index()
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, key[:2], f"{key}.json")
+
+    def _load_disk_index(self):
+        os.makedirs(self.directory, exist_ok=True)
+        for root, _, names in os.walk(self.directory):
+            for name in names:
+                if name.endswith(".json"):
+                    stat = os.stat(os.path.join(root, name))
+                    self._disk[name[:-5]] = (stat.st_size, stat.st_mtime, max(stat.st_atime, stat.st_mtime))
+                    self._disk_bytes += stat.st_size
+        logger.info(f"磁盘缓存: {self.directory} | {len(self._disk)} 项 | {self._disk_bytes / 1024 / 1024:.1f} MB")
+
+    async def get(self, key: str) -> Optional[dict]:
+        now = time.time()
+        entry = self._memory.get(key)
+        if entry is not None:
+            stored_at, value = entry
+            if now - stored_at < self.ttl:
+                self._memory.move_to_end(key)
+                self.counters["memory_hits"] += 1
+                return value
+            del self._memory[key]
+
+        if self.directory:
+            value = await asyncio.to_thread(self._read_disk, key, now)
+            if value is not None:
+                self._remember(key, value, now)
+                self.counters["disk_hits"] += 1
+                return value
+        elif shared_state.backend.shared:
+            value = await shared_state.backend.get("results", key)
+            if value is not None:
+                self._remember(key, value, now)
+                self.counters["shared_hits"] += 1
+                return value
+
+        self.counters["misses"] += 1
+        return None
+
+    async def put(self, key: str, value: dict):
+        now = time.time()
+        self._remember(key, value, now)
+        if self.directory:
+            await asyncio.to_thread(self._write_disk, key, value, now)
+        elif shared_state.backend.shared:
+            await shared_state.backend.set("results", key, value, ttl=self.ttl)
+        self.counters["stores"] += 1
+
+    def _remember(self, key: str, value: dict, now: float):
+        self._memory[key] = (now, value)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_items:
+            self._memory.popitem(last=False)
+            self.counters["evictions"] += 1
+
+    def _read_disk(self, key: str, now: float) -> Optional[dict]:
+        with self._lock:
+            return self._read_disk_locked(key, now)
+
+    def _read_disk_locked(self, key: str, now: float) -> Optional[dict]:
+        if key not in self._disk and not self._adopt(key):
+            return None
+        size, stored_at, _ = self._disk[key]
+        path = self._path(key)
+        if now - stored_at >= self.ttl:
+            self._drop_disk(key)
+            return None
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                value = json.load(f)
+        except (OSError, ValueError):
+            self._drop_disk(key)
+            return None
+        # 刷新访问时间（atime），超出容量时淘汰最久未用的项；mtime 保留为写入时间用于 TTL
+        os.utime(path, (now, stored_at))
+        self._disk[key] = (size, stored_at, now)
+        return value
+
+    def _adopt(self, key: str) -> bool:
+        """其它 worker 写入的缓存文件：加入本进程的索引"""
+        try:
+            stat = os.stat(self._path(key))
+        except OSError:
+            return False
+        self._disk[key] = (stat.st_size, stat.st_mtime, max(stat.st_atime, stat.st_mtime))
+        self._disk_bytes += stat.st_size
+        return True
+
+    def _write_disk(self, key: str, value: dict, now: float):
+        with self._lock:
+            self._write_disk_locked(key, value, now)
+
+    def _write_disk_locked(self, key: str, value: dict, now: float):
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # 锁只在本进程内有效：多 worker 同时写同一个键时各自写独立的临时文件，os.replace 只会发布完整内容
+        fd, tmp = tempfile.mkstemp(prefix=f"{os.path.basename(path)}.", suffix=".tmp", dir=os.path.dirname(path))
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump(value, f, ensure_ascii=False)
+            os.replace(tmp, path)
+        except BaseException:
+            os.unlink(tmp)
+            raise
+        if key in self._disk:
+            self._disk_bytes -= self._disk[key][0]
+        size = os.path.getsize(path)
+        self._disk[key] = (size, now, now)
+        self._disk_bytes += size
+        self._evict_disk(now)
+
+    def _evict_disk(self, now: float):
+        for key, (_, stored_at, _) in list(self._disk.items()):
+            if now - stored_at >= self.ttl:
+                self._drop_disk(key)
+        if self._disk_bytes <= self.disk_max_bytes:
+            return
+        for key in sorted(self._disk, key=lambda k: self._disk[k][2]):
+            if self._disk_bytes <= self.disk_max_bytes:
+                break
+            self._drop_disk(key)
+
+    def _drop_disk(self, key: str):
+        size = self._disk.pop(key, (0, 0.0, 0.0))[0]
+        self._disk_bytes -= size
+        self.counters["evictions"] += 1
+        try:
+            os.unlink(self._path(key))
+        except OSError:
+            pass
+
+    def stats(self) -> dict:
+        return {
+            "enabled": CACHE_ENABLED,
+            **self.counters,
+            "memory_items": len(self._memory),
+            "disk_items": len(self._disk),
+            "disk_bytes": self._disk_bytes,
+        }
+
+
+cache = ResultCache()
@@ -1,26 +1,54 @@
 from fastapi import FastAPI, File, UploadFile, HTTPException, Form, WebSocket, WebSocketDisconnect, Query
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import HTMLResponse
+from fastapi.responses import HTMLResponse, PlainTextResponse, Response, StreamingResponse
 from pydantic import BaseModel
-from typing import List, Optional
+from datetime import datetime, timezone
+from typing import AsyncIterator, Awaitable, Callable, Dict, List, Optional, Tuple
+from contextlib import asynccontextmanager
 import httpx
 import asyncio
 import json
-import websockets
 from loguru import logger
 import sys
+import os
+import time
+import shutil
+import tempfile
+from urllib.parse import quote
+
+import admission
+import engine
+import upstream
+import watcher
+import jobs
+import journal
+import janitor
+import meta_cache
+import audio_normalize
+import keypool
+import result_cache
+import metrics
+import shared_state
+import transcript
+import ws_relay
+from assembler import TranscriptAssembler
 
 # 配置 loguru
 logger.remove()
 logger.add(sys.stdout, format="<green>{time:HH:mm:ss}</green> | <level>{level: <8}</level> | {message}", level="DEBUG")
 
+# 批量转录单次最多文件数（并发默认值/上限见 engine.BATCH_CONCURRENCY / BATCH_MAX_CONCURRENCY）
+BATCH_MAX_FILES = int(os.getenv("SONIOX_BATCH_MAX_FILES", "500"))
+# 允许批量转录读取的服务端目录；为空时不接受服务端路径
+BATCH_PATH_ROOT = os.getenv("SONIOX_BATCH_PATH_ROOT", "")
+
+# 流式返回时合并小片段后每次写出的字节数
+STREAM_CHUNK_BYTES = 64 * 1024
+
 # 版本信息
 API_VERSION = "5.0.0"
 BUILD_DATE = "2026-02-14"
 
-# Soniox API 基础 URL
-SONIOX_API_BASE = "https://api.soniox.com/v1"
-
 # Pydantic 响应模型
 class HealthResponse(BaseModel):
     status: str
@@ -75,14 +103,17 @@ class WordTimestamp(BaseModel):
     text: str
     start_time: float
     end_time: float
+    speaker: Optional[str] = None  # 仅启用说话人分离时返回
 
 class ChunkDuration(BaseModel):
     chunk: int
     duration: float
+    stages: Optional[Dict[str, float]] = None
 
 class ProcessingTime(BaseModel):
     total: float
     chunks: List[ChunkDuration]
+    stages: Optional[Dict[str, float]] = None  # upload / create / poll / fetch 各阶段秒数
 
 class TranscribeResponse(BaseModel):
     success: bool
@@ -92,11 +123,82 @@ class TranscribeResponse(BaseModel):
     total_chunks: int
     processing_time: ProcessingTime
 
+class JobSubmitResponse(BaseModel):
+    job_id: str
+    status: str
+    status_url: str
+    events_url: str
+
+class JobInfo(BaseModel):
+    id: str
+    status: str
+    stage: str
+    filename: Optional[str] = None
+    created_at: float
+    updated_at: float
+    events: List[dict]
+    error: Optional[str] = None
+    result: Optional[TranscribeResponse] = None
+
 class RootResponse(BaseModel):
     message: str
     docs: str
     redoc: str
 
+def _collect_metrics():
+    """抓取 /metrics 时从各模块同步当前状态"""
+    # Key 由客户端提交：只有成功调用过上游（已通过验证）的 Key 以摘要单独作为标签，其余合并为 other，
+    # 随意提交的 Key 不会让标签无限增长；负载和熔断状态每次重建，keypool 清理掉的 Key 随之消失
+    # （累计成功/失败次数由 keypool 记录时直接累加）
+    for metric in (metrics.KEY_IN_FLIGHT, metrics.KEY_AVAILABLE):
+        metric.clear()
+    other_in_flight = 0
+    for state in keypool.pool.snapshot():
+        if not state["successes"]:
+            other_in_flight += state["in_flight"]
+            continue
+        metrics.KEY_IN_FLIGHT.set(state["in_flight"], key=state["label"])
+        metrics.KEY_AVAILABLE.set(1 if state["available"] else 0, key=state["label"])
+    metrics.KEY_IN_FLIGHT.set(other_in_flight, key="other")
+    stats = result_cache.cache.stats()
+    for event in ("memory_hits", "disk_hits", "shared_hits", "misses", "stores", "evictions"):
+        metrics.CACHE_EVENTS.set_total(stats[event], event=event)
+    metrics.CACHE_ITEMS.set(stats["memory_items"], tier="memory")
+    metrics.CACHE_ITEMS.set(stats["disk_items"], tier="disk")
+    for status, count in jobs.store.counts().items():
+        metrics.JOBS.set(count, status=status)
+    metrics.WATCHER_PENDING.set(watcher.pending())
+
+metrics.register_collector(_collect_metrics)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """
+    应用生命周期：共享上游连接池、事件循环延迟监测、恢复上次运行未完成的转录
+
+    多 worker 时每个 worker 各自执行：只恢复已退出进程遗留的转录，定时清理只在一个 worker 中运行
+    """
+    await upstream.start()
+    shared_state.backend.open()
+    journal.store.open()
+    background = [asyncio.create_task(metrics.monitor_event_loop())]
+    if shared_state.backend.shared:
+        background.append(asyncio.create_task(keypool.pool.sync_forever()))
+    await _recover_journal()
+    if janitor.JANITOR_API_KEYS and janitor.JANITOR_INTERVAL > 0:
+        background.append(asyncio.create_task(shared_state.run_singleton("janitor", janitor.run_forever)))
+    yield
+    for task in background:
+        task.cancel()
+    await asyncio.gather(*background, return_exceptions=True)
+    journal.store.closing = True
+    await jobs.store.shutdown()
+    await engine.shutdown()
+    await watcher.shutdown()
+    await upstream.stop()
+    journal.store.close()
+    shared_state.backend.close()
+
 app = FastAPI(
     title="Soniox ASR API",
     version=API_VERSION,
@@ -119,7 +221,15 @@ app = FastAPI(
     contact={"name": "Neo Sun", "email": "neosun808@gmail.com"},
     license_info={"name": "MIT", "url": "https://opensource.org/licenses/MIT"},
     redoc_url="/redoc",
-    docs_url="/docs"
+    docs_url="/docs",
+    lifespan=lifespan
+)
+
+# 上传接口在读取请求体之前先做准入预检（在 CORS 之内，拒绝响应也带 CORS 头）
+app.add_middleware(
+    admission.AdmissionGate,
+    controller=admission.transcribe,
+    paths=("/transcribe", "/jobs", "/transcribe/batch")
 )
 
 app.add_middleware(
@@ -140,16 +250,102 @@ async def health_check():
     """用于 Docker/K8s 健康检查"""
     return {"status": "healthy", "message": "服务正常运行"}
 
+@app.get("/cache/stats", tags=["系统"], summary="结果缓存统计")
+async def cache_stats():
+    """结果缓存命中/未命中计数和容量"""
+    return result_cache.cache.stats()
+
+@app.get("/admission/stats", tags=["系统"], summary="准入控制状态")
+async def admission_stats():
+    """文件转录和实时会话的进行中数量、排队长度、拒绝次数和上限配置"""
+    return {"transcribe": admission.transcribe.stats(), "session": admission.sessions.stats()}
+
+@app.get("/metrics", tags=["系统"], summary="Prometheus 指标", response_class=PlainTextResponse)
+async def prometheus_metrics():
+    """Prometheus 文本格式指标：各阶段耗时、上游请求延迟、WebSocket 会话、Key 状态、缓存、任务和事件循环延迟"""
+    # 日志条数需要查询 SQLite，不放在同步的采集函数中
+    metrics.JOURNAL_ENTRIES.set(await journal.store.count())
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
 @app.get("/version", tags=["系统"], summary="版本信息", response_model=VersionResponse)
 async def version_info():
     """返回 API 版本信息"""
     return {"version": API_VERSION, "build_date": BUILD_DATE, "api_title": "Soniox ASR API"}
 
-@app.post("/transcribe", tags=["转录"], summary="文件转录", response_model=TranscribeResponse)
+# ==================== 崩溃恢复 ====================
+
+async def _recover_journal():
+    """启动时恢复上次运行未完成的上游转录；有 job_id 的以原任务 ID 重新登记，可继续查询"""
+    entries = await journal.store.unfinished()
+    if not entries:
+        return
+    logger.info(f"恢复 {len(entries)} 个未完成的上游转录")
+    for entry in entries:
+        if entry["job_id"]:
+            job = jobs.store.submit(entry["filename"], lambda job, entry=entry: _resume_job(entry), job_id=entry["job_id"])
+            job.record("recovering", transcription_id=entry["transcription_id"])
+        else:
+            engine.spawn_resume(entry)
+
+async def _resume_job(entry: dict) -> dict:
+    result = await engine.resume_entry(entry)
+    if result is None:
+        raise HTTPException(status_code=500, detail="恢复转录失败")
+    return result
+
+async def _admitted(client: str, run: Awaitable[dict], bounded: bool = True) -> dict:
+    """占用一个文件转录名额后运行 run；bounded=False 时不受排队长度和超时限制（后台任务）"""
+    async with admission.transcribe.slot(client, bounded):
+        return await run
+
+def _check_format(fmt: str):
+    if fmt not in transcript.FORMATS:
+        raise HTTPException(status_code=400, detail=f"不支持的格式: {fmt}（可选 {' / '.join(transcript.FORMATS)}）")
+
+def _content_disposition(fmt: str, filename: Optional[str]) -> str:
+    """导出文件名为原文件名换成对应扩展名"""
+    name = f"{os.path.splitext(filename or 'transcript')[0]}.{transcript.EXTENSIONS[fmt]}"
+    return f"inline; filename*=UTF-8''{quote(name)}"
+
+def _export_response(text: str, words: List[dict], fmt: str, filename: Optional[str]) -> Response:
+    """字幕/文本导出的响应"""
+    return Response(
+        "".join(transcript.export(text, words, fmt)),
+        media_type=transcript.FORMATS[fmt],
+        headers={"Content-Disposition": _content_disposition(fmt, filename)}
+    )
+
+async def _coalesce(chunks: AsyncIterator[str]) -> AsyncIterator[bytes]:
+    """逐词生成的小片段合并到约 STREAM_CHUNK_BYTES 再写出，减少发送次数"""
+    buffer: List[str] = []
+    buffered = 0
+    async for chunk in chunks:
+        buffer.append(chunk)
+        buffered += len(chunk)
+        if buffered >= STREAM_CHUNK_BYTES:
+            yield "".join(buffer).encode("utf-8")
+            buffer = []
+            buffered = 0
+    if buffer:
+        yield "".join(buffer).encode("utf-8")
+
+def _streamed_export(chunks: AsyncIterator[str], fmt: str, filename: Optional[str]) -> StreamingResponse:
+    """边解析边输出的导出响应（见 transcript.stream_export）"""
+    headers = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    if fmt != "json":
+        headers["Content-Disposition"] = _content_disposition(fmt, filename)
+    return StreamingResponse(_coalesce(chunks), media_type=transcript.FORMATS[fmt], headers=headers)
+
+@app.post("/transcribe", tags=["转录"], summary="文件转录", response_model=TranscribeResponse, response_model_exclude_none=True)
 async def transcribe_audio(
     file: UploadFile = File(..., description="音频/视频文件（支持 mp3, wav, m4a, mp4 等）"),
     api_keys: str = Form(..., description="Soniox API Keys，多个用逗号分隔"),
-    enable_diarization: bool = Form(False, description="是否启用说话人分离（最多15人）")
+    enable_diarization: bool = Form(False, description="是否启用说话人分离（最多15人）"),
+    chunk_duration: float = Form(0, ge=0, description="服务端分段时长（秒），0 表示不分段；仅 PCM WAV 有效"),
+    use_cache: bool = Form(True, description="相同文件和参数命中缓存时直接返回，不再请求 Soniox"),
+    normalize_audio: bool = Form(audio_normalize.NORMALIZE_AUDIO, description="PCM WAV 上传前转为 16kHz 单声道 16 位（默认关闭，SONIOX_NORMALIZE_AUDIO=1 时默认开启）"),
+    format: str = Form("json", description="返回格式：json / srt / vtt / jsonl / text"),
+    stream: bool = Form(False, description="边下载边解析转录结果并流式返回，内存占用与转录长度无关；不使用结果缓存，不支持分段")
 ):
     """
     上传音频/视频文件进行语音转文字
@@ -157,126 +353,42 @@ async def transcribe_audio(
     - **file**: 音频或视频文件
     - **api_keys**: Soniox API Key，支持多个（负载均衡）
     - **enable_diarization**: 启用后自动识别不同说话人
+    - **chunk_duration**: 长音频按该时长在静音处切段，各段分配到不同 Key 并发转录后合并
+    - **use_cache**: 按文件内容哈希 + 参数缓存结果，重复转录直接返回
+    - **normalize_audio**: PCM WAV 下混为单声道、降采样到 16kHz 后再上传，减少上传字节数
+    - **format**: json 返回 TranscribeResponse；srt / vtt 返回按说话人和停顿分段的字幕，jsonl 每行一个分段，text 为纯文本
+    - **stream**: 转录完成后边从 Soniox 下载边输出（json 时字段与 TranscribeResponse 相同，words 在 text 之前），
+      首批内容在解析完成前即可到达；上传和转录阶段的错误仍以状态码返回
     """
     try:
         logger.info(f"转录请求 | 文件: {file.filename} | 人声分离: {enable_diarization}")
+        keys_list = engine.parse_api_keys(api_keys)
+        _check_format(format)
         
-        keys_list = [k.strip() for k in api_keys.split(",") if k.strip()]
-        if not keys_list:
-            raise HTTPException(status_code=400, detail="请提供至少一个 API Key")
-        
-        import random
-        api_key = random.choice(keys_list)
-        logger.debug(f"使用 Key: {api_key[:10]}... (共 {len(keys_list)} 个)")
-        
-        audio_data = await file.read()
-        logger.debug(f"文件大小: {len(audio_data)} 字节")
-        
-        headers = {"Authorization": f"Bearer {api_key}"}
-        
-        logger.info("步骤 1/4: 上传文件...")
-        # 上传超时设长（大文件上传可能很慢）
-        async with httpx.AsyncClient(timeout=httpx.Timeout(600.0, connect=30.0)) as client:
-            files = {"file": (file.filename, audio_data, "audio/wav")}
-            upload_resp = await client.post("https://api.soniox.com/v1/files", files=files, headers=headers)
-            
-            if upload_resp.status_code != 201:
-                logger.error(f"上传失败: {upload_resp.status_code} - {upload_resp.text}")
-                raise HTTPException(status_code=upload_resp.status_code, detail=f"上传失败: {upload_resp.text}")
-            
-            file_id = upload_resp.json()["id"]
-            logger.info(f"步骤 1/4: 文件 ID: {file_id}")
+        if stream:
+            if chunk_duration > 0:
+                raise HTTPException(status_code=400, detail="流式返回不支持服务端分段（chunk_duration）")
+            tokens = engine.stream_transcription(
+                file, file.filename, file.size, keys_list, enable_diarization, normalize_audio
+            )
+            # 名额只占用到转录完成；之后的输出速度取决于客户端
+            summary = await _admitted(admission.client_id(keys_list), tokens.__anext__())
+            return _streamed_export(
+                transcript.stream_export(tokens, format, enable_diarization, lambda: summary), format, file.filename
+            )
         
-        # 后续操作用独立 client，每次请求 30 秒超时即可（轮询是循环调用）
-        async with httpx.AsyncClient(timeout=30.0) as client:
-            logger.info("步骤 2/4: 创建转录任务...")
-            config = {
-                "file_id": file_id,
-                "model": "stt-async-v4",
-                "enable_speaker_diarization": enable_diarization,
-                "enable_language_identification": True
-            }
-            
-            transcribe_resp = await client.post("https://api.soniox.com/v1/transcriptions", json=config, headers=headers)
-            
-            if transcribe_resp.status_code != 201:
-                logger.error(f"创建转录失败: {transcribe_resp.status_code} - {transcribe_resp.text}")
-                raise HTTPException(status_code=transcribe_resp.status_code, detail=f"创建转录失败: {transcribe_resp.text}")
-            
-            transcription_id = transcribe_resp.json()["id"]
-            logger.info(f"步骤 2/4: 转录 ID: {transcription_id}")
-            
-            logger.info("步骤 3/4: 等待转录完成...")
-            attempt = 0
-            while True:
-                await asyncio.sleep(1)
-                attempt += 1
-                
-                status_resp = await client.get(f"https://api.soniox.com/v1/transcriptions/{transcription_id}", headers=headers)
-                
-                if status_resp.status_code != 200:
-                    logger.error(f"获取状态失败: {status_resp.status_code}")
-                    raise HTTPException(status_code=status_resp.status_code, detail="获取状态失败")
-                
-                data = status_resp.json()
-                status = data["status"]
-                
-                if attempt % 10 == 0:
-                    logger.debug(f"检查 {attempt} 次: {status} (已等待 {attempt}秒)")
-                
-                if status == "completed":
-                    logger.success(f"步骤 3/4: 转录完成！(共等待 {attempt}秒)")
-                    break
-                elif status == "error":
-                    error_msg = data.get("error_message", "未知错误")
-                    logger.error(f"转录失败: {error_msg}")
-                    raise HTTPException(status_code=500, detail=f"转录失败: {error_msg}")
-            
-            logger.info("步骤 4/4: 获取转录文本...")
-            text_resp = await client.get(f"https://api.soniox.com/v1/transcriptions/{transcription_id}/transcript", headers=headers)
-            
-            if text_resp.status_code != 200:
-                logger.error(f"获取文本失败: {text_resp.status_code}")
-                raise HTTPException(status_code=text_resp.status_code, detail="获取文本失败")
-            
-            text_data = text_resp.json()
-            
-            text = ""
-            words = []
-            current_speaker = None
-            
-            for token in text_data.get("tokens", []):
-                if enable_diarization and "speaker" in token:
-                    if token["speaker"] != current_speaker:
-                        current_speaker = token["speaker"]
-                        text += f"\n\n说话人 {current_speaker}: "
-                
-                text += token.get("text", "")
-                
-                if "start_ms" in token and "end_ms" in token:
-                    words.append({
-                        "text": token.get("text", ""),
-                        "start_time": token["start_ms"] / 1000.0,
-                        "end_time": token["end_ms"] / 1000.0
-                    })
-            
-            logger.success(f"完成 | 转录文本长度: {len(text)} 字符")
-            
-            try:
-                await client.delete(f"https://api.soniox.com/v1/transcriptions/{transcription_id}", headers=headers)
-                await client.delete(f"https://api.soniox.com/v1/files/{file_id}", headers=headers)
-                logger.debug("已清理转录和文件")
-            except:
-                pass
-            
-            return {
-                "success": True,
-                "text": text.strip(),
-                "words": words,
-                "audio_duration": data.get("audio_duration_ms", 0) / 1000.0,
-                "total_chunks": 1,
-                "processing_time": {"total": attempt, "chunks": [{"chunk": 1, "duration": attempt}]}
-            }
+        # 表单解析后先占名额再计算内容哈希，超出该客户端上限时不做缓存查找
+        options = engine.cache_options(enable_diarization, chunk_duration, normalize_audio)
+        result = await _admitted(admission.client_id(keys_list), engine.with_result_cache(
+            file.file, keys_list, options, use_cache,
+            lambda cache_key: engine.run_file_pipeline(
+                file, file.filename, file.size, keys_list, enable_diarization, chunk_duration, normalize_audio,
+                recovery={"cache_key": cache_key}
+            )
+        ))
+        if format != "json":
+            return _export_response(result["text"], result["words"], format, file.filename)
+        return result
     
     except HTTPException:
         raise
@@ -284,13 +396,218 @@ async def transcribe_audio(
         logger.exception(f"异常: {type(e).__name__}: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
+# ==================== 异步任务 ====================
+
+async def _spool_upload(file: UploadFile) -> str:
+    """把上传文件复制到本地临时文件（请求结束后 UploadFile 会被关闭，后台任务需要自己的副本）"""
+    fd, path = tempfile.mkstemp(prefix="soniox-job-", suffix=os.path.splitext(file.filename or "")[1])
+    try:
+        with os.fdopen(fd, "wb") as out:
+            file.file.seek(0)
+            await asyncio.to_thread(shutil.copyfileobj, file.file, out, 1024 * 1024)
+    except Exception:
+        os.unlink(path)
+        raise
+    return path
+
+@app.post("/jobs", tags=["异步任务"], summary="提交转录任务", status_code=202, response_model=JobSubmitResponse)
+async def submit_job(
+    file: UploadFile = File(..., description="音频/视频文件（支持 mp3, wav, m4a, mp4 等）"),
+    api_keys: str = Form(..., description="Soniox API Keys，多个用逗号分隔"),
+    enable_diarization: bool = Form(False, description="是否启用说话人分离（最多15人）"),
+    use_cache: bool = Form(True, description="相同文件和参数命中缓存时直接返回，不再请求 Soniox"),
+    normalize_audio: bool = Form(audio_normalize.NORMALIZE_AUDIO, description="PCM WAV 上传前转为 16kHz 单声道 16 位（默认关闭，SONIOX_NORMALIZE_AUDIO=1 时默认开启）")
+):
+    """
+    提交转录任务，立即返回任务 ID，不必保持连接等待转录完成
+    
+    - 通过 `GET /jobs/{job_id}` 查询状态和结果
+    - 通过 `GET /jobs/{job_id}/events`（SSE）接收阶段进度：(normalized →) uploading → uploaded → created → polling → fetched → completed / failed
+    """
+    logger.info(f"任务提交 | 文件: {file.filename} | 人声分离: {enable_diarization}")
+    keys_list = engine.parse_api_keys(api_keys)
+    jobs.store.ensure_capacity()
+    
+    path = await _spool_upload(file)
+    filename = file.filename
+    
+    async def runner(job: jobs.Job) -> dict:
+        reader = upstream.AsyncFileReader(path)
+        try:
+            return await engine.with_result_cache(
+                reader.file, keys_list, engine.cache_options(enable_diarization, normalize_audio=normalize_audio), use_cache,
+                lambda cache_key: _admitted(admission.client_id(keys_list), engine.run_file_pipeline(
+                    reader, filename, reader.size, keys_list, enable_diarization,
+                    normalize_audio=normalize_audio, on_stage=job.record,
+                    recovery={"cache_key": cache_key, "job_id": job.id}
+                ), bounded=False)
+            )
+        finally:
+            await reader.close()
+            os.unlink(path)
+    
+    job = jobs.store.submit(filename, runner)
+    logger.info(f"任务已创建: {job.id}")
+    return {
+        "job_id": job.id,
+        "status": job.status,
+        "status_url": f"/jobs/{job.id}",
+        "events_url": f"/jobs/{job.id}/events"
+    }
+
+async def _get_job(job_id: str) -> jobs.Job:
+    job = await jobs.store.lookup(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="任务不存在或已过期")
+    return job
+
+@app.get("/jobs/{job_id}", tags=["异步任务"], summary="任务状态", response_model=JobInfo)
+async def get_job(job_id: str):
+    """查询任务状态，完成后包含转录结果"""
+    return (await _get_job(job_id)).to_dict()
+
+@app.get("/jobs/{job_id}/events", tags=["异步任务"], summary="任务进度（SSE）")
+async def job_events(job_id: str):
+    """Server-Sent Events 推送任务阶段进度，任务结束后关闭连接"""
+    job = await _get_job(job_id)
+    
+    async def event_stream():
+        async for event in job.follow():
+            if event is None:
+                yield ": ping\n\n"
+            else:
+                yield f"event: {event['stage']}\ndata: {json.dumps(event, ensure_ascii=False)}\n\n"
+    
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+# ==================== 批量转录 ====================
+
+def _resolve_batch_path(path: str) -> str:
+    """服务端路径必须位于 SONIOX_BATCH_PATH_ROOT 内"""
+    if not BATCH_PATH_ROOT:
+        raise HTTPException(status_code=403, detail="未配置 SONIOX_BATCH_PATH_ROOT，不接受服务端路径")
+    root = os.path.realpath(BATCH_PATH_ROOT)
+    resolved = os.path.realpath(os.path.join(root, path))
+    if os.path.commonpath([root, resolved]) != root:
+        raise HTTPException(status_code=403, detail=f"路径不在允许的目录内: {path}")
+    return resolved
+
+@app.post("/transcribe/batch", tags=["转录"], summary="批量转录（NDJSON 流式结果）")
+async def transcribe_batch(
+    files: List[UploadFile] = File(None, description="多个音频/视频文件"),
+    paths: List[str] = Form(None, description="服务端文件路径（相对 SONIOX_BATCH_PATH_ROOT），可重复"),
+    api_keys: str = Form(..., description="Soniox API Keys，多个用逗号分隔"),
+    enable_diarization: bool = Form(False, description="是否启用说话人分离（最多15人）"),
+    chunk_duration: float = Form(0, ge=0, description="服务端分段时长（秒），0 表示不分段；仅 PCM WAV 有效"),
+    use_cache: bool = Form(True, description="相同文件和参数命中缓存时直接返回，不再请求 Soniox"),
+    normalize_audio: bool = Form(audio_normalize.NORMALIZE_AUDIO, description="PCM WAV 上传前转为 16kHz 单声道 16 位（默认关闭，SONIOX_NORMALIZE_AUDIO=1 时默认开启）"),
+    concurrency: int = Form(engine.BATCH_CONCURRENCY, ge=1, description="同时转录的文件数")
+):
+    """
+    一次提交多个文件，并发转录，每完成一个文件输出一行 JSON（application/x-ndjson）
+    
+    - 每行：`{"index", "filename", "success", "result" | "status_code" + "error"}`，按完成顺序输出
+    - 最后一行：`{"done": true, "total", "succeeded", "failed", "elapsed"}`
+    - 各文件由 keypool 分配到负载最低的 Key，单个文件失败不影响其它文件
+    """
+    files = files or []
+    paths = [p for p in (paths or []) if p.strip()]
+    total = len(files) + len(paths)
+    if total == 0:
+        raise HTTPException(status_code=400, detail="请提供至少一个文件或路径")
+    if total > BATCH_MAX_FILES:
+        raise HTTPException(status_code=400, detail=f"单次最多 {BATCH_MAX_FILES} 个文件")
+    keys_list = engine.parse_api_keys(api_keys)
+    concurrency = min(concurrency, engine.BATCH_MAX_CONCURRENCY)
+    options = engine.cache_options(enable_diarization, chunk_duration, normalize_audio)
+    logger.info(f"批量转录 | {total} 个文件 | 并发 {concurrency}")
+    
+    # (文件名, 本地路径, 是否为需要删除的临时副本)；上传文件先落盘，响应流开始后 UploadFile 会被关闭
+    items: List[Tuple[str, str, bool]] = [(p, _resolve_batch_path(p), False) for p in paths]
+    try:
+        for file in files:
+            items.append((file.filename, await _spool_upload(file), True))
+    except Exception:
+        for _, path, spooled in items:
+            if spooled:
+                os.unlink(path)
+        raise
+    
+    semaphore = asyncio.Semaphore(concurrency)
+    
+    async def run_item(index: int, filename: str, path: str, spooled: bool) -> dict:
+        try:
+            async with semaphore:
+                reader = upstream.AsyncFileReader(path)
+                try:
+                    result = await engine.with_result_cache(
+                        reader.file, keys_list, options, use_cache,
+                        lambda cache_key: _admitted(admission.client_id(keys_list), engine.run_file_pipeline(
+                            reader, filename, reader.size, keys_list, enable_diarization, chunk_duration, normalize_audio,
+                            recovery={"cache_key": cache_key}
+                        ), bounded=False)
+                    )
+                finally:
+                    await reader.close()
+            return {"index": index, "filename": filename, "success": True, "result": result}
+        except HTTPException as e:
+            logger.error(f"批量转录失败: {filename} | {e.status_code} {e.detail}")
+            return {"index": index, "filename": filename, "success": False, "status_code": e.status_code, "error": str(e.detail)}
+        except OSError as e:
+            logger.error(f"批量转录失败: {filename} | {e}")
+            return {"index": index, "filename": filename, "success": False, "status_code": 404, "error": f"无法读取文件: {filename}"}
+        except Exception as e:
+            logger.exception(f"批量转录异常: {filename} | {type(e).__name__}: {e}")
+            return {"index": index, "filename": filename, "success": False, "status_code": 500, "error": str(e)}
+        finally:
+            if spooled:
+                os.unlink(path)
+    
+    async def result_stream():
+        started = time.monotonic()
+        tasks = [asyncio.create_task(run_item(i, *item)) for i, item in enumerate(items)]
+        succeeded = 0
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                line = await next_done
+                succeeded += line["success"]
+                yield json.dumps(line, ensure_ascii=False) + "\n"
+        finally:
+            # 客户端断开时取消未完成的文件，并清理尚未开始处理的临时副本
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            for _, path, spooled in items:
+                if spooled and os.path.exists(path):
+                    os.unlink(path)
+        elapsed = round(time.monotonic() - started, 3)
+        logger.success(f"批量转录完成 | 成功 {succeeded}/{total} | {elapsed}秒")
+        yield json.dumps({"done": True, "total": total, "succeeded": succeeded, "failed": total - succeeded, "elapsed": elapsed}) + "\n"
+    
+    return StreamingResponse(
+        result_stream(),
+        media_type="application/x-ndjson",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
 @app.websocket("/ws/transcribe")
 async def websocket_transcribe(websocket: WebSocket):
     """WebSocket 实时转录端点"""
     await websocket.accept()
     logger.info("WebSocket 客户端已连接")
+    metrics.WS_ACTIVE_SESSIONS.inc()
+    session_started = time.monotonic()
     
     soniox_ws = None
+    api_key = None
+    relay = None
+    close_code = 1000
+    client = None
+    admitted_at = None
     
     try:
         logger.debug("等待配置消息...")
@@ -298,15 +615,36 @@ async def websocket_transcribe(websocket: WebSocket):
         config = json.loads(config_data)
         logger.info(f"收到配置: model={config.get('model', 'unknown')}")
         
-        api_key = config.get("api_key")
-        if not api_key:
+        # api_key 支持逗号分隔多个，由 keypool 选择负载最低且未熔断的 Key
+        keys_list = [k.strip() for k in (config.get("api_key") or "").split(",") if k.strip()]
+        if not keys_list:
             logger.warning("缺少 api_key")
             await websocket.send_json({"error": "缺少 api_key"})
             await websocket.close()
             return
         
+        # 准入：超出会话并发上限时排队，排队满或超时以 1013 (Try Again Later) 关闭
+        client = admission.client_id(keys_list)
+        try:
+            admitted_at = await admission.sessions.acquire(client)
+        except HTTPException as e:
+            close_code = 1013
+            await websocket.send_json({
+                "error": e.detail, "status_code": e.status_code, "retry_after": int(e.headers["Retry-After"])
+            })
+            return
+        
+        export_format = config.get("export_format")
+        if export_format is not None and (export_format not in transcript.FORMATS or export_format == "json"):
+            await websocket.send_json({"error": f"不支持的导出格式: {export_format}（可选 srt / vtt / jsonl / text）"})
+            return
+        # 导出需要服务端拼接：指定 export_format 时默认开启，显式关闭 server_assembly 时拒绝
+        server_assembly = config.get("server_assembly", ws_relay.WS_SERVER_ASSEMBLY or export_format is not None)
+        if export_format is not None and not server_assembly:
+            await websocket.send_json({"error": f"导出格式 {export_format} 需要开启 server_assembly"})
+            return
+        
         soniox_config = {
-            "api_key": api_key,
             "model": config.get("model", "stt-rt-v4"),
             "audio_format": config.get("audio_format", "auto"),
             "enable_speaker_diarization": config.get("enable_speaker_diarization", False),
@@ -319,60 +657,69 @@ async def websocket_transcribe(websocket: WebSocket):
                 soniox_config[key] = config[key]
         
         logger.info("连接到 Soniox...")
-        soniox_ws = await websockets.connect(
-            "wss://stt-rt.soniox.com/transcribe-websocket",
-            ping_interval=None,
-            close_timeout=30
-        )
-        logger.success("Soniox 连接成功")
-        
+        # 连接失败在 connect_upstream 内重试，不计入 Key；Key 随配置帧发送，不等待首条响应即开始转发
+        api_key = keypool.pool.acquire(keys_list)
+        soniox_ws = await ws_relay.connect_upstream()
+        soniox_config["api_key"] = api_key
         await soniox_ws.send(json.dumps(soniox_config))
         logger.debug("配置已发送到 Soniox")
+        logger.success(f"Soniox 连接成功 (Key: {keypool.mask_key(api_key)})")
+        
+        # 首条响应是可重试的错误时由 Relay 调用：记入该 Key，换下一个 Key 重连；返回 None 时错误照常转发给客户端
+        tried = []
+        
+        async def failover(error_code: int):
+            nonlocal api_key, soniox_ws
+            if not keypool.is_retryable(error_code) or len(tried) + 1 >= len(set(keys_list)):
+                return None
+            keypool.pool.record(api_key, error_code)
+            keypool.pool.release(api_key)
+            tried.append(api_key)
+            api_key = None
+            await soniox_ws.close()
+            soniox_ws = None
+            api_key = keypool.pool.acquire(keys_list, exclude=tried)
+            soniox_ws = await ws_relay.connect_upstream()
+            soniox_config["api_key"] = api_key
+            await soniox_ws.send(json.dumps(soniox_config))
+            logger.warning(f"Soniox 拒绝 Key ({error_code})，换 Key 重连 (Key: {keypool.mask_key(api_key)})")
+            return soniox_ws
         
-        async def forward_audio():
-            try:
-                chunk_count = 0
-                while True:
-                    data = await websocket.receive_bytes()
-                    if len(data) == 0:
-                        logger.info("收到结束信号")
-                        await soniox_ws.send(b"")
-                        break
-                    chunk_count += 1
-                    if chunk_count % 100 == 0:
-                        logger.debug(f"已转发 {chunk_count} 个音频块")
-                    await soniox_ws.send(data)
-            except WebSocketDisconnect:
-                logger.info("客户端断开连接")
-                await soniox_ws.send(b"")
-            except Exception as e:
-                logger.error(f"forward_audio 错误: {e}")
+        def on_response(message) -> bool:
+            finished, error_code = ws_relay.inspect_response(message)
+            if error_code:
+                keypool.pool.record(api_key, error_code)
+            if finished:
+                keypool.pool.record(api_key, 200)
+                logger.success("转录完成")
+                return True
+            return False
         
-        async def forward_responses():
-            try:
-                response_count = 0
-                async for message in soniox_ws:
-                    response_count += 1
-                    if response_count <= 3:
-                        logger.debug(f"响应 {response_count}: {message[:200]}...")
-                    elif response_count % 10 == 0:
-                        logger.debug(f"已转发 {response_count} 个响应")
-                    await websocket.send_text(message)
-                    
-                    response = json.loads(message)
-                    if response.get("finished"):
-                        logger.success("转录完成")
-                        break
-            except Exception as e:
-                logger.error(f"forward_responses 错误: {e}")
-                await websocket.send_json({"error": str(e)})
+        # server_assembly：服务端拼接 token，只向客户端发送增量文本，结束时发送完整转录（可选 export_format 导出）
+        assembler = None
+        if server_assembly:
+            assembler = TranscriptAssembler(soniox_config["enable_speaker_diarization"], export_format)
         
         logger.info("开始转发数据...")
-        await asyncio.gather(forward_audio(), forward_responses())
+        # 只有一个 Key 时无从换 Key，不保留音频
+        relay = ws_relay.Relay(
+            websocket, soniox_ws, on_response, assembler=assembler,
+            failover=failover if len(set(keys_list)) > 1 else None
+        )
+        await relay.run()
         logger.info("数据转发完成")
+        if assembler is not None:
+            logger.info(f"服务端拼接转录: {len(assembler)} 个最终 token | 导出格式: {export_format or '无'}")
         
     except WebSocketDisconnect:
         logger.info("客户端断开")
+    except ws_relay.RelayOverflow as e:
+        logger.warning(f"客户端发送过快，关闭会话: {e}")
+        close_code = 1013
+        try:
+            await websocket.send_json({"error": str(e)})
+        except:
+            pass
     except Exception as e:
         logger.exception(f"主处理错误: {e}")
         try:
@@ -380,12 +727,21 @@ async def websocket_transcribe(websocket: WebSocket):
         except:
             pass
     finally:
+        if admitted_at is not None:
+            admission.sessions.release(client, admitted_at)
+        if api_key:
+            keypool.pool.release(api_key)
         if soniox_ws:
             await soniox_ws.close()
         try:
-            await websocket.close()
+            await websocket.close(code=close_code)
         except:
             pass
+        metrics.WS_ACTIVE_SESSIONS.dec()
+        if relay is not None:
+            metrics.WS_SESSION_AUDIO_CHUNKS.observe(relay.audio_chunks)
+            metrics.WS_SESSION_RESPONSES.observe(relay.response_count)
+        metrics.WS_SESSION_SECONDS.observe(time.monotonic() - session_started)
 
 # ==================== Files API ====================
 
@@ -401,23 +757,105 @@ async def list_files(
         if cursor:
             params["cursor"] = cursor
         
-        async with httpx.AsyncClient(timeout=30.0) as client:
-            response = await client.get(
-                f"{SONIOX_API_BASE}/files",
-                headers={"Authorization": f"Bearer {api_key}"},
-                params=params
-            )
-            
-            if response.status_code != 200:
-                raise HTTPException(status_code=response.status_code, detail=response.text)
-            
-            return response.json()
+        client = upstream.get_client()
+        response = await client.get(
+            "/files",
+            headers=upstream.auth_headers(api_key),
+            params=params
+        )
+        
+        if response.status_code != 200:
+            raise HTTPException(status_code=response.status_code, detail=response.text)
+        
+        return response.json()
     except HTTPException:
         raise
     except Exception as e:
         logger.exception(f"列出文件失败: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
+def _created_between(created_after: Optional[datetime], created_before: Optional[datetime]) -> Callable[[dict], bool]:
+    """created_at 范围过滤；未带时区的参数按 UTC 处理"""
+    def utc(value: Optional[datetime]) -> Optional[datetime]:
+        return value.replace(tzinfo=timezone.utc) if value and not value.tzinfo else value
+    
+    after, before = utc(created_after), utc(created_before)
+    if after is None and before is None:
+        return lambda item: True
+    
+    def check(item: dict) -> bool:
+        created_at = upstream.parse_time(item.get("created_at"))
+        if created_at is None:
+            return False
+        return (after is None or created_at >= after) and (before is None or created_at < before)
+    return check
+
+def _stream_listing(
+    api_key: str,
+    path: str,
+    field: str,
+    keep: Callable[[dict], bool],
+    totals: Dict[str, str],
+    aggregate_only: bool
+) -> StreamingResponse:
+    """
+    沿游标链读取上游全部条目，过滤后逐行输出 NDJSON，边读边累计汇总（不在内存中保留全部条目）
+    
+    最后一行：`{"done": true, "count", "pages", "elapsed", ...totals}`；上游出错时最后一行为 `{"error", "status_code"}`
+    """
+    async def lines() -> AsyncIterator[str]:
+        started = time.monotonic()
+        summary = {"done": True, "count": 0, "pages": 0, **{name: 0 for name in totals}}
+        try:
+            async for page in upstream.iter_pages(api_key, path, field):
+                summary["pages"] += 1
+                chunk = []
+                for item in page:
+                    if not keep(item):
+                        continue
+                    summary["count"] += 1
+                    for name, source in totals.items():
+                        summary[name] += item.get(source) or 0
+                    if not aggregate_only:
+                        chunk.append(json.dumps(item, ensure_ascii=False))
+                # 每页合并为一次写出
+                if chunk:
+                    yield "\n".join(chunk) + "\n"
+        except httpx.HTTPStatusError as e:
+            logger.error(f"遍历 {path} 失败: {e.response.status_code}")
+            yield json.dumps({"error": e.response.text, "status_code": e.response.status_code}, ensure_ascii=False) + "\n"
+            return
+        except httpx.HTTPError as e:
+            logger.error(f"遍历 {path} 失败: {type(e).__name__}: {e}")
+            yield json.dumps({"error": str(e) or type(e).__name__, "status_code": 502}, ensure_ascii=False) + "\n"
+            return
+        summary["elapsed"] = round(time.monotonic() - started, 3)
+        logger.info(f"遍历 {path} | {summary['pages']} 页 | 匹配 {summary['count']} 条 | {summary['elapsed']}秒")
+        yield json.dumps(summary) + "\n"
+    
+    return StreamingResponse(
+        lines(),
+        media_type="application/x-ndjson",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@app.get("/api/files/all", tags=["Files API"], summary="全部文件（NDJSON 流式）")
+async def list_all_files(
+    api_key: str = Query(..., description="Soniox API Key"),
+    created_after: Optional[datetime] = Query(None, description="只返回该时间（含）之后创建的文件，ISO 8601"),
+    created_before: Optional[datetime] = Query(None, description="只返回该时间之前创建的文件，ISO 8601"),
+    aggregate_only: bool = Query(False, description="只输出最后的汇总行")
+):
+    """
+    服务端沿分页游标读取全部文件，每行一个文件（application/x-ndjson）
+    
+    最后一行为汇总：`{"done": true, "count", "total_bytes", "pages", "elapsed"}`
+    """
+    return _stream_listing(
+        api_key, "/files", "files", _created_between(created_after, created_before),
+        {"total_bytes": "size"}, aggregate_only
+    )
+
 @app.get("/api/files/{file_id}", tags=["Files API"], summary="文件详情", response_model=FileInfo)
 async def get_file(
     file_id: str,
@@ -425,16 +863,7 @@ async def get_file(
 ):
     """获取文件详细信息"""
     try:
-        async with httpx.AsyncClient(timeout=30.0) as client:
-            response = await client.get(
-                f"{SONIOX_API_BASE}/files/{file_id}",
-                headers={"Authorization": f"Bearer {api_key}"}
-            )
-            
-            if response.status_code != 200:
-                raise HTTPException(status_code=response.status_code, detail=response.text)
-            
-            return response.json()
+        return await meta_cache.cache.get_json(api_key, f"/files/{file_id}", "file", meta_cache.file_ttl)
     except HTTPException:
         raise
     except Exception as e:
@@ -448,16 +877,7 @@ async def get_file_url(
 ):
     """获取文件下载链接"""
     try:
-        async with httpx.AsyncClient(timeout=30.0) as client:
-            response = await client.get(
-                f"{SONIOX_API_BASE}/files/{file_id}/url",
-                headers={"Authorization": f"Bearer {api_key}"}
-            )
-            
-            if response.status_code != 200:
-                raise HTTPException(status_code=response.status_code, detail=response.text)
-            
-            return response.json()
+        return await meta_cache.cache.get_json(api_key, f"/files/{file_id}/url", "file_url", meta_cache.url_ttl)
     except HTTPException:
         raise
     except Exception as e:
@@ -471,16 +891,17 @@ async def delete_file(
 ):
     """删除已上传的文件"""
     try:
-        async with httpx.AsyncClient(timeout=30.0) as client:
-            response = await client.delete(
-                f"{SONIOX_API_BASE}/files/{file_id}",
-                headers={"Authorization": f"Bearer {api_key}"}
-            )
-            
-            if response.status_code != 204:
-                raise HTTPException(status_code=response.status_code, detail=response.text)
-            
-            return {"success": True, "message": "文件已删除"}
+        client = upstream.get_client()
+        response = await client.delete(
+            f"/files/{file_id}",
+            headers=upstream.auth_headers(api_key)
+        )
+        await meta_cache.cache.invalidate_file(api_key, file_id)
+        
+        if response.status_code != 204:
+            raise HTTPException(status_code=response.status_code, detail=response.text)
+        
+        return {"success": True, "message": "文件已删除"}
     except HTTPException:
         raise
     except Exception as e:
@@ -501,23 +922,52 @@ async def list_transcriptions(
         if cursor:
             params["cursor"] = cursor
         
-        async with httpx.AsyncClient(timeout=30.0) as client:
-            response = await client.get(
-                f"{SONIOX_API_BASE}/transcriptions",
-                headers={"Authorization": f"Bearer {api_key}"},
-                params=params
-            )
-            
-            if response.status_code != 200:
-                raise HTTPException(status_code=response.status_code, detail=response.text)
-            
-            return response.json()
+        client = upstream.get_client()
+        response = await client.get(
+            "/transcriptions",
+            headers=upstream.auth_headers(api_key),
+            params=params
+        )
+        
+        if response.status_code != 200:
+            raise HTTPException(status_code=response.status_code, detail=response.text)
+        
+        return response.json()
     except HTTPException:
         raise
     except Exception as e:
         logger.exception(f"列出转录失败: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.get("/api/transcriptions/all", tags=["Transcriptions API"], summary="全部转录（NDJSON 流式）")
+async def list_all_transcriptions(
+    api_key: str = Query(..., description="Soniox API Key"),
+    status: Optional[str] = Query(None, description="只返回该状态（queued / processing / completed / error），多个用逗号分隔"),
+    model: Optional[str] = Query(None, description="只返回该模型的转录"),
+    created_after: Optional[datetime] = Query(None, description="只返回该时间（含）之后创建的转录，ISO 8601"),
+    created_before: Optional[datetime] = Query(None, description="只返回该时间之前创建的转录，ISO 8601"),
+    aggregate_only: bool = Query(False, description="只输出最后的汇总行")
+):
+    """
+    服务端沿分页游标读取全部转录，每行一个转录（application/x-ndjson）
+    
+    最后一行为汇总：`{"done": true, "count", "total_audio_duration_ms", "pages", "elapsed"}`
+    """
+    statuses = {s.strip() for s in status.split(",") if s.strip()} if status else None
+    in_range = _created_between(created_after, created_before)
+    
+    def keep(item: dict) -> bool:
+        if statuses is not None and item.get("status") not in statuses:
+            return False
+        if model is not None and item.get("model") != model:
+            return False
+        return in_range(item)
+    
+    return _stream_listing(
+        api_key, "/transcriptions", "transcriptions", keep,
+        {"total_audio_duration_ms": "audio_duration_ms"}, aggregate_only
+    )
+
 @app.get("/api/transcriptions/{transcription_id}", tags=["Transcriptions API"], summary="转录详情", response_model=TranscriptionInfo)
 async def get_transcription(
     transcription_id: str,
@@ -525,22 +975,40 @@ async def get_transcription(
 ):
     """获取转录任务详情"""
     try:
-        async with httpx.AsyncClient(timeout=30.0) as client:
-            response = await client.get(
-                f"{SONIOX_API_BASE}/transcriptions/{transcription_id}",
-                headers={"Authorization": f"Bearer {api_key}"}
-            )
-            
-            if response.status_code != 200:
-                raise HTTPException(status_code=response.status_code, detail=response.text)
-            
-            return response.json()
+        return await meta_cache.cache.get_json(
+            api_key, f"/transcriptions/{transcription_id}", "transcription", meta_cache.transcription_ttl
+        )
     except HTTPException:
         raise
     except Exception as e:
         logger.exception(f"获取转录详情失败: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.get("/api/transcriptions/{transcription_id}/export", tags=["Transcriptions API"], summary="导出转录（字幕/文本）")
+async def export_transcription(
+    transcription_id: str,
+    api_key: str = Query(..., description="Soniox API Key"),
+    format: str = Query("srt", description="导出格式：srt / vtt / jsonl / text / json"),
+    enable_diarization: bool = Query(False, description="按说话人分段并标注说话人（转录需启用说话人分离）")
+):
+    """
+    获取已完成转录的 tokens 并导出：srt / vtt 字幕，jsonl 每行一个分段 `{"start", "end", "speaker", "text"}`，
+    text 为纯文本，json 为 `{"success", "words", "text"}`
+    
+    transcript 边下载边解析边输出，内存占用与转录长度无关
+    """
+    _check_format(format)
+    try:
+        tokens = await engine.open_tokens(api_key, transcription_id)
+        return _streamed_export(
+            transcript.stream_export(tokens, format, enable_diarization, dict), format, transcription_id
+        )
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.exception(f"导出转录失败: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
 @app.delete("/api/transcriptions/{transcription_id}", tags=["Transcriptions API"], summary="删除转录")
 async def delete_transcription(
     transcription_id: str,
@@ -548,22 +1016,44 @@ async def delete_transcription(
 ):
     """删除转录任务"""
     try:
-        async with httpx.AsyncClient(timeout=30.0) as client:
-            response = await client.delete(
-                f"{SONIOX_API_BASE}/transcriptions/{transcription_id}",
-                headers={"Authorization": f"Bearer {api_key}"}
-            )
-            
-            if response.status_code != 204:
-                raise HTTPException(status_code=response.status_code, detail=response.text)
-            
-            return {"success": True, "message": "转录已删除"}
+        client = upstream.get_client()
+        response = await client.delete(
+            f"/transcriptions/{transcription_id}",
+            headers=upstream.auth_headers(api_key)
+        )
+        await meta_cache.cache.invalidate_transcription(api_key, transcription_id)
+        
+        if response.status_code != 204:
+            raise HTTPException(status_code=response.status_code, detail=response.text)
+        
+        return {"success": True, "message": "转录已删除"}
     except HTTPException:
         raise
     except Exception as e:
         logger.exception(f"删除转录失败: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
+# ==================== 上游清理 ====================
+
+@app.post("/api/cleanup", tags=["Files API"], summary="清理过期文件和转录")
+async def cleanup_upstream(
+    api_key: str = Query(..., description="Soniox API Key"),
+    ttl: float = Query(janitor.JANITOR_TTL, ge=60, description="只清理创建超过该秒数的对象"),
+    dry_run: bool = Query(False, description="只统计，不删除")
+):
+    """
+    删除该 Key 下过期且未被进行中转录引用的文件和转录（失败任务遗留的对象会占用上游存储配额）
+    
+    只删除已结束（completed / error）的转录；返回扫描数、过期数、删除数和释放的字节数
+    """
+    try:
+        return await janitor.sweep(api_key, ttl=ttl, dry_run=dry_run)
+    except httpx.HTTPStatusError as e:
+        raise HTTPException(status_code=e.response.status_code, detail=e.response.text)
+    except Exception as e:
+        logger.exception(f"清理失败: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
 # ==================== Models API ====================
 
 @app.get("/api/models", tags=["Models API"], summary="列出模型", response_model=ModelsListResponse)
@@ -572,16 +1062,7 @@ async def list_models(
 ):
     """列出所有可用模型"""
     try:
-        async with httpx.AsyncClient(timeout=30.0) as client:
-            response = await client.get(
-                f"{SONIOX_API_BASE}/models",
-                headers={"Authorization": f"Bearer {api_key}"}
-            )
-            
-            if response.status_code != 200:
-                raise HTTPException(status_code=response.status_code, detail=response.text)
-            
-            return response.json()
+        return await meta_cache.cache.get_json(api_key, "/models", "models", meta_cache.models_ttl)
     except HTTPException:
         raise
     except Exception as e:
@@ -590,5 +1071,9 @@ async def list_models(
 
 if __name__ == "__main__":
     import uvicorn
-    logger.info(f"启动 Soniox ASR API v{API_VERSION}")
-    uvicorn.run(app, host="0.0.0.0", port=8001)
+    logger.info(f"启动 Soniox ASR API v{API_VERSION} | {shared_state.WORKERS} 个 worker | 共享状态: {shared_state.STATE_BACKEND}")
+    if shared_state.WORKERS > 1:
+        # 多进程需要以导入路径启动，各 worker 自行导入应用
+        uvicorn.run("server:app", host="0.0.0.0", port=8001, workers=shared_state.WORKERS)
+    else:
+        uvicorn.run(app, host="0.0.0.0", port=8001)
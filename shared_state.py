@@ -0,0 +1,199 @@
+"""
+多 worker 共享状态
+多 worker 部署时，结果缓存、元数据缓存、Key 熔断状态和异步任务记录需要在各 worker 进程间可见。
+后端可插拔，按命名空间 + 键存取 JSON 值，可带 TTL：
+- local：进程内字典，单进程默认；各模块仍使用自己的进程内结构
+- sqlite：本机 SQLite 文件（WAL），多 worker 默认；只依赖本地文件，不需要 Redis 等外部服务
+另提供基于文件锁的单实例任务（定时清理只在一个 worker 中运行）
+"""
+
+import asyncio
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+from loguru import logger
+
+try:
+    import fcntl
+except ImportError:
+    # 非 POSIX 平台没有 flock，只支持单 worker
+    fcntl = None
+
+# worker 进程数；大于 1 时 python server.py 以多进程方式启动
+WORKERS = max(1, int(os.getenv("SONIOX_WORKERS", "1")))
+# 共享状态后端：local / sqlite，默认单 worker 用 local、多 worker 用 sqlite
+# （用 gunicorn -w 等外部方式启动多 worker 时需要显式设为 sqlite）
+STATE_BACKEND = os.getenv("SONIOX_STATE_BACKEND", "") or ("sqlite" if WORKERS > 1 else "local")
+STATE_PATH = os.getenv("SONIOX_STATE_PATH", os.path.join("data", "state.db"))
+# 各 worker 从共享状态同步 Key 熔断状态的间隔（秒）
+STATE_SYNC_INTERVAL = float(os.getenv("SONIOX_STATE_SYNC_INTERVAL", "1"))
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS state (
+    ns TEXT NOT NULL,
+    key TEXT NOT NULL,
+    value TEXT NOT NULL,
+    expires_at REAL,
+    PRIMARY KEY (ns, key)
+) WITHOUT ROWID
+"""
+# 每写入这么多次清理一次过期行
+_PURGE_EVERY = 500
+
+
+class LocalBackend:
+    """进程内实现；shared=False 时各模块直接使用自己的进程内结构，不经过后端"""
+
+    shared = False
+
+    def __init__(self):
+        self._data: Dict[str, Dict[str, tuple]] = {}
+
+    def open(self):
+        pass
+
+    def close(self):
+        pass
+
+    async def get(self, ns: str, key: str) -> Optional[Any]:
+        item = self._data.get(ns, {}).get(key)
+        if item is None:
+            return None
+        expires_at, value = item
+        if expires_at is not None and expires_at <= time.time():
+            del self._data[ns][key]
+            return None
+        return value
+
+    async def set(self, ns: str, key: str, value: Any, ttl: Optional[float] = None):
+        self._data.setdefault(ns, {})[key] = (None if ttl is None else time.time() + ttl, value)
+
+    async def delete(self, ns: str, *keys: str):
+        items = self._data.get(ns, {})
+        for key in keys:
+            items.pop(key, None)
+
+    async def scan(self, ns: str) -> Dict[str, Any]:
+        now = time.time()
+        return {
+            key: value for key, (expires_at, value) in self._data.get(ns, {}).items()
+            if expires_at is None or expires_at > now
+        }
+
+
+class SQLiteBackend:
+    """
+    本机 SQLite 文件，同一台机器上的所有 worker 打开同一个文件
+
+    WAL 模式下读不阻塞写，synchronous=NORMAL 提交时不 fsync；读写在线程池中执行，不阻塞事件循环
+    """
+
+    shared = True
+
+    def __init__(self, path: str = STATE_PATH):
+        self.path = path
+        self._conn: Optional[sqlite3.Connection] = None
+        self._lock = threading.Lock()
+        self._writes = 0
+
+    def open(self):
+        if self._conn is not None:
+            return
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute("PRAGMA busy_timeout=5000")
+        conn.execute(_SCHEMA)
+        # 缓存的结果和 Key 状态只允许服务进程读写
+        os.chmod(self.path, 0o600)
+        self._conn = conn
+        logger.info(f"共享状态已打开: {self.path} (pid {os.getpid()})")
+
+    def close(self):
+        if self._conn is not None:
+            with self._lock:
+                self._conn.close()
+            self._conn = None
+
+    def _execute(self, sql: str, params: tuple = ()) -> list:
+        with self._lock:
+            return self._conn.execute(sql, params).fetchall()
+
+    async def get(self, ns: str, key: str) -> Optional[Any]:
+        rows = await asyncio.to_thread(
+            self._execute,
+            "SELECT value FROM state WHERE ns = ? AND key = ? AND (expires_at IS NULL OR expires_at > ?)",
+            (ns, key, time.time())
+        )
+        return json.loads(rows[0][0]) if rows else None
+
+    async def set(self, ns: str, key: str, value: Any, ttl: Optional[float] = None):
+        payload = json.dumps(value, ensure_ascii=False, separators=(",", ":"))
+        expires_at = None if ttl is None else time.time() + ttl
+        await asyncio.to_thread(
+            self._execute,
+            "INSERT OR REPLACE INTO state (ns, key, value, expires_at) VALUES (?, ?, ?, ?)",
+            (ns, key, payload, expires_at)
+        )
+        self._writes += 1
+        if self._writes % _PURGE_EVERY == 0:
+            await asyncio.to_thread(
+                self._execute, "DELETE FROM state WHERE expires_at IS NOT NULL AND expires_at <= ?", (time.time(),)
+            )
+
+    async def delete(self, ns: str, *keys: str):
+        if keys:
+            await asyncio.to_thread(
+                self._execute,
+                f"DELETE FROM state WHERE ns = ? AND key IN ({', '.join('?' * len(keys))})",
+                (ns, *keys)
+            )
+
+    async def scan(self, ns: str) -> Dict[str, Any]:
+        rows = await asyncio.to_thread(
+            self._execute,
+            "SELECT key, value FROM state WHERE ns = ? AND (expires_at IS NULL OR expires_at > ?)",
+            (ns, time.time())
+        )
+        return {key: json.loads(value) for key, value in rows}
+
+
+def _create_backend(name: str):
+    if name == "local":
+        return LocalBackend()
+    if name == "sqlite":
+        return SQLiteBackend()
+    raise ValueError(f"未知的共享状态后端: {name}（可选 local / sqlite）")
+
+
+backend = _create_backend(STATE_BACKEND)
+
+
+async def run_singleton(name: str, run: Callable[[], Awaitable[None]], retry_interval: float = 10.0):
+    """
+    多个 worker 中只有一个运行 run()：持有 <STATE_PATH>.<name>.lock 文件锁的进程运行，
+    其它进程每 retry_interval 秒重试一次，持有者退出后由其中一个接替。单进程（local 后端）时直接运行
+    """
+    if not backend.shared or fcntl is None:
+        await run()
+        return
+    lock_path = f"{STATE_PATH}.{name}.lock"
+    os.makedirs(os.path.dirname(os.path.abspath(lock_path)), exist_ok=True)
+    fd = os.open(lock_path, os.O_RDWR | os.O_CREAT, 0o600)
+    try:
+        while True:
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                break
+            except BlockingIOError:
+                await asyncio.sleep(retry_interval)
+        logger.info(f"{name} 由本 worker 运行 (pid {os.getpid()})")
+        await run()
+    finally:
+        # 关闭文件即释放锁
+        os.close(fd)
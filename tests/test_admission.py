@@ -0,0 +1,141 @@
+import asyncio
+
+import pytest
+from fastapi import HTTPException
+
+import admission
+
+
+def _controller(max_active=2, max_per_client=1, max_queue=2, queue_timeout=5.0):
+    return admission.AdmissionController("test", max_active, max_per_client, max_queue, queue_timeout)
+
+
+def _rejection(controller, client) -> HTTPException:
+    with pytest.raises(HTTPException) as info:
+        controller.check(client)
+    return info.value
+
+
+def test_per_client_limit_returns_429_with_retry_after():
+    async def run():
+        controller = _controller()
+        await controller.acquire("a")
+        error = _rejection(controller, "a")
+        assert error.status_code == 429
+        assert 1 <= int(error.headers["Retry-After"]) <= 60
+        with pytest.raises(HTTPException):
+            await controller.acquire("a")
+        # 其它客户端不受影响
+        await controller.acquire("b")
+        assert controller.stats()["active"] == 2 and controller.rejected == 2
+
+    asyncio.run(run())
+
+
+def test_queue_is_fifo_and_skips_clients_at_their_limit():
+    async def run():
+        controller = _controller(max_active=2, max_per_client=2, max_queue=3)
+        a1 = await controller.acquire("a")
+        a2 = await controller.acquire("a")
+        order = []
+
+        async def wait(client):
+            acquired_at = await controller.acquire(client)
+            order.append(client)
+            return acquired_at
+
+        waiters = [asyncio.ensure_future(wait(client)) for client in ("a", "b", "c")]
+        await asyncio.sleep(0)
+        assert controller.waiting == 3 and order == []
+
+        controller.release("a", a1)
+        await asyncio.sleep(0.01)
+        assert order == ["a"]
+        controller.release("a", a2)
+        await asyncio.sleep(0.01)
+        assert order == ["a", "b"]
+        assert controller.waiting == 1
+        for task in waiters[2:]:
+            task.cancel()
+        await asyncio.gather(*waiters, return_exceptions=True)
+        assert controller.waiting == 0
+
+    asyncio.run(run())
+
+
+def test_full_queue_and_timeout_return_503():
+    async def run():
+        controller = _controller(max_active=1, max_per_client=5, max_queue=1, queue_timeout=0.05)
+        await controller.acquire("a")
+        queued = asyncio.ensure_future(controller.acquire("b"))
+        await asyncio.sleep(0)
+
+        error = _rejection(controller, "c")
+        assert error.status_code == 503 and "Retry-After" in error.headers
+        with pytest.raises(HTTPException) as info:
+            await queued
+        assert info.value.status_code == 503 and "排队超过" in info.value.detail
+        assert controller.waiting == 0
+
+    asyncio.run(run())
+
+
+def test_unbounded_waiters_ignore_queue_limit_and_timeout():
+    async def run():
+        controller = _controller(max_active=1, max_per_client=5, max_queue=0, queue_timeout=0.01)
+        acquired_at = await controller.acquire("a")
+        background = asyncio.ensure_future(controller.acquire("a", bounded=False))
+        await asyncio.sleep(0.05)
+        assert not background.done()
+        controller.release("a", acquired_at)
+        await asyncio.wait_for(background, 1)
+        assert controller.active == 1
+
+    asyncio.run(run())
+
+
+def test_retry_after_grows_with_hold_time_and_queue():
+    async def run():
+        controller = _controller(max_active=1, max_per_client=5, max_queue=10)
+        base = controller.retry_after()
+        controller._hold_ewma = 20.0
+        assert controller.retry_after() == 20
+        await controller.acquire("a")
+        waiter = asyncio.ensure_future(controller.acquire("b"))
+        await asyncio.sleep(0)
+        assert controller.retry_after() == 40 > base
+        waiter.cancel()
+        await asyncio.gather(waiter, return_exceptions=True)
+
+    asyncio.run(run())
+
+
+def test_gate_rejects_before_reading_the_body():
+    async def run():
+        controller = _controller(max_active=1, max_per_client=5, max_queue=0)
+        called = []
+
+        async def app(scope, receive, send):
+            called.append(scope["path"])
+
+        async def receive():
+            raise AssertionError("请求体不应被读取")
+
+        sent = []
+
+        async def send(message):
+            sent.append(message)
+
+        gate = admission.AdmissionGate(app, controller, ["/transcribe"])
+        scope = {"type": "http", "method": "POST", "path": "/transcribe", "headers": []}
+        await gate(scope, receive, send)
+        assert called == ["/transcribe"]
+
+        await controller.acquire("a")
+        await gate(scope, receive, send)
+        await gate({**scope, "path": "/health", "method": "GET"}, receive, send)
+        assert called == ["/transcribe", "/health"]
+        assert sent[0]["status"] == 503
+        assert (b"retry-after", str(controller.retry_after()).encode()) in sent[0]["headers"]
+
+    asyncio.run(run())
@@ -0,0 +1,45 @@
+from assembler import TranscriptAssembler
+
+
+def _token(text, start, end, is_final=True, **extra):
+    return {"text": text, "start_ms": start, "end_ms": end, "is_final": is_final, **extra}
+
+
+def test_deltas_and_partial_replacement():
+    assembler = TranscriptAssembler()
+    assert assembler.feed({"tokens": [_token("Hel", 0, 100, is_final=False)]}) == {"partial": "Hel"}
+    assert assembler.feed({"tokens": [_token("Hel", 0, 100, is_final=False)]}) is None
+    delta = assembler.feed({"tokens": [_token("Hello", 0, 200), _token(" wor", 300, 400, is_final=False)]})
+    assert delta == {"final": "Hello", "partial": " wor"}
+    delta = assembler.feed({"tokens": [_token(" world", 300, 500), _token("<end>", 500, 500)], "total_audio_proc_ms": 600})
+    assert delta == {"final": " world", "partial": "", "total_audio_proc_ms": 600}
+    assert len(assembler) == 2
+
+
+def test_summary_matches_file_transcription_shape():
+    assembler = TranscriptAssembler(enable_diarization=True)
+    assembler.feed({"tokens": [
+        _token("Hi", 0, 200, speaker="1"), _token(".", 200, 250, speaker="1"),
+        _token(" Yes", 3000, 3300, speaker="2"),
+    ]})
+    summary = assembler.summary()
+
+    assert summary["finished"] is True
+    assert summary["text"] == "说话人 1: Hi.\n\n说话人 2:  Yes"
+    assert summary["words"] == [
+        {"text": "Hi.", "start_time": 0.0, "end_time": 0.25, "speaker": "1"},
+        {"text": " Yes", "start_time": 3.0, "end_time": 3.3, "speaker": "2"},
+    ]
+    assert "export" not in summary and "translation" not in summary
+
+
+def test_summary_export_and_translation():
+    assembler = TranscriptAssembler(export_format="srt")
+    assembler.feed({"tokens": [
+        _token("Hello", 0, 500), _token(".", 500, 600),
+        _token("你好", 0, 0, translation_status="translation"),
+    ]})
+    summary = assembler.summary()
+
+    assert summary["translation"] == "你好"
+    assert summary["export"] == "1\n00:00:00,000 --> 00:00:00,600\nHello.\n\n"
@@ -0,0 +1,91 @@
+import asyncio
+import io
+import os
+import wave
+
+import pytest
+
+import audio_split
+import engine
+
+
+def _wav(seconds: int, rate: int = 8000) -> io.BytesIO:
+    buffer = io.BytesIO()
+    with wave.open(buffer, "wb") as wav:
+        wav.setnchannels(1)
+        wav.setsampwidth(2)
+        wav.setframerate(rate)
+        wav.writeframes(b"\x00\x00" * rate * seconds)
+    buffer.seek(0)
+    return buffer
+
+
+def test_chunked_failure_cancels_other_segments(monkeypatch):
+    """一个分段失败后其余分段不再开始，也不会读取已删除的临时文件"""
+    monkeypatch.setattr(engine, "CHUNK_CONCURRENCY", 2)
+    events = []
+
+    async def fake_transcribe_tokens(reader, filename, size, keys_list, enable_diarization):
+        events.append(("start", filename))
+        if filename.endswith("part1.wav"):
+            await asyncio.sleep(0.01)
+            events.append(("failed", filename))
+            raise RuntimeError("upstream error")
+        await asyncio.sleep(0.05)
+        events.append(("read", filename, os.path.exists(reader.path)))
+        await reader.read()
+        return [], {}, {}
+
+    monkeypatch.setattr(engine, "transcribe_tokens", fake_transcribe_tokens)
+    fileobj = _wav(5)
+    segments = [audio_split.Segment(i, i * 8000, (i + 1) * 8000, 8000) for i in range(5)]
+    written = []
+    write_segments = audio_split.write_segments
+    monkeypatch.setattr(
+        audio_split, "write_segments", lambda *args: written.extend(write_segments(*args)) or list(written)
+    )
+
+    with pytest.raises(RuntimeError):
+        asyncio.run(engine.run_chunked_transcription(fileobj, "talk.wav", segments, ["k"], False))
+
+    failed_at = events.index(("failed", "talk.part1.wav"))
+    assert [event for event in events[failed_at:] if event[0] != "failed"] == []
+    assert [event[1] for event in events if event[0] == "start"] == ["talk.part1.wav", "talk.part2.wav"]
+    assert written and not any(os.path.exists(path) for path in written)
+
+
+def test_chunked_merges_segment_offsets(monkeypatch):
+    async def fake_transcribe_tokens(reader, filename, size, keys_list, enable_diarization):
+        return [{"text": " w" + filename[-5], "start_ms": 0, "end_ms": 100}], {"audio_duration_ms": 1000}, {}
+
+    monkeypatch.setattr(engine, "transcribe_tokens", fake_transcribe_tokens)
+    segments = [audio_split.Segment(i, i * 8000, (i + 1) * 8000, 8000) for i in range(3)]
+    result = asyncio.run(engine.run_chunked_transcription(_wav(3), "talk.wav", segments, ["k"], False))
+
+    assert result["total_chunks"] == 3
+    assert result["audio_duration"] == 3.0
+    assert [word["start_time"] for word in result["words"]] == [0.0, 1.0, 2.0]
+
+
+def test_result_cache_is_scoped_to_api_keys(monkeypatch, tmp_path):
+    monkeypatch.setattr(engine.result_cache, "CACHE_ENABLED", True)
+    monkeypatch.setattr(engine.result_cache, "cache", engine.result_cache.ResultCache(directory=str(tmp_path)))
+    calls = []
+
+    async def compute(cache_key):
+        calls.append(cache_key)
+        return {"success": True, "text": f"result {len(calls)}"}
+
+    async def transcribe(keys_list):
+        return await engine.with_result_cache(_wav(1), keys_list, engine.cache_options(False), True, compute)
+
+    async def run():
+        assert (await transcribe(["owner"]))["text"] == "result 1"
+        assert (await transcribe(["owner"]))["text"] == "result 1"
+        # 其它 Key 提交相同内容：不命中内存或磁盘缓存
+        engine.result_cache.cache._memory.clear()
+        assert (await transcribe(["zzz"]))["text"] == "result 2"
+        assert (await transcribe(["owner"]))["text"] == "result 1"
+
+    asyncio.run(run())
+    assert len(calls) == 2 and calls[0] != calls[1]
@@ -0,0 +1,37 @@
+import asyncio
+import time
+
+import journal
+
+
+def test_count_runs_off_the_event_loop(tmp_path, monkeypatch):
+    store = journal.Journal(str(tmp_path / "journal.db"))
+    store.open()
+    try:
+        async def run():
+            assert await store.count() == 0
+            await store.begin("a.wav", False)
+            await store.begin("b.wav", False)
+            assert await store.count() == 2
+
+            # 模拟等待其它 worker 的文件锁：查询期间事件循环仍能调度其它任务
+            execute = store._execute
+            monkeypatch.setattr(store, "_execute", lambda *args: time.sleep(0.2) or execute(*args))
+            ticks = []
+
+            async def tick():
+                for _ in range(5):
+                    ticks.append(time.monotonic())
+                    await asyncio.sleep(0.01)
+
+            count, _ = await asyncio.gather(store.count(), tick())
+            assert count == 2
+            assert len(ticks) == 5 and ticks[-1] - ticks[0] < 0.15
+
+        asyncio.run(run())
+    finally:
+        store.close()
+
+
+def test_count_without_sqlite():
+    assert asyncio.run(journal.Journal("").count()) == 0
@@ -0,0 +1,128 @@
+import pytest
+
+import keypool
+import metrics
+import server
+
+
+def _samples(metric):
+    return {line for line in metric.render() if not line.startswith("#")}
+
+
+def test_metrics_label_only_verified_keys(monkeypatch):
+    pool = keypool.KeyPool()
+    monkeypatch.setattr(keypool, "pool", pool)
+    monkeypatch.setattr(metrics.KEY_RESULTS, "_values", {})
+    good = pool.acquire(["good-key-000001"])
+    pool.record(good, 200)
+    # 前缀相同的另一个 Key 不会并入同一标签
+    twin = pool.acquire(["good-key-000002"])
+    pool.record(twin, 200)
+    pool.release(twin)
+    for i in range(50):
+        key = pool.acquire([f"random-{i:06d}"])
+        pool.record(key, 401)
+    server._collect_metrics()
+
+    good_label = keypool.KeyState(good).label
+    twin_label = keypool.KeyState(twin).label
+    assert good_label != twin_label and "good" not in good_label
+    assert _samples(metrics.KEY_IN_FLIGHT) == {
+        f'soniox_key_in_flight{{key="{good_label}"}} 1',
+        f'soniox_key_in_flight{{key="{twin_label}"}} 0',
+        'soniox_key_in_flight{key="other"} 50',
+    }
+    assert _samples(metrics.KEY_RESULTS) == {
+        f'soniox_key_results_total{{key="{good_label}",outcome="success"}} 1',
+        f'soniox_key_results_total{{key="{twin_label}",outcome="success"}} 1',
+        'soniox_key_results_total{key="other",outcome="failure"} 50',
+    }
+    assert not any("good-key" in line for line in metrics.render().splitlines())
+
+    # keypool 清理掉的 Key 在下次抓取时不再输出负载与熔断状态，累计次数不回落
+    monkeypatch.setattr(pool, "_states", {})
+    server._collect_metrics()
+    assert _samples(metrics.KEY_IN_FLIGHT) == {'soniox_key_in_flight{key="other"} 0'}
+    assert _samples(metrics.KEY_AVAILABLE) == set()
+    assert 'soniox_key_results_total{key="other",outcome="failure"} 50' in _samples(metrics.KEY_RESULTS)
+    assert f'soniox_key_results_total{{key="{good_label}",outcome="success"}} 1' in _samples(metrics.KEY_RESULTS)
+
+
+class _Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = _Clock()
+    monkeypatch.setattr(keypool.time, "monotonic", clock)
+    return clock
+
+
+def test_acquire_prefers_least_loaded_healthy_key(clock):
+    pool = keypool.KeyPool()
+    first = pool.acquire(["a", "b"])
+    second = pool.acquire(["a", "b"])
+    assert {first, second} == {"a", "b"}
+    assert pool.acquire(["a", "b"], exclude=["a"]) == "b"
+    pool.release("a")
+    assert pool.acquire(["a", "b"]) == "a"
+    with pytest.raises(ValueError):
+        pool.acquire(["a"], exclude=["a"])
+
+
+def test_auth_failure_opens_breaker_until_cooldown(clock, monkeypatch):
+    monkeypatch.setattr(keypool, "KEY_AUTH_COOLDOWN", 300)
+    pool = keypool.KeyPool()
+    pool.record("a", 401)
+    assert pool.acquire(["a", "b"]) == "b"
+    pool.release("b")
+    clock.now += 299
+    assert pool.acquire(["a", "b"]) == "b"
+    pool.release("b")
+    clock.now += 2
+    assert pool.snapshot(["a"])[0]["available"]
+
+
+def test_rate_limit_uses_retry_after(clock):
+    pool = keypool.KeyPool()
+    pool.record("a", 429, retry_after="7")
+    assert pool.snapshot(["a"])[0]["cooldown"] == 7
+    pool.record("b", 429, retry_after="soon")
+    assert pool.snapshot(["b"])[0]["cooldown"] == keypool.KEY_RATE_LIMIT_COOLDOWN
+
+
+def test_server_errors_open_after_threshold_with_exponential_backoff(clock, monkeypatch):
+    monkeypatch.setattr(keypool, "KEY_FAILURE_THRESHOLD", 3)
+    monkeypatch.setattr(keypool, "KEY_ERROR_COOLDOWN", 10)
+    monkeypatch.setattr(keypool, "KEY_MAX_COOLDOWN", 35)
+    pool = keypool.KeyPool()
+    pool.record("a", 503)
+    pool.record("a", None)
+    assert pool.snapshot(["a"])[0]["available"]
+    cooldowns = []
+    for _ in range(4):
+        pool.record("a", 500)
+        cooldowns.append(pool.snapshot(["a"])[0]["cooldown"])
+    assert cooldowns == [10, 20, 35, 35]
+
+
+def test_half_open_probe_and_recovery(clock, monkeypatch):
+    monkeypatch.setattr(keypool, "KEY_AUTH_COOLDOWN", 300)
+    monkeypatch.setattr(keypool, "KEY_RATE_LIMIT_COOLDOWN", 30)
+    pool = keypool.KeyPool()
+    pool.record("a", 401)
+    pool.record("b", 429)
+    # 全部熔断时试探最早恢复的 Key
+    probe = pool.acquire(["a", "b"])
+    assert probe == "b"
+    pool.record(probe, 200)
+    pool.release(probe)
+    state = pool.snapshot(["b"])[0]
+    assert state["available"] and state["cooldown"] == 0 and state["last_status"] == 200
+    assert pool._states["b"].consecutive_failures == 0
+    assert pool.acquire(["a", "b"]) == "b"
@@ -0,0 +1,53 @@
+import asyncio
+
+import engine
+import mcp_server
+
+
+def test_inprocess_batch_isolates_failures_and_caps_concurrency(monkeypatch):
+    monkeypatch.setattr(engine, "BATCH_MAX_CONCURRENCY", 2)
+    running = []
+    peak = []
+
+    async def fake_transcribe_path(path, keys_list, enable_diarization):
+        running.append(path)
+        peak.append(len(running))
+        await asyncio.sleep(0.01)
+        running.remove(path)
+        if path.endswith("bad.wav"):
+            raise ValueError("不是 PCM WAV")
+        return {"success": True, "text": path}
+
+    monkeypatch.setattr(engine, "transcribe_path", fake_transcribe_path)
+    paths = ["/a/1.wav", "/a/bad.wav", "/a/3.wav", "/a/4.wav"]
+    result = asyncio.run(mcp_server._call_inprocess(
+        "transcribe_batch", {"file_paths": paths, "api_key": "k", "concurrency": 100}
+    ))
+
+    assert (result["total"], result["succeeded"], result["failed"]) == (4, 3, 1)
+    failed = [item for item in result["results"] if not item["success"]]
+    assert failed == [{"index": 1, "filename": "bad.wav", "success": False, "status_code": 500, "error": "不是 PCM WAV"}]
+    assert max(peak) == 2
+
+
+def test_oversized_line_is_discarded_whole():
+    request = b'{"jsonrpc": "2.0", "id": 2, "method": "tools/list"}\n'
+
+    async def run():
+        reader = asyncio.StreamReader(limit=64)
+
+        async def feed():
+            # 超长的行分多次到达：换行出现之前缓冲已超过上限
+            for _ in range(5):
+                reader.feed_data(b'{"id": 1, "x": "' + b"a" * 40)
+                await asyncio.sleep(0)
+            reader.feed_data(b'"}\n' + request)
+            reader.feed_data(b"b" * 100 + b"\n" + b'{"id": 3}')
+            reader.feed_eof()
+
+        feeder = asyncio.ensure_future(feed())
+        lines = [line async for line in mcp_server._read_lines(reader)]
+        await feeder
+        return lines
+
+    assert asyncio.run(run()) == [request.decode(), '{"id": 3}']
@@ -0,0 +1,42 @@
+import json
+import os
+import threading
+
+from result_cache import ResultCache
+
+
+def test_concurrent_writers_never_publish_partial_files(tmp_path):
+    """两个进程（各自的锁）同时写同一个键：缓存文件始终是某一次完整写入的内容"""
+    workers = [ResultCache(directory=str(tmp_path)) for _ in range(2)]
+    key = "ab" + "0" * 62
+    path = workers[0]._path(key)
+    values = [{"text": str(i) * 200_000} for i in range(2)]
+    errors = []
+
+    def write(cache, value):
+        for _ in range(20):
+            try:
+                cache._write_disk(key, value, 0.0)
+            except OSError as e:
+                errors.append(str(e))
+
+    def read():
+        for _ in range(200):
+            try:
+                with open(path, encoding="utf-8") as f:
+                    if json.load(f) not in values:
+                        errors.append("unexpected content")
+            except FileNotFoundError:
+                pass
+            except ValueError as e:
+                errors.append(str(e))
+
+    threads = [threading.Thread(target=write, args=(w, v)) for w, v in zip(workers, values)]
+    threads.append(threading.Thread(target=read))
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert errors == []
+    assert os.listdir(os.path.dirname(path)) == [os.path.basename(path)]
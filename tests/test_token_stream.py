@@ -0,0 +1,86 @@
+import asyncio
+import json
+import random
+
+import pytest
+
+import token_stream
+
+TOKENS = [
+    {"text": "Hello", "start_ms": 0, "end_ms": 250, "confidence": 0.98},
+    {"text": " 世界", "start_ms": 300, "end_ms": 550.5, "speaker": "1"},
+    {"text": " \"quoted\" \\ back\nslash\té\U0001F600", "start_ms": 600, "end_ms": -1e3},
+    {"text": "]},{\"tokens\":[", "translation_status": None, "is_final": True},
+    {"text": "你好", "nested": {"a": [1, 2, {"b": "}"}]}},
+]
+PAYLOAD = {
+    "id": "abc",
+    "text": "全文 \"含引号\" 和 ] } 括号 \\" * 3,
+    "meta": {"tokens": ["not", "these"], "n": [1.5e-3, True, None]},
+    "tokens": TOKENS,
+    "trailing": 12345678901234567890,
+}
+
+
+def _chunks(data: bytes, sizes):
+    async def generate():
+        position = 0
+        for size in sizes:
+            if position >= len(data):
+                break
+            yield data[position:position + size]
+            position += size
+        if position < len(data):
+            yield data[position:]
+    return generate()
+
+
+def _parse(data: bytes, sizes) -> list:
+    async def run():
+        return [token async for token in token_stream.iter_tokens(_chunks(data, sizes))]
+    return asyncio.run(run())
+
+
+@pytest.mark.parametrize("ensure_ascii", [False, True])
+@pytest.mark.parametrize("indent", [None, 2])
+def test_every_single_split_point(ensure_ascii, indent):
+    """任意位置切成两块（包括多字节 UTF-8 字符中间、转义符中间、数字中间）结果都与 json.loads 一致"""
+    data = json.dumps(PAYLOAD, ensure_ascii=ensure_ascii, indent=indent).encode()
+    for split in range(1, len(data)):
+        assert _parse(data, [split]) == TOKENS, split
+
+
+def test_one_byte_chunks():
+    data = json.dumps(PAYLOAD, ensure_ascii=False).encode()
+    assert _parse(data, [1] * len(data)) == TOKENS
+
+
+def test_random_chunk_sizes():
+    rng = random.Random(7)
+    tokens = [{"text": rng.choice(["词", " word", "\\", "\"", "é"]) * rng.randint(1, 5), "start_ms": i * 10, "end_ms": i * 10 + 9.5}
+              for i in range(2000)]
+    data = json.dumps({"text": "x" * 10000, "tokens": tokens}, ensure_ascii=False).encode()
+    for _ in range(20):
+        assert _parse(data, iter(lambda: rng.randint(1, 4096), 0)) == tokens
+
+
+def test_numbers_cut_at_chunk_boundary():
+    data = b'{"tokens":[{"end_ms":4.25},12345,-0.5e+10]}'
+    for split in range(1, len(data)):
+        assert _parse(data, [split]) == [{"end_ms": 4.25}, 12345, -0.5e10]
+
+
+@pytest.mark.parametrize("data", [b'{}', b' { "id" : 1 } ', b'{"tokens":[]}', b'{"tokens":[],"text":"a"}'])
+def test_empty_or_missing_tokens(data):
+    assert _parse(data, [3]) == []
+
+
+@pytest.mark.parametrize("data", [
+    b'{"tokens":[{"text":"a"},',
+    b'{"tokens":[{"text":"a"}',
+    b'{"text":"unterminated',
+    b'[1, 2]',
+])
+def test_truncated_or_malformed_input_raises(data):
+    with pytest.raises(ValueError):
+        _parse(data, [4])
@@ -0,0 +1,126 @@
+import asyncio
+import json
+
+import pytest
+
+import transcript
+
+
+def _token(text, start, end, speaker=None):
+    token = {"text": text, "start_ms": start, "end_ms": end}
+    if speaker is not None:
+        token["speaker"] = speaker
+    return token
+
+
+TOKENS = [
+    _token("Hel", 0, 100, "1"), _token("lo", 100, 250, "1"), _token(",", 250, 260, "1"),
+    _token(" wor", 300, 400, "1"), _token("ld", 400, 550, "1"), _token(".", 550, 600, "1"),
+    {"text": " ", "speaker": "1"},
+    _token(" 你", 3_723_000, 3_723_200, "2"), _token("好", 3_723_200, 3_723_400, "2"), _token("！ ", 3_723_400, 3_723_450, "2"),
+    _token(" again", 3_800_000, 3_800_400, "1"),
+]
+
+
+def test_build_merges_subwords_and_keeps_cjk_per_character():
+    text, words = transcript.build(TOKENS, enable_diarization=True)
+    assert text == "说话人 1: Hello, world. \n\n说话人 2:  你好！ \n\n说话人 1:  again"
+    assert [(w["text"], w["start_time"], w["end_time"], w["speaker"]) for w in words] == [
+        ("Hello,", 0.0, 0.26, "1"), (" world.", 0.3, 0.6, "1"),
+        (" 你", 3723.0, 3723.2, "2"), ("好！ ", 3723.2, 3723.45, "2"), (" again", 3800.0, 3800.4, "1"),
+    ]
+
+
+def test_build_without_diarization():
+    text, words = transcript.build(TOKENS, enable_diarization=False)
+    assert text == "Hello, world.  你好！  again"
+    assert all("speaker" not in word for word in words)
+
+
+def test_srt_and_vtt_timing():
+    text, words = transcript.build(TOKENS, enable_diarization=True)
+    assert "".join(transcript.export(text, words, "srt")) == (
+        "1\n00:00:00,000 --> 00:00:00,600\n说话人 1: Hello, world.\n\n"
+        "2\n01:02:03,000 --> 01:02:03,450\n说话人 2: 你好！\n\n"
+        "3\n01:03:20,000 --> 01:03:20,400\n说话人 1: again\n\n"
+    )
+    assert "".join(transcript.export(text, words, "vtt")) == (
+        "WEBVTT\n\n"
+        "00:00:00.000 --> 00:00:00.600\n<v 说话人 1>Hello, world.\n\n"
+        "01:02:03.000 --> 01:02:03.450\n<v 说话人 2>你好！\n\n"
+        "01:03:20.000 --> 01:03:20.400\n<v 说话人 1>again\n\n"
+    )
+
+
+def test_timestamp_rounding():
+    assert transcript._timestamp(0.0004, ",") == "00:00:00,000"
+    assert transcript._timestamp(59.9996, ".") == "00:01:00.000"
+    assert transcript._timestamp(-1, ",") == "00:00:00,000"
+
+
+def _words(*spans, speaker=None):
+    return [{"text": f" w{i}", "start_time": start, "end_time": end, **({"speaker": speaker} if speaker else {})}
+            for i, (start, end) in enumerate(spans)]
+
+
+def test_segments_break_on_gap_duration_and_length(monkeypatch):
+    monkeypatch.setattr(transcript, "SUBTITLE_MAX_GAP", 1.0)
+    monkeypatch.setattr(transcript, "SUBTITLE_MAX_SECONDS", 3.0)
+    monkeypatch.setattr(transcript, "SUBTITLE_MAX_CHARS", 9)
+    # 停顿 > 1 秒
+    assert [s["text"] for s in transcript.segments(_words((0, 0.5), (1.6, 2)))] == ["w0", "w1"]
+    # 时长 > 3 秒
+    assert [s["text"] for s in transcript.segments(_words((0, 1), (1, 2), (2, 3.5)))] == ["w0 w1", "w2"]
+    # 字符数 > 9（每个词 3 个字符）
+    assert [s["text"] for s in transcript.segments(_words((0, 0.1), (0.1, 0.2), (0.2, 0.3), (0.3, 0.4)))] == ["w0 w1 w2", "w3"]
+
+
+def test_segments_break_on_speaker_and_sentence_end():
+    words = _words((0, 1), speaker="1") + _words((1, 2), speaker="2")
+    assert [(s["speaker"], s["text"]) for s in transcript.segments(words)] == [("1", "w0"), ("2", "w0")]
+    words = [{"text": "Done.", "start_time": 0, "end_time": 1}, {"text": " Next", "start_time": 1, "end_time": 2}]
+    assert [s["text"] for s in transcript.segments(words)] == ["Done.", "Next"]
+
+
+def test_jsonl_and_text_export():
+    text, words = transcript.build(TOKENS, enable_diarization=False)
+    lines = [json.loads(line) for line in "".join(transcript.export(text, words, "jsonl")).splitlines()]
+    assert lines[0] == {"start": 0.0, "end": 0.6, "text": "Hello, world."}
+    assert "".join(transcript.export(text, words, "text")) == text + "\n"
+    with pytest.raises(ValueError):
+        list(transcript.export(text, words, "json"))
+
+
+async def _aiter(items):
+    for item in items:
+        yield item
+
+
+def _stream(tokens, fmt, enable_diarization, summary=dict):
+    async def run():
+        return "".join([chunk async for chunk in transcript.stream_export(_aiter(tokens), fmt, enable_diarization, summary)])
+    return asyncio.run(run())
+
+
+@pytest.mark.parametrize("enable_diarization", [False, True])
+@pytest.mark.parametrize("fmt", ["srt", "vtt", "jsonl", "text"])
+def test_stream_export_equals_export(fmt, enable_diarization):
+    text, words = transcript.build(TOKENS, enable_diarization)
+    assert _stream(TOKENS, fmt, enable_diarization) == "".join(transcript.export(text, words, fmt))
+
+
+@pytest.mark.parametrize("enable_diarization", [False, True])
+def test_stream_json_equals_build(enable_diarization, monkeypatch):
+    # 文本超过内存上限时转存临时文件，结果不变
+    monkeypatch.setattr(transcript, "TEXT_SPOOL_BYTES", 16)
+    tokens = TOKENS * 50
+    text, words = transcript.build(tokens, enable_diarization)
+    body = json.loads(_stream(tokens, "json", enable_diarization, lambda: {"audio_duration": 1.5}))
+    assert body == {"success": True, "words": words, "text": text, "audio_duration": 1.5}
+    assert list(body) == ["success", "words", "text", "audio_duration"]
+
+
+def test_stream_empty_tokens():
+    assert json.loads(_stream([], "json", False)) == {"success": True, "words": [], "text": ""}
+    assert _stream([], "srt", False) == ""
+    assert _stream([{"text": "  "}], "text", False) == "\n"
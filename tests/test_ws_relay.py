@@ -0,0 +1,173 @@
+import asyncio
+import json
+
+import pytest
+from starlette.websockets import WebSocketDisconnect
+
+import ws_relay
+
+
+class _Upstream:
+    """依次产出 messages，之后抛出 error（模拟上游断开）"""
+
+    def __init__(self, messages, error=None):
+        self.messages = messages
+        self.error = error
+
+    def __aiter__(self):
+        return self._iterate()
+
+    async def _iterate(self):
+        for message in self.messages:
+            yield message
+        if self.error is not None:
+            raise self.error
+
+
+def test_flow_buffer_pauses_at_high_watermark_and_resumes_at_low():
+    async def run():
+        buffer = ws_relay.FlowBuffer("response", high=10, low=4)
+        await buffer.put("a" * 6, 6)
+        await buffer.put("b" * 6, 6)
+        assert buffer.paused
+        blocked = asyncio.ensure_future(buffer.put("c", 1))
+        await asyncio.sleep(0.01)
+        assert not blocked.done()
+        assert await buffer.get() == "a" * 6
+        await asyncio.sleep(0.01)
+        assert not blocked.done()
+        assert await buffer.get() == "b" * 6
+        await asyncio.wait_for(blocked, 1)
+        assert not buffer.paused and buffer.size == 1
+
+    asyncio.run(run())
+
+
+def test_end_of_stream_does_not_block_while_client_is_paused(monkeypatch):
+    monkeypatch.setattr(ws_relay, "WS_RESPONSE_HIGH_WATERMARK", 10)
+    monkeypatch.setattr(ws_relay, "WS_RESPONSE_LOW_WATERMARK", 4)
+
+    async def run():
+        relay = ws_relay.Relay(None, _Upstream(["x" * 20], ConnectionError("upstream closed")), lambda message: False)
+        with pytest.raises(ConnectionError):
+            await asyncio.wait_for(relay._read_upstream(), 1)
+        assert relay.responses.paused
+        assert await relay.responses.get() == "x" * 20
+        assert await relay.responses.get() is None
+
+    asyncio.run(run())
+
+
+class _Client:
+    """依次发送 audio 中的音频块和结束信号，记录收到的响应"""
+
+    def __init__(self, audio):
+        self.audio = list(audio) + [b""]
+        self.sent = []
+
+    async def receive_bytes(self):
+        await asyncio.sleep(0.01)
+        return self.audio.pop(0)
+
+    async def send_text(self, message):
+        self.sent.append(message)
+
+
+class _KeyedUpstream:
+    """收到 reject_after 个音频块后返回错误并断开；否则在结束帧后返回 finished"""
+
+    def __init__(self, reject_after=None):
+        self.reject_after = reject_after
+        self.received = []
+        self.closed = False
+        self._responses = asyncio.Queue()
+
+    async def send(self, data):
+        if self.closed:
+            raise ws_relay.websockets.exceptions.ConnectionClosedOK(None, None)
+        self.received.append(data)
+        if len(self.received) == self.reject_after:
+            self.closed = True
+            self._responses.put_nowait('{"error_code": 401, "error_message": "Invalid API key"}')
+            self._responses.put_nowait(None)
+        elif data == b"":
+            self._responses.put_nowait('{"tokens": [], "finished": true}')
+            self._responses.put_nowait(None)
+
+    async def close(self):
+        self.closed = True
+
+    def __aiter__(self):
+        return self._iterate()
+
+    async def _iterate(self):
+        while (message := await self._responses.get()) is not None:
+            yield message
+
+
+def test_rejected_key_fails_over_and_replays_audio():
+    async def run():
+        audio = [b"a", b"b", b"c"]
+        client, first, second = _Client(audio), _KeyedUpstream(reject_after=2), _KeyedUpstream()
+        codes = []
+
+        async def failover(error_code):
+            codes.append(error_code)
+            return second
+
+        relay = ws_relay.Relay(client, first, lambda message: "finished" in message, failover=failover)
+        await asyncio.wait_for(relay.run(), 2)
+        assert codes == [401] and relay.failovers == 1
+        assert second.received == audio + [b""]
+        assert client.sent == ['{"tokens": [], "finished": true}']
+
+    asyncio.run(run())
+
+
+def test_rejection_is_forwarded_without_failover():
+    async def run():
+        client, upstream = _Client([b"a", b"b"]), _KeyedUpstream(reject_after=1)
+        relay = ws_relay.Relay(client, upstream, lambda message: False)
+        await asyncio.wait_for(relay.run(), 2)
+        assert relay.failovers == 0
+        assert client.sent == ['{"error_code": 401, "error_message": "Invalid API key"}']
+
+    asyncio.run(run())
+
+
+def _session(config, audio=()):
+    from fastapi.testclient import TestClient
+
+    import server
+
+    with TestClient(server.app).websocket_connect("/ws/transcribe") as websocket:
+        websocket.send_text(json.dumps(config))
+        for chunk in list(audio) + [b""]:
+            websocket.send_bytes(chunk)
+        messages = []
+        try:
+            while True:
+                messages.append(json.loads(websocket.receive_text()))
+        except WebSocketDisconnect:
+            return messages
+
+
+def test_export_format_turns_on_server_assembly(monkeypatch):
+    upstream = _KeyedUpstream()
+
+    async def connect_upstream():
+        return upstream
+
+    monkeypatch.setattr(ws_relay, "WS_SERVER_ASSEMBLY", False)
+    monkeypatch.setattr(ws_relay, "connect_upstream", connect_upstream)
+    messages = _session({"api_key": "k", "export_format": "srt"}, [b"a"])
+    assert messages[-1]["finished"] is True and messages[-1]["export"] == ""
+    assert upstream.received[1:] == [b"a", b""]
+
+
+def test_export_format_without_server_assembly_is_rejected():
+    messages = _session({"api_key": "k", "export_format": "srt", "server_assembly": False})
+    assert messages == [{"error": "导出格式 srt 需要开启 server_assembly"}]
+    assert _session({"api_key": "k", "export_format": "json"}) == [
+        {"error": "不支持的导出格式: json（可选 srt / vtt / jsonl / text）"}
+    ]
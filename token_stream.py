@@ -0,0 +1,162 @@
+"""
+转录结果的增量解析
+Soniox transcript 响应 {"id", "text", "tokens": [...]} 按字节流边接收边解析：tokens 以外的顶层字段直接跳过
+（完整文本不在内存中拼出），tokens 数组的元素逐个解析输出，内存占用只与单个 token 和网络块大小有关
+"""
+
+import codecs
+import json
+import re
+from typing import Any, AsyncIterator
+
+_WHITESPACE = re.compile(r"[ \t\n\r]*")
+# 字符串内容（不含结束引号）；块边界截断在转义符后时停在反斜杠处，读入更多后继续
+_STRING_BODY = re.compile(r'[^"\\]*(?:\\.[^"\\]*)*')
+_STRUCTURE = re.compile(r'["\[\]{}]')
+_DECODER = json.JSONDecoder()
+# 合法 JSON 值之后可能出现的字符；数字被块边界截断时（如 "4."）raw_decode 会解析出前缀，据此识别
+_DELIMITERS = frozenset(" \t\n\r,:]}")
+
+
+class _Reader:
+    """在按块到达的文本上解析 JSON；已消费的部分在读入下一块时丢弃"""
+
+    def __init__(self, chunks: AsyncIterator[bytes]):
+        self._chunks = chunks.__aiter__()
+        self._decoder = codecs.getincrementaldecoder("utf-8")()
+        self.buffer = ""
+        self.pos = 0
+        self.eof = False
+
+    async def more(self):
+        if self.eof:
+            raise ValueError("transcript 响应不完整")
+        self.buffer = self.buffer[self.pos:]
+        self.pos = 0
+        try:
+            chunk = await self._chunks.__anext__()
+        except StopAsyncIteration:
+            self.eof = True
+            self.buffer += self._decoder.decode(b"", final=True)
+            return
+        self.buffer += self._decoder.decode(chunk)
+
+    async def peek(self) -> str:
+        """跳过空白，返回下一个字符（不消费）"""
+        while True:
+            self.pos = _WHITESPACE.match(self.buffer, self.pos).end()
+            if self.pos < len(self.buffer):
+                return self.buffer[self.pos]
+            await self.more()
+
+    async def expect(self, char: str):
+        found = await self.peek()
+        if found != char:
+            raise ValueError(f"transcript 响应格式错误: 位置 {self.pos} 期望 {char!r}，实际 {found!r}")
+        self.pos += 1
+
+    async def value(self) -> Any:
+        """解析下一个完整的 JSON 值"""
+        await self.peek()
+        while True:
+            try:
+                value, end = _DECODER.raw_decode(self.buffer, self.pos)
+            except json.JSONDecodeError:
+                await self.more()
+                continue
+            # 值结束在块末尾或后面不是分隔符时（被截断的数字）再读一块确认
+            if end == len(self.buffer) and not self.eof or end < len(self.buffer) and self.buffer[end] not in _DELIMITERS:
+                await self.more()
+                continue
+            self.pos = end
+            return value
+
+    def array_items(self, items: list) -> bool:
+        """
+        同步解析缓冲区中已完整到达的数组元素，追加到 items（位置在 '[' 之后）；
+        数组结束返回 True，需要读入更多数据返回 False。逐块而不是逐个元素切换协程，解析开销接近整体 json.loads
+        """
+        buffer, pos, size = self.buffer, self.pos, len(self.buffer)
+        whitespace, decode = _WHITESPACE.match, _DECODER.raw_decode
+        while pos < size:
+            char = buffer[pos]
+            if char in " \t\n\r":
+                pos = whitespace(buffer, pos).end()
+                continue
+            if char == "]":
+                self.pos = pos + 1
+                return True
+            if char == ",":
+                pos += 1
+                continue
+            try:
+                value, end = decode(buffer, pos)
+            except json.JSONDecodeError:
+                break
+            if end == size and not self.eof or end < size and buffer[end] not in _DELIMITERS:
+                break
+            items.append(value)
+            pos = end
+        self.pos = pos
+        return False
+
+    async def skip(self):
+        """跳过下一个 JSON 值，不保留其内容（用于完整文本等大字段）"""
+        char = await self.peek()
+        if char == '"':
+            await self._skip_string()
+            return
+        if char not in "[{":
+            await self.value()
+            return
+        depth = 0
+        while True:
+            match = _STRUCTURE.search(self.buffer, self.pos)
+            if match is None:
+                self.pos = len(self.buffer)
+                await self.more()
+                continue
+            self.pos = match.start()
+            if match.group() == '"':
+                await self._skip_string()
+                continue
+            self.pos += 1
+            depth += 1 if match.group() in "[{" else -1
+            if depth == 0:
+                return
+
+    async def _skip_string(self):
+        self.pos += 1
+        while True:
+            self.pos = _STRING_BODY.match(self.buffer, self.pos).end()
+            if self.pos < len(self.buffer) and self.buffer[self.pos] == '"':
+                self.pos += 1
+                return
+            await self.more()
+
+
+async def iter_tokens(chunks: AsyncIterator[bytes]) -> AsyncIterator[dict]:
+    """从 transcript 响应的字节流中逐个输出 tokens 数组的元素"""
+    reader = _Reader(chunks)
+    await reader.expect("{")
+    if await reader.peek() == "}":
+        return
+    while True:
+        key = await reader.value()
+        await reader.expect(":")
+        if key == "tokens":
+            await reader.expect("[")
+            while True:
+                items: list = []
+                finished = reader.array_items(items)
+                for item in items:
+                    yield item
+                if finished:
+                    break
+                await reader.more()
+        else:
+            await reader.skip()
+        if await reader.peek() != ",":
+            break
+        reader.pos += 1
+    await reader.expect("}")
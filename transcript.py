@@ -0,0 +1,312 @@
+"""
+文件转录结果的拼接与导出
+tokens 一次遍历拼接为文本（可选说话人标记）并把子词 token 合并为词；词按说话人、停顿、时长和句末标点
+分组为字幕段，导出 SRT / WebVTT / JSON Lines / 纯文本。各环节都是线性时间，导出按块生成，不拼接中间大字符串；
+拼接和分段都是增量的（WordMerger / Segmenter），stream_export 直接消费流式解析的 token，不保留完整结果
+"""
+
+import json
+import os
+import tempfile
+import unicodedata
+from functools import lru_cache
+from typing import AsyncIterator, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+# 单个字幕段的最长时长（秒）、最多字符数，词间停顿超过该秒数时另起一段
+SUBTITLE_MAX_SECONDS = float(os.getenv("SONIOX_SUBTITLE_MAX_SECONDS", "7"))
+SUBTITLE_MAX_CHARS = int(os.getenv("SONIOX_SUBTITLE_MAX_CHARS", "84"))
+SUBTITLE_MAX_GAP = float(os.getenv("SONIOX_SUBTITLE_MAX_GAP", "1.5"))
+# 流式输出 json 时拼接文本在内存中保留的上限，超过后转存临时文件
+TEXT_SPOOL_BYTES = 1024 * 1024
+
+# 导出格式及响应的 Content-Type；json 为默认的 TranscribeResponse 结构
+FORMATS: Dict[str, str] = {
+    "json": "application/json",
+    "srt": "application/x-subrip; charset=utf-8",
+    "vtt": "text/vtt; charset=utf-8",
+    "jsonl": "application/x-ndjson",
+    "text": "text/plain; charset=utf-8",
+}
+# 导出文件扩展名
+EXTENSIONS = {"json": "json", "srt": "srt", "vtt": "vtt", "jsonl": "jsonl", "text": "txt"}
+
+_SENTENCE_END = set(".!?。！？…")
+
+
+def _is_wide(char: str) -> bool:
+    """不以空格分词的文字（中日韩、泰文），每个字单独成词"""
+    code = ord(char)
+    return (
+        0x0E00 <= code <= 0x0E7F      # 泰文
+        or 0x3040 <= code <= 0x30FF   # 平假名、片假名
+        or 0x3400 <= code <= 0x4DBF   # CJK 扩展 A
+        or 0x4E00 <= code <= 0x9FFF   # CJK 统一汉字
+        or 0xAC00 <= code <= 0xD7AF   # 韩文音节
+        or 0xF900 <= code <= 0xFAFF   # CJK 兼容汉字
+        or 0x20000 <= code <= 0x2FFFF
+    )
+
+
+@lru_cache(maxsize=65536)
+def _shape(text: str) -> Tuple[bool, bool, bool]:
+    """token 文本的 (以空白开头, 全为标点, 首字逐字成词)；token 文本大量重复，按文本缓存"""
+    return (
+        text[0].isspace(),
+        bool(text.strip()) and all(unicodedata.category(char).startswith("P") for char in text.strip()),
+        _is_wide(text[0]),
+    )
+
+
+def _continues(word: str, text: str) -> bool:
+    """text 是否接在 word 后面属于同一个词：不以空白开头，且不是逐字成词的文字；标点总是并入前一个词"""
+    if not text:
+        return False
+    leading_space, punctuation, wide_first = _shape(text)
+    if leading_space:
+        return False
+    if punctuation:
+        return True
+    return not (wide_first or _is_wide(word[-1]))
+
+
+class WordMerger:
+    """
+    增量拼接：逐个输入 token，得到该 token 在文本中的形式和因此结束的词
+
+    词为 {"text", "start_time", "end_time"}，启用说话人分离时另有 "speaker"；子词 token 合并为一个词
+    （词的文本保留前导空格，依次拼接即还原文本），说话人变化时断开；没有时间戳的 token 只计入文本
+    """
+
+    def __init__(self, enable_diarization: bool):
+        self.enable_diarization = enable_diarization
+        self._word: Optional[dict] = None
+        self._speaker = None
+
+    def feed(self, token: dict) -> Tuple[str, Optional[dict]]:
+        """返回 (文本片段（说话人变化时带前缀）, 已结束的词或 None)"""
+        text = token.get("text", "")
+        speaker = token.get("speaker")
+        piece = text
+        done = None
+        if self.enable_diarization and "speaker" in token and speaker != self._speaker:
+            self._speaker = speaker
+            piece = f"\n\n说话人 {speaker}: {text}"
+            done, self._word = self._word, None
+
+        if "start_ms" not in token or "end_ms" not in token:
+            return piece, done
+        word = self._word
+        if word is not None and _continues(word["text"], text):
+            word["text"] += text
+            word["end_time"] = token["end_ms"] / 1000.0
+            return piece, done
+        self._word = {"text": text, "start_time": token["start_ms"] / 1000.0, "end_time": token["end_ms"] / 1000.0}
+        if self.enable_diarization and speaker is not None:
+            self._word["speaker"] = speaker
+        return piece, done or word
+
+    def finish(self) -> Optional[dict]:
+        """输入结束，返回最后一个词"""
+        word, self._word = self._word, None
+        return word
+
+
+class Segmenter:
+    """
+    词增量分组为字幕段 {"start", "end", "speaker", "text"}
+
+    说话人变化、停顿超过 SUBTITLE_MAX_GAP、超过 SUBTITLE_MAX_SECONDS / SUBTITLE_MAX_CHARS 时另起一段，
+    句末标点后结束当前段
+    """
+
+    def __init__(self):
+        self._parts: List[str] = []
+        self._start = self._end = 0.0
+        self._speaker = None
+        self._chars = 0
+
+    def feed(self, word: dict) -> List[dict]:
+        """输入一个词，返回因此结束的段（0 至 2 个）"""
+        done = []
+        text = word["text"]
+        if self._parts and (
+            word.get("speaker") != self._speaker
+            or word["start_time"] - self._end > SUBTITLE_MAX_GAP
+            or word["end_time"] - self._start > SUBTITLE_MAX_SECONDS
+            or self._chars + len(text) > SUBTITLE_MAX_CHARS
+        ):
+            done.append(self._flush())
+        if not self._parts:
+            self._start, self._speaker, self._chars = word["start_time"], word.get("speaker"), 0
+        self._parts.append(text)
+        self._chars += len(text)
+        self._end = word["end_time"]
+        stripped = text.rstrip()
+        if stripped and stripped[-1] in _SENTENCE_END:
+            done.append(self._flush())
+        return done
+
+    def finish(self) -> Optional[dict]:
+        return self._flush() if self._parts else None
+
+    def _flush(self) -> dict:
+        segment = {"start": self._start, "end": self._end, "speaker": self._speaker, "text": "".join(self._parts).strip()}
+        self._parts = []
+        return segment
+
+
+class _Stripper:
+    """流式输出文本时去掉首尾空白，与 build() 的 strip() 结果一致"""
+
+    def __init__(self):
+        self._started = False
+        self._pending = ""
+
+    def feed(self, piece: str) -> str:
+        if not self._started:
+            piece = piece.lstrip()
+            if not piece:
+                return ""
+            self._started = True
+        stripped = piece.rstrip()
+        if not stripped:
+            self._pending += piece
+            return ""
+        out = self._pending + stripped
+        self._pending = piece[len(stripped):]
+        return out
+
+
+def build(tokens: Iterable[dict], enable_diarization: bool) -> Tuple[str, List[dict]]:
+    """tokens 拼接为文本和词级时间戳，返回 (text, words)，词的结构见 WordMerger"""
+    merger = WordMerger(enable_diarization)
+    parts: List[str] = []
+    words: List[dict] = []
+    for token in tokens:
+        piece, word = merger.feed(token)
+        parts.append(piece)
+        if word is not None:
+            words.append(word)
+    word = merger.finish()
+    if word is not None:
+        words.append(word)
+    return "".join(parts).strip(), words
+
+
+def segments(words: Iterable[dict]) -> Iterator[dict]:
+    """词分组为字幕段，见 Segmenter"""
+    segmenter = Segmenter()
+    for word in words:
+        yield from segmenter.feed(word)
+    last = segmenter.finish()
+    if last is not None:
+        yield last
+
+
+def _timestamp(seconds: float, separator: str) -> str:
+    ms = max(0, int(round(seconds * 1000)))
+    hours, ms = divmod(ms, 3_600_000)
+    minutes, ms = divmod(ms, 60_000)
+    secs, ms = divmod(ms, 1000)
+    return f"{hours:02d}:{minutes:02d}:{secs:02d}{separator}{ms:03d}"
+
+
+def _render_segment(fmt: str, index: int, segment: dict) -> str:
+    speaker = segment["speaker"]
+    if fmt == "jsonl":
+        line = {"start": segment["start"], "end": segment["end"], "text": segment["text"]}
+        if speaker is not None:
+            line["speaker"] = speaker
+        return json.dumps(line, ensure_ascii=False) + "\n"
+    if fmt == "srt":
+        label = f"说话人 {speaker}: " if speaker is not None else ""
+        return (
+            f"{index}\n{_timestamp(segment['start'], ',')} --> {_timestamp(segment['end'], ',')}\n"
+            f"{label}{segment['text']}\n\n"
+        )
+    label = f"<v 说话人 {speaker}>" if speaker is not None else ""
+    return (
+        f"{_timestamp(segment['start'], '.')} --> {_timestamp(segment['end'], '.')}\n"
+        f"{label}{segment['text']}\n\n"
+    )
+
+
+def _check_export_format(fmt: str):
+    if fmt not in FORMATS or fmt == "json":
+        raise ValueError(f"未知的导出格式: {fmt}")
+
+
+def export(text: str, words: Iterable[dict], fmt: str) -> Iterator[str]:
+    """按格式逐块生成导出内容；text / words 为 build() 的结果（或 TranscribeResponse 中的同名字段）"""
+    _check_export_format(fmt)
+    if fmt == "text":
+        yield text + "\n"
+        return
+    if fmt == "vtt":
+        yield "WEBVTT\n\n"
+    for index, segment in enumerate(segments(words), 1):
+        yield _render_segment(fmt, index, segment)
+
+
+async def stream_export(
+    tokens: AsyncIterator[dict], fmt: str, enable_diarization: bool, summary: Callable[[], dict]
+) -> AsyncIterator[str]:
+    """
+    边接收 token 边逐块输出，内存占用与转录长度无关
+
+    json 输出与 TranscribeResponse 相同字段的 JSON 对象：words 先输出，text 边拼接边写入临时文件
+    （超过 TEXT_SPOOL_BYTES 转存磁盘），words 之后输出；summary() 在 tokens 读完后调用，返回其余字段
+    """
+    merger = WordMerger(enable_diarization)
+    stripper = _Stripper()
+
+    if fmt == "text":
+        async for token in tokens:
+            piece = stripper.feed(merger.feed(token)[0])
+            if piece:
+                yield piece
+        yield "\n"
+        return
+
+    if fmt == "json":
+        with tempfile.SpooledTemporaryFile(max_size=TEXT_SPOOL_BYTES, mode="w+", encoding="utf-8") as text_file:
+            yield '{"success":true,"words":['
+            separator = ""
+            async for token in tokens:
+                piece, word = merger.feed(token)
+                text_file.write(stripper.feed(piece))
+                if word is not None:
+                    yield separator + json.dumps(word, ensure_ascii=False, separators=(",", ":"))
+                    separator = ","
+            word = merger.finish()
+            if word is not None:
+                yield separator + json.dumps(word, ensure_ascii=False, separators=(",", ":"))
+            yield '],"text":"'
+            text_file.seek(0)
+            while True:
+                chunk = text_file.read(64 * 1024)
+                if not chunk:
+                    break
+                yield json.dumps(chunk, ensure_ascii=False)[1:-1]
+        rest = json.dumps(summary(), ensure_ascii=False, separators=(",", ":"))[1:-1]
+        yield f'",{rest}}}' if rest else '"}'
+        return
+
+    _check_export_format(fmt)
+    segmenter = Segmenter()
+    index = 0
+    if fmt == "vtt":
+        yield "WEBVTT\n\n"
+    async for token in tokens:
+        word = merger.feed(token)[1]
+        if word is None:
+            continue
+        for segment in segmenter.feed(word):
+            index += 1
+            yield _render_segment(fmt, index, segment)
+    word = merger.finish()
+    rest = segmenter.feed(word) if word is not None else []
+    last = segmenter.finish()
+    for segment in rest + ([last] if last is not None else []):
+        index += 1
+        yield _render_segment(fmt, index, segment)
@@ -0,0 +1,224 @@
+"""
+Soniox 上游 HTTP 客户端
+应用生命周期内共享一个带连接池的 httpx.AsyncClient，避免每个请求重新握手
+"""
+
+import asyncio
+import os
+import time
+import uuid
+from datetime import datetime, timezone
+from typing import AsyncIterator, List, Optional, Tuple
+
+import httpx
+from loguru import logger
+
+import metrics
+
+
+def _env_bool(name: str, default: bool) -> bool:
+    value = os.getenv(name)
+    if value is None:
+        return default
+    return value.strip().lower() not in ("0", "false", "no", "off", "")
+
+
+# Soniox REST API 基础 URL（可指向本地桩服务做压测）
+SONIOX_API_BASE = os.getenv("SONIOX_API_BASE", "https://api.soniox.com/v1").rstrip("/")
+
+# 连接池配置
+HTTP2_ENABLED = _env_bool("SONIOX_HTTP2", True)
+MAX_CONNECTIONS = int(os.getenv("SONIOX_MAX_CONNECTIONS", "100"))
+MAX_KEEPALIVE_CONNECTIONS = int(os.getenv("SONIOX_MAX_KEEPALIVE", "20"))
+KEEPALIVE_EXPIRY = float(os.getenv("SONIOX_KEEPALIVE_EXPIRY", "60"))
+
+# 按操作区分超时：上传大文件很慢，其它请求 30 秒足够
+CONNECT_TIMEOUT = float(os.getenv("SONIOX_CONNECT_TIMEOUT", "30"))
+UPLOAD_TIMEOUT = httpx.Timeout(float(os.getenv("SONIOX_UPLOAD_TIMEOUT", "600")), connect=CONNECT_TIMEOUT)
+DEFAULT_TIMEOUT = httpx.Timeout(float(os.getenv("SONIOX_TIMEOUT", "30")), connect=CONNECT_TIMEOUT)
+
+# 流式上传每次读取的块大小（字节），决定单个上传请求的内存占用
+UPLOAD_CHUNK_SIZE = int(os.getenv("SONIOX_UPLOAD_CHUNK_SIZE", str(256 * 1024)))
+
+_client: Optional[httpx.AsyncClient] = None
+
+
+def _http2_available() -> bool:
+    try:
+        import h2  # noqa: F401
+        return True
+    except ImportError:
+        return False
+
+
+def create_client() -> httpx.AsyncClient:
+    """按当前配置创建上游客户端"""
+    http2 = HTTP2_ENABLED and _http2_available()
+    if HTTP2_ENABLED and not http2:
+        logger.warning("未安装 h2，上游客户端使用 HTTP/1.1")
+    logger.info(
+        f"上游客户端已创建 | {SONIOX_API_BASE} | HTTP/2: {http2} "
+        f"| 连接池: {MAX_CONNECTIONS}/{MAX_KEEPALIVE_CONNECTIONS} | keep-alive: {KEEPALIVE_EXPIRY}s"
+    )
+
+    transport = httpx.AsyncHTTPTransport(
+        http2=http2,
+        limits=httpx.Limits(
+            max_connections=MAX_CONNECTIONS,
+            max_keepalive_connections=MAX_KEEPALIVE_CONNECTIONS,
+            keepalive_expiry=KEEPALIVE_EXPIRY,
+        ),
+    )
+    return httpx.AsyncClient(
+        base_url=SONIOX_API_BASE,
+        transport=_MetricsTransport(transport),
+        timeout=DEFAULT_TIMEOUT,
+    )
+
+
+class _MetricsTransport(httpx.AsyncBaseTransport):
+    """记录每个上游请求的耗时（到收到响应头），按方法、接口、状态码分组"""
+
+    def __init__(self, transport: httpx.AsyncBaseTransport):
+        self._transport = transport
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        start = time.perf_counter()
+        status = "error"
+        try:
+            response = await self._transport.handle_async_request(request)
+            status = str(response.status_code)
+            return response
+        finally:
+            metrics.UPSTREAM_REQUEST_SECONDS.observe(
+                time.perf_counter() - start,
+                method=request.method,
+                endpoint=metrics.endpoint_label(request.url.path),
+                status=status,
+            )
+
+    async def aclose(self):
+        await self._transport.aclose()
+
+
+async def start():
+    """应用启动时创建共享客户端"""
+    global _client
+    if _client is None:
+        _client = create_client()
+
+
+async def stop():
+    """应用关闭时释放连接池"""
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
+        logger.info("上游客户端已关闭")
+
+
+def get_client() -> httpx.AsyncClient:
+    """获取共享客户端（未经 lifespan 启动时按需创建）"""
+    global _client
+    if _client is None:
+        _client = create_client()
+    return _client
+
+
+def auth_headers(api_key: str) -> dict:
+    return {"Authorization": f"Bearer {api_key}"}
+
+
+async def _get_page(api_key: str, path: str, params: dict) -> dict:
+    resp = await get_client().get(path, headers=auth_headers(api_key), params=params)
+    resp.raise_for_status()
+    return resp.json()
+
+
+async def iter_pages(api_key: str, path: str, field: str, page_size: int = 1000) -> AsyncIterator[List[dict]]:
+    """
+    按 next_page_cursor 逐页读取列表接口（/files → files，/transcriptions → transcriptions），产出每页条目
+
+    游标链只能串行请求，但拿到游标后立即预取下一页，与调用方处理当前页重叠。
+    非 200 响应抛出 httpx.HTTPStatusError
+    """
+    pending = asyncio.ensure_future(_get_page(api_key, path, {"limit": page_size}))
+    try:
+        while pending is not None:
+            page = await pending
+            cursor = page.get("next_page_cursor")
+            pending = None
+            if cursor:
+                pending = asyncio.ensure_future(_get_page(api_key, path, {"limit": page_size, "cursor": cursor}))
+            yield page.get(field, [])
+    finally:
+        if pending is not None:
+            pending.cancel()
+            if pending.done() and not pending.cancelled():
+                pending.exception()  # 调用方提前结束时，预取结果的异常不再需要
+
+
+def parse_time(value: Optional[str]) -> Optional[datetime]:
+    """解析 Soniox 的 created_at（ISO 8601，Z 结尾），无法解析时返回 None"""
+    if not value:
+        return None
+    try:
+        parsed = datetime.fromisoformat(value.replace("Z", "+00:00"))
+    except ValueError:
+        return None
+    return parsed if parsed.tzinfo else parsed.replace(tzinfo=timezone.utc)
+
+
+def multipart_file_body(
+    reader,
+    filename: str,
+    content_type: str,
+    size: Optional[int] = None,
+    field: str = "file",
+) -> Tuple[dict, AsyncIterator[bytes]]:
+    """
+    把异步可读对象（如 UploadFile）包装为流式 multipart/form-data 请求体
+
+    返回 (headers, body)；已知 size 时带 Content-Length，否则使用分块传输
+    """
+    boundary = uuid.uuid4().hex
+    safe_name = (filename or "audio").replace("\\", "\\\\").replace('"', "%22").replace("\r", "%0D").replace("\n", "%0A")
+    head = (
+        f"--{boundary}\r\n"
+        f'Content-Disposition: form-data; name="{field}"; filename="{safe_name}"\r\n'
+        f"Content-Type: {content_type}\r\n\r\n"
+    ).encode("utf-8")
+    tail = f"\r\n--{boundary}--\r\n".encode("ascii")
+
+    headers = {"Content-Type": f"multipart/form-data; boundary={boundary}"}
+    if size is not None:
+        headers["Content-Length"] = str(len(head) + size + len(tail))
+
+    async def body() -> AsyncIterator[bytes]:
+        yield head
+        while True:
+            chunk = await reader.read(UPLOAD_CHUNK_SIZE)
+            if not chunk:
+                break
+            yield chunk
+        yield tail
+
+    return headers, body()
+
+
+class AsyncFileReader:
+    """本地文件的异步读取包装（在线程池中读盘），与 UploadFile 的 read/seek 接口一致"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.size = os.path.getsize(path)
+        self.file = open(path, "rb")
+
+    async def read(self, size: int = -1) -> bytes:
+        return await asyncio.to_thread(self.file.read, size)
+
+    async def seek(self, offset: int):
+        await asyncio.to_thread(self.file.seek, offset)
+
+    async def close(self):
+        self.file.close()
@@ -0,0 +1,200 @@
+"""
+转录完成监视器
+每个 API Key 一个后台任务，统一轮询该 Key 下所有进行中的转录：
+待查任务较多时用 GET /transcriptions 列表分页一次取回全部状态，否则并发查询单个任务
+"""
+
+import asyncio
+import os
+import time
+from typing import Dict, List, Optional
+
+from fastapi import HTTPException
+from loguru import logger
+
+import upstream
+from polling import PollSchedule
+
+# 同一轮内到期时间相差不超过该秒数的任务合并查询
+WATCHER_COALESCE = float(os.getenv("SONIOX_WATCHER_COALESCE", "0.5"))
+# 到期任务数达到该值时改用列表接口批量查询
+WATCHER_LIST_MIN_JOBS = int(os.getenv("SONIOX_WATCHER_LIST_MIN_JOBS", "3"))
+WATCHER_LIST_PAGE_SIZE = int(os.getenv("SONIOX_WATCHER_LIST_PAGE_SIZE", "1000"))
+WATCHER_LIST_MAX_PAGES = int(os.getenv("SONIOX_WATCHER_LIST_MAX_PAGES", "3"))
+
+
+class _PendingJob:
+    def __init__(self, transcription_id: str, schedule: PollSchedule, future: asyncio.Future):
+        self.transcription_id = transcription_id
+        self.schedule = schedule
+        self.future = future
+        self.next_due = time.monotonic() + schedule.next_delay()
+
+
+class CompletionWatcher:
+    """单个 API Key 的转录完成监视器"""
+
+    def __init__(self, api_key: str):
+        self.api_key = api_key
+        self.headers = upstream.auth_headers(api_key)
+        self.requests = 0
+        self._jobs: Dict[str, _PendingJob] = {}
+        self._wakeup = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def pending(self) -> int:
+        return len(self._jobs)
+
+    async def wait(self, transcription_id: str, audio_duration_ms: Optional[int] = None) -> dict:
+        """登记转录任务并等待其完成，返回最终状态；失败或超时抛出 HTTPException"""
+        future = asyncio.get_running_loop().create_future()
+        self._jobs[transcription_id] = _PendingJob(transcription_id, PollSchedule(audio_duration_ms), future)
+        self._wakeup.set()
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+        try:
+            return await future
+        finally:
+            job = self._jobs.get(transcription_id)
+            if job is not None and job.future is future:
+                del self._jobs[transcription_id]
+
+    async def close(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+        for job in self._jobs.values():
+            if not job.future.done():
+                job.future.cancel()
+        self._jobs.clear()
+
+    async def _run(self):
+        while self._jobs:
+            now = time.monotonic()
+            wake_at = min(job.next_due for job in self._jobs.values())
+            if wake_at > now:
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=wake_at - now)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            due = [job for job in self._jobs.values() if job.next_due <= now + WATCHER_COALESCE]
+            due_ids = {job.transcription_id for job in due}
+            try:
+                statuses = await self._fetch_statuses(due)
+            except Exception as e:
+                # 网络抖动：下一轮重试，不让单次失败打断所有等待者
+                logger.warning(f"监视器查询失败: {type(e).__name__}: {e}")
+                statuses = {}
+
+            for job in list(self._jobs.values()):
+                data = statuses.get(job.transcription_id)
+                if data is not None:
+                    job.schedule.update(data.get("audio_duration_ms"))
+                    self._resolve(job, data)
+                if job.future.done():
+                    self._jobs.pop(job.transcription_id, None)
+                elif job.transcription_id in due_ids:
+                    if job.schedule.expired:
+                        job.future.set_exception(HTTPException(
+                            status_code=504, detail=f"等待转录超时（{job.schedule.deadline:.0f}秒）"
+                        ))
+                        self._jobs.pop(job.transcription_id, None)
+                    else:
+                        job.next_due = time.monotonic() + job.schedule.next_delay()
+
+        if _watchers.get(self.api_key) is self:
+            del _watchers[self.api_key]
+
+    def _resolve(self, job: _PendingJob, data: dict):
+        if job.future.done():
+            return
+        status = data.get("status")
+        if status == "completed":
+            job.future.set_result(data)
+        elif status == "error":
+            error_msg = data.get("error_message", "未知错误")
+            job.future.set_exception(HTTPException(status_code=500, detail=f"转录失败: {error_msg}"))
+
+    async def _fetch_statuses(self, due: List[_PendingJob]) -> Dict[str, dict]:
+        statuses: Dict[str, dict] = {}
+        if len(due) >= WATCHER_LIST_MIN_JOBS:
+            statuses = await self._list_statuses()
+
+        # 列表里找不到的、出错需要 error_message 的任务逐个查询
+        missing = [
+            job for job in due
+            if job.transcription_id not in statuses or statuses[job.transcription_id].get("status") == "error"
+        ]
+        if missing:
+            results = await asyncio.gather(*(self._get_status(job) for job in missing))
+            for job, data in zip(missing, results):
+                if data is not None:
+                    statuses[job.transcription_id] = data
+        return statuses
+
+    async def _list_statuses(self) -> Dict[str, dict]:
+        wanted = set(self._jobs)
+        statuses: Dict[str, dict] = {}
+        cursor = None
+        client = upstream.get_client()
+        for _ in range(WATCHER_LIST_MAX_PAGES):
+            params = {"limit": WATCHER_LIST_PAGE_SIZE}
+            if cursor:
+                params["cursor"] = cursor
+            self.requests += 1
+            resp = await client.get("/transcriptions", headers=self.headers, params=params)
+            if resp.status_code != 200:
+                logger.warning(f"列表查询失败: {resp.status_code}")
+                break
+            page = resp.json()
+            for item in page.get("transcriptions", []):
+                if item.get("id") in wanted:
+                    statuses[item["id"]] = item
+            cursor = page.get("next_page_cursor")
+            if not cursor or wanted.issubset(statuses):
+                break
+        return statuses
+
+    async def _get_status(self, job: _PendingJob) -> Optional[dict]:
+        self.requests += 1
+        resp = await upstream.get_client().get(f"/transcriptions/{job.transcription_id}", headers=self.headers)
+        if resp.status_code != 200:
+            logger.error(f"获取状态失败: {resp.status_code}")
+            if not job.future.done():
+                job.future.set_exception(HTTPException(status_code=resp.status_code, detail="获取状态失败"))
+            return None
+        return resp.json()
+
+
+_watchers: Dict[str, CompletionWatcher] = {}
+
+
+def get_watcher(api_key: str) -> CompletionWatcher:
+    """获取（或创建）该 API Key 的监视器"""
+    watcher = _watchers.get(api_key)
+    if watcher is None:
+        watcher = _watchers[api_key] = CompletionWatcher(api_key)
+    return watcher
+
+
+async def wait_for_completion(api_key: str, transcription_id: str, audio_duration_ms: Optional[int] = None) -> dict:
+    return await get_watcher(api_key).wait(transcription_id, audio_duration_ms)
+
+
+def pending() -> int:
+    """所有监视器中等待完成的转录数"""
+    return sum(w.pending for w in _watchers.values())
+
+
+async def shutdown():
+    """应用关闭时取消所有监视器"""
+    for watcher in list(_watchers.values()):
+        await watcher.close()
+    _watchers.clear()
@@ -0,0 +1,327 @@
+"""
+WebSocket 实时转录转发
+客户端 → Soniox（音频）和 Soniox → 客户端（响应）两个方向各经过一个按字节计量的有界缓冲区：
+缓冲超过高水位时停止读取发送方（由 TCP 把背压传回去），消费到低水位以下再恢复；
+任一方向出错时取消其余任务，两端连接由调用方关闭。单个会话的内存占用与会话时长无关
+"""
+
+import asyncio
+import json
+import os
+from collections import deque
+from typing import Awaitable, Callable, Deque, List, Optional, Tuple, Union
+
+import websockets
+from fastapi import WebSocket, WebSocketDisconnect
+from loguru import logger
+
+import metrics
+from assembler import TranscriptAssembler
+
+# Soniox 实时转录 WebSocket 地址（可指向本地桩服务做压测）
+SONIOX_WS_URL = os.getenv("SONIOX_WS_URL", "wss://stt-rt.soniox.com/transcribe-websocket")
+# 上游心跳：间隔 / 超时（秒），0 表示关闭
+WS_PING_INTERVAL = float(os.getenv("SONIOX_WS_PING_INTERVAL", "20"))
+WS_PING_TIMEOUT = float(os.getenv("SONIOX_WS_PING_TIMEOUT", "20"))
+# websockets 库内部接收队列（消息数），超出后停止读取上游 socket
+WS_UPSTREAM_MAX_QUEUE = int(os.getenv("SONIOX_WS_UPSTREAM_MAX_QUEUE", "16"))
+# 连接上游失败（网络、TLS、握手）时的尝试次数；Key 在连接之后的配置帧中才发送，连接失败与 Key 无关
+WS_CONNECT_ATTEMPTS = max(1, int(os.getenv("SONIOX_WS_CONNECT_ATTEMPTS", "3")))
+WS_CONNECT_RETRY_DELAY = 0.5
+# 提供多个 Key 时，上游首条响应之前已发送的音频最多保留的字节数：首条响应是错误（Key 无效、额度用尽、限流）时
+# 换下一个 Key 重连并重放；超过该值后不再保留，也不再换 Key
+WS_FAILOVER_BUFFER_BYTES = int(os.getenv("SONIOX_WS_FAILOVER_BUFFER_BYTES", str(1024 * 1024)))
+
+# 音频缓冲（客户端 → Soniox）高/低水位，字节
+WS_AUDIO_HIGH_WATERMARK = int(os.getenv("SONIOX_WS_AUDIO_HIGH_WATERMARK", str(1024 * 1024)))
+WS_AUDIO_LOW_WATERMARK = int(os.getenv("SONIOX_WS_AUDIO_LOW_WATERMARK", str(256 * 1024)))
+# 响应缓冲（Soniox → 客户端）高/低水位，字节
+WS_RESPONSE_HIGH_WATERMARK = int(os.getenv("SONIOX_WS_RESPONSE_HIGH_WATERMARK", str(1024 * 1024)))
+WS_RESPONSE_LOW_WATERMARK = int(os.getenv("SONIOX_WS_RESPONSE_LOW_WATERMARK", str(256 * 1024)))
+# 客户端发送音频快于上游消费（如按文件速度推送）、音频缓冲到达高水位时：
+#   block - 暂停读取客户端，客户端发送被 TCP 背压限速到上游的速度
+#   close - 返回错误并以 1013 (Try Again Later) 关闭会话
+WS_OVERFLOW_POLICY = os.getenv("SONIOX_WS_OVERFLOW_POLICY", "block").strip().lower()
+# 默认是否在服务端拼接转录、只向客户端发送增量（客户端可在配置消息中用 server_assembly 覆盖）
+WS_SERVER_ASSEMBLY = os.getenv("SONIOX_WS_SERVER_ASSEMBLY", "0").strip().lower() in ("1", "true", "yes", "on")
+
+
+try:
+    import orjson
+    _loads = orjson.loads
+except ImportError:
+    _loads = json.loads
+
+# 只有结束消息（"finished"）和错误消息（"error_code"）需要解析；
+# 普通 token 消息占绝大多数，先做子串扫描，不含这两个键名的直接转发
+_MARKERS = ('"finished"', '"error_code"')
+_MARKERS_BYTES = tuple(m.encode() for m in _MARKERS)
+
+
+def inspect_response(message: Union[str, bytes]) -> Tuple[bool, Optional[int]]:
+    """返回 (是否结束, 错误码)；只有包含标记键名的候选消息才做 JSON 解析"""
+    markers = _MARKERS_BYTES if isinstance(message, bytes) else _MARKERS
+    if not any(marker in message for marker in markers):
+        return False, None
+    response = _loads(message)
+    return bool(response.get("finished")), response.get("error_code") or None
+
+
+class RelayOverflow(Exception):
+    """overflow 策略为 close 时，客户端发送速度超出上游处理能力"""
+
+
+async def connect_upstream():
+    """连接 Soniox 实时转录 WebSocket；连接失败按 WS_CONNECT_ATTEMPTS 重试，间隔翻倍"""
+    for attempt in range(WS_CONNECT_ATTEMPTS):
+        try:
+            return await websockets.connect(
+                SONIOX_WS_URL,
+                ping_interval=WS_PING_INTERVAL or None,
+                ping_timeout=WS_PING_TIMEOUT or None,
+                max_queue=WS_UPSTREAM_MAX_QUEUE,
+                # 音频几乎不可压缩，关闭 permessage-deflate 省掉每个连接的 zlib 缓冲和 CPU
+                compression=None,
+                close_timeout=30
+            )
+        except (OSError, asyncio.TimeoutError, websockets.exceptions.WebSocketException) as e:
+            if attempt + 1 >= WS_CONNECT_ATTEMPTS:
+                raise
+            delay = WS_CONNECT_RETRY_DELAY * (2 ** attempt)
+            logger.warning(f"连接 Soniox 失败 ({type(e).__name__}: {e})，{delay:.1f}秒后重试")
+            await asyncio.sleep(delay)
+
+
+
+class FlowBuffer:
+    """按字节计量的有界 FIFO：put 在超过高水位后阻塞，直到消费方把缓冲降到低水位"""
+
+    def __init__(self, direction: str, high: int, low: int):
+        self.direction = direction
+        self.high = high
+        self.low = min(low, high)
+        self.size = 0
+        self.pauses = 0
+        self._items: Deque[Tuple[object, int]] = deque()
+        self._readable = asyncio.Event()
+        self._writable = asyncio.Event()
+        self._writable.set()
+
+    @property
+    def paused(self) -> bool:
+        return not self._writable.is_set()
+
+    async def put(self, item, size: int):
+        await self._writable.wait()
+        self._items.append((item, size))
+        self.size += size
+        self._readable.set()
+        if self.size >= self.high:
+            self._writable.clear()
+            self.pauses += 1
+            metrics.WS_BACKPRESSURE.inc(direction=self.direction)
+
+    def put_nowait(self, item, size: int = 0):
+        """不受水位限制地放入（结束标记用：发送方已暂停、缓冲在高水位以上时也不阻塞）"""
+        self._items.append((item, size))
+        self.size += size
+        self._readable.set()
+
+    async def get(self):
+        while not self._items:
+            self._readable.clear()
+            await self._readable.wait()
+        item, size = self._items.popleft()
+        self.size -= size
+        if self.paused and self.size <= self.low:
+            self._writable.set()
+        return item
+
+
+class Relay:
+    """
+    一个实时转录会话的双向转发
+
+    四个任务：读客户端 → 音频缓冲 → 写 Soniox；读 Soniox → 响应缓冲 → 写客户端。
+    on_response(message) 返回 True 表示转录结束（收到 finished）；
+    传入 assembler 时不转发原始响应，改为发送拼接增量，结束时发送完整转录；
+    传入 failover 时，上游首条响应之前已发送的音频保留在重放缓冲中：首条响应是错误时调用 failover(error_code)
+    换 Key 建立新连接（已发送配置帧），重放音频后继续转发；failover 返回 None 表示不换 Key，错误照常转发给客户端
+    """
+
+    def __init__(
+        self,
+        client: WebSocket,
+        upstream,
+        on_response: Callable[[str], bool],
+        overflow_policy: str = WS_OVERFLOW_POLICY,
+        assembler: Optional[TranscriptAssembler] = None,
+        failover: Optional[Callable[[int], Awaitable[Optional[object]]]] = None
+    ):
+        self.client = client
+        self.failover = failover
+        # 上游确认 Key（首条非错误响应）之前已发送的音频；None 表示不再保留（已确认、超出上限或没有 failover）
+        self._replay: Optional[List[bytes]] = [] if failover else None
+        self._replay_bytes = 0
+        # 发送音频与换连接互斥：换连接期间的音频等新连接重放完成后再发送
+        self._upstream_lock = asyncio.Lock()
+        self._reconnected = asyncio.Event()
+        self.failovers = 0
+        self.upstream = upstream
+        self.on_response = on_response
+        self.assembler = assembler
+        self.overflow_policy = overflow_policy
+        self.audio = FlowBuffer("audio", WS_AUDIO_HIGH_WATERMARK, WS_AUDIO_LOW_WATERMARK)
+        self.responses = FlowBuffer("response", WS_RESPONSE_HIGH_WATERMARK, WS_RESPONSE_LOW_WATERMARK)
+        self.audio_chunks = 0
+        self.response_count = 0
+        self.client_gone = False
+
+    async def run(self):
+        """转发直到响应全部送达客户端；任一任务出错时取消其余任务并抛出该异常"""
+        client_writer = asyncio.create_task(self._write_client())
+        tasks = {
+            asyncio.create_task(self._read_client()),
+            asyncio.create_task(self._write_upstream()),
+            asyncio.create_task(self._read_upstream()),
+            client_writer,
+        }
+        pending = tasks
+        try:
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is not None:
+                        raise task.exception()
+                # 响应已全部送达（或客户端已断开）：客户端可能没发结束信号，不再等待音频方向
+                if client_writer in done:
+                    break
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+    async def _read_client(self):
+        try:
+            while True:
+                data = await self.client.receive_bytes()
+                if len(data) == 0:
+                    logger.info("收到结束信号")
+                    break
+                if self.audio.paused and self.overflow_policy == "close":
+                    raise RelayOverflow("音频发送速度超过上游处理速度")
+                await self.audio.put(data, len(data))
+        except WebSocketDisconnect:
+            logger.info("客户端断开连接")
+            self.client_gone = True
+        # None 表示音频结束：通知 Soniox 完成剩余音频的识别
+        self.audio.put_nowait(None)
+
+    async def _write_upstream(self):
+        while True:
+            data = await self.audio.get()
+            # None 表示音频结束，向 Soniox 发送空帧
+            chunk = b"" if data is None else data
+            async with self._upstream_lock:
+                replaying = self._replay is not None
+                rejected = False
+                try:
+                    await self.upstream.send(chunk)
+                except websockets.exceptions.ConnectionClosed:
+                    if not replaying:
+                        raise
+                    # Key 被拒后上游已关闭：音频留在重放缓冲，等读取方换 Key 重连后一并重放
+                    rejected = True
+                    self._reconnected.clear()
+                if replaying:
+                    self._remember(chunk)
+            if rejected:
+                await self._reconnected.wait()
+            if data is None:
+                return
+            self.audio_chunks += 1
+            metrics.WS_AUDIO_CHUNKS.inc()
+            if self.audio_chunks % 100 == 0:
+                logger.debug(f"已转发 {self.audio_chunks} 个音频块")
+
+    def _remember(self, chunk: bytes):
+        if self._replay is None:
+            return
+        self._replay.append(chunk)
+        self._replay_bytes += len(chunk)
+        if self._replay_bytes > WS_FAILOVER_BUFFER_BYTES:
+            logger.debug("Soniox 尚未响应，重放缓冲已满，不再换 Key")
+            self._replay = None
+
+    async def _read_upstream(self):
+        try:
+            reconnected = True
+            while reconnected:
+                reconnected = False
+                async for message in self.upstream:
+                    if self._replay is not None:
+                        error_code = inspect_response(message)[1]
+                        if error_code and await self._fail_over(error_code):
+                            reconnected = True
+                            break
+                        if not error_code:
+                            # 首条正常响应：Key 已被接受，之后不再保留音频
+                            self._replay = None
+                    if await self._forward(message):
+                        return
+        finally:
+            # 客户端暂停读取（缓冲在高水位以上）时也要能放入结束标记，否则会话无法结束
+            self.responses.put_nowait(None)
+
+    async def _fail_over(self, error_code: int) -> bool:
+        """当前 Key 被拒：换 Key 重连并重放已发送的音频；不换 Key 时返回 False"""
+        async with self._upstream_lock:
+            if self._replay is None:
+                return False
+            upstream = await self.failover(error_code)
+            if upstream is None:
+                self._replay = None
+                return False
+            for chunk in self._replay:
+                await upstream.send(chunk)
+            self.upstream = upstream
+            self.failovers += 1
+            self._reconnected.set()
+        return True
+
+    async def _forward(self, message: Union[str, bytes]) -> bool:
+        """一条上游响应放入响应缓冲，返回是否为结束消息"""
+        finished = self.on_response(message)
+        if self.assembler is None:
+            await self.responses.put(message, len(message))
+        else:
+            await self._put_assembled(message, finished)
+        return finished
+
+    async def _put_assembled(self, message: Union[str, bytes], finished: bool):
+        response = _loads(message)
+        if response.get("error_code"):
+            await self.responses.put(message, len(message))
+            return
+        for data in (self.assembler.feed(response), self.assembler.summary() if finished else None):
+            if data is not None:
+                text = json.dumps(data, ensure_ascii=False)
+                await self.responses.put(text, len(text))
+
+    async def _write_client(self):
+        while True:
+            message = await self.responses.get()
+            if message is None:
+                return
+            if self.client_gone:
+                continue
+            self.response_count += 1
+            metrics.WS_RESPONSES.inc()
+            if self.response_count <= 3:
+                logger.debug(f"响应 {self.response_count}: {message[:200]}...")
+            elif self.response_count % 10 == 0:
+                logger.debug(f"已转发 {self.response_count} 个响应")
+            if isinstance(message, bytes):
+                await self.client.send_bytes(message)
+            else:
+                await self.client.send_text(message)